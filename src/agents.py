@@ -0,0 +1,285 @@
+# -*- coding:utf-8 -*-
+# This file holds the batched player simulator, which runs hundreds of independent astronauts in one level at once.
+# It is meant for AI training and ghost races, not for the game itself, and it is the only file that needs NumPy.
+# Every astronaut moves like ``sprites.Player``, sweeping its collision circle along its path and bouncing at
+# the moment of impact, but all of them are updated together with array math instead of one object at a time.
+# The player's mask tests are left out: turning is never blocked by an asteroid, and the extra bounce off
+# the parts of the image that stick out of the circle doesn't happen.
+
+# Standard library imports.
+from typing import Sequence, Optional
+
+# Third-party library imports.
+import numpy as np
+
+# Local library imports.
+import sprites
+
+# Constants.
+# The outward normal of each game edge, in the order ``sprites.Player.sweep`` checks them.
+WALL_NORMALS = np.array(((1.0, 0.0), (-1.0, 0.0), (0.0, 1.0), (0.0, -1.0)))
+PLAYER_GRAVITY_ACC = 45  # The simple asteroid pull used by ``sprites.Player``, in pixels per second.
+PLAYER_GRAVITY_RANGE = (150, 300)  # The pull only works between these distances from an asteroid's center.
+TELEPORTER_RANGE = 37  # How close an astronaut must get to a teleporter to use it.
+
+# Rewards.
+FUEL_REWARD = 1.0  # For picking up a fuel item.
+EXIT_REWARD = 10.0  # For reaching the exit portal.
+HIT_PENALTY = 0.1  # For crashing into an asteroid.
+TIME_PENALTY = 0.01  # For each second that passes, so faster is better.
+
+OBSERVATION_SIZE = 12  # The number of values in each astronaut's observation.
+
+
+class BatchedPlayers:
+    """Simulates many independent astronauts in the same level using NumPy arrays.
+
+    Each astronaut has its own position, velocity, angle, pushing state, and tank level. They don't see
+    or touch each other, but they share the level: the asteroids, items, and teleporters.
+    Each astronaut picks up its own copy of every item.
+    With the player's image left out, a single astronaut moves exactly like ``sprites.Player``.
+    """
+    def __init__(self, count: int, start_pos: Sequence[float], game_bounds: Sequence[float],
+                 obstacles: Sequence[sprites.Obstacle], items: Sequence[sprites.Item | sprites.Teleporter],
+                 seed: Optional[int] = None):
+        self.count = count
+        self.start_pos = np.array(start_pos, dtype=float)
+        self.game_bounds = np.array(game_bounds, dtype=float)
+        self.rng = np.random.default_rng(seed)
+
+        # The level data.
+        self.obstacles = list(obstacles)
+        self.obstacle_pos = np.zeros((len(self.obstacles), 2))
+        self.obstacle_radius = np.array([obstacle.radius for obstacle in self.obstacles], dtype=float)
+        self.sync_obstacles()
+        fuel = [item for item in items if item.type is sprites.ItemType.FUEL]
+        self.fuel_pos = np.array([item.pos for item in fuel], dtype=float).reshape(-1, 2)
+        exits = [item for item in items if item.type is sprites.ItemType.EXIT]
+        self.exit_pos = np.array(exits[0].pos if exits else self.game_bounds / 2, dtype=float)
+        teleporters = [item for item in items if item.type is sprites.ItemType.TELEPORTER]
+        self.teleporter_pos = np.array([teleporter.pos for teleporter in teleporters], dtype=float).reshape(-1, 2)
+        # The index of the teleporter each teleporter sends you to, or -1 if it isn't linked.
+        self.teleporter_link = np.array([teleporters.index(teleporter.linked_teleporter)
+                                         if teleporter.linked_teleporter in teleporters else -1
+                                         for teleporter in teleporters], dtype=int)
+
+        self.reset()
+
+    def reset(self, jitter: float = 0):
+        """Put every astronaut back at the start, optionally spread out by up to ``jitter`` pixels."""
+        n = self.count
+        self.pos = np.tile(self.start_pos, (n, 1)) + self.rng.uniform(-jitter, jitter, (n, 2))
+        self.vel = np.zeros((n, 2))
+        self.angle = np.zeros(n)
+        self.pushing = np.zeros(n, dtype=bool)
+        self.tank = np.full(n, float(sprites.TANK_MAX))
+        self.fuel_taken = np.zeros((n, len(self.fuel_pos)), dtype=bool)
+        self.teleporter_cooldown = np.zeros((n, len(self.teleporter_pos)))
+        self.done = np.zeros(n, dtype=bool)  # Astronauts that reached the exit stop moving.
+        self.time = 0.0
+        return self.observe()
+
+    def sync_obstacles(self):
+        """Copy the asteroid positions from the level. Call this every step if the asteroids move."""
+        for row, obstacle in enumerate(self.obstacles):
+            self.obstacle_pos[row] = obstacle.pos
+
+    def step(self, rotate: np.ndarray, push: np.ndarray, dt: float,
+             gravity: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Move every astronaut forward by ``dt`` seconds and return ``(observations, rewards, done)``.
+
+        ``rotate`` holds a value from -1 to 1 per astronaut, the fraction of full rotation speed to turn at.
+        ``push`` holds a bool per astronaut, whether the extinguisher is active.
+        When the asteroids are simulated with real gravity, pass in their pull on each astronaut as ``gravity``,
+        with shape ``(count, 2)``, and call ``sync_obstacles`` first. The simple pull is skipped then, like
+        ``sprites.Player``.
+        """
+        active = ~self.done
+        rewards = np.where(active, -TIME_PENALTY * dt, 0.0)
+        if gravity is not None:
+            self.vel += gravity * (dt * active[:, None])
+
+        # Turning and thrust.
+        self.angle = np.where(active, (self.angle + np.clip(rotate, -1, 1) * sprites.PLAYER_ROTATE_SPEED * dt) % 360,
+                              self.angle)
+        self.pushing = np.asarray(push, dtype=bool) & (self.tank > 0) & active
+        self.tank = np.maximum(self.tank - self.pushing * sprites.TANK_DECREASE * dt, 0)
+        radians = np.radians(self.angle)
+        # The extinguisher pushes the astronaut backwards, like ``sprites.Player``.
+        thrust = -sprites.PLAYER_PUSH_ACC * np.stack((np.cos(radians), np.sin(radians)), axis=1)
+        self.vel += thrust * self.pushing[:, None] * dt
+
+        # The simple asteroid pull: a fixed speed toward every asteroid in range.
+        motion = self.vel * dt
+        if len(self.obstacle_pos) and gravity is None:
+            offsets = self.obstacle_pos[None, :, :] - self.pos[:, None, :]  # Shape (agents, asteroids, 2).
+            distances = np.linalg.norm(offsets, axis=2)
+            low, high = PLAYER_GRAVITY_RANGE
+            in_range = (distances > low) & (distances < high)
+            directions = np.divide(offsets, distances[:, :, None], out=np.zeros_like(offsets),
+                                   where=in_range[:, :, None])
+            motion += directions.sum(axis=1) * PLAYER_GRAVITY_ACC * dt
+        # Move along the step's path, bouncing off the game edges and asteroids at the moment of impact.
+        hit = self.sweep(motion, dt, active)
+        rewards -= hit * HIT_PENALTY
+
+        # Pick up fuel.
+        if len(self.fuel_pos):
+            reach = np.linalg.norm(self.fuel_pos[None, :, :] - self.pos[:, None, :], axis=2) < sprites.PLAYER_PICKUP_RANGE
+            picked = reach & ~self.fuel_taken & active[:, None]
+            self.fuel_taken |= picked
+            got_fuel = picked.any(axis=1)
+            self.tank[got_fuel] = sprites.TANK_MAX
+            rewards += picked.sum(axis=1) * FUEL_REWARD
+
+        # Use teleporters.
+        if len(self.teleporter_pos):
+            self.teleporter_cooldown = np.maximum(self.teleporter_cooldown - dt, 0)
+            touching = (np.linalg.norm(self.teleporter_pos[None, :, :] - self.pos[:, None, :], axis=2) < TELEPORTER_RANGE)
+            usable = touching & (self.teleporter_cooldown <= 0) & (self.teleporter_link >= 0)[None, :] & active[:, None]
+            rows = np.flatnonzero(usable.any(axis=1))
+            if len(rows):
+                sources = np.argmax(usable[rows], axis=1)
+                targets = self.teleporter_link[sources]
+                self.pos[rows] = self.teleporter_pos[targets]
+                self.teleporter_cooldown[rows, sources] = sprites.Teleporter.COOLDOWN_TIME
+                self.teleporter_cooldown[rows, targets] = sprites.Teleporter.COOLDOWN_TIME
+
+        # Reach the exit.
+        exited = active & (np.linalg.norm(self.pos - self.exit_pos, axis=1) < sprites.PLAYER_PICKUP_RANGE)
+        rewards += exited * EXIT_REWARD
+        self.done |= exited
+
+        self.time += dt
+        return self.observe(), rewards, self.done.copy()
+
+    def sweep(self, motion: np.ndarray, dt: float, moving: np.ndarray) -> np.ndarray:
+        """Move the astronauts in ``moving`` by ``motion``, resolving each impact at its time of impact.
+
+        This is ``sprites.Player.sweep`` for every astronaut at once. Each pass finds every astronaut's earliest
+        impact, moves it there, and bounces it, and the astronauts that hit nothing drop out of the next pass.
+        It returns a bool per astronaut indicating a collision with an asteroid.
+        """
+        radius = sprites.PLAYER_CIRCLE_RADIUS
+        hit = np.zeros(self.count, dtype=bool)
+        dt = np.full(self.count, float(dt))
+        pull = motion - self.vel * dt[:, None]  # The part of the motion that doesn't come from the velocity.
+        low, high = radius, self.game_bounds - radius
+        contact = self.obstacle_radius + radius
+        rows = np.flatnonzero(moving & motion.any(axis=1))
+        for _ in range(sprites.MAX_SWEEP_BOUNCES):
+            if not len(rows):
+                break
+            pos, step = self.pos[rows], motion[rows]
+            # The impact times, as fractions of ``motion``: the four game edges, then every asteroid.
+            times = np.full((len(rows), len(WALL_NORMALS) + len(contact)), np.inf)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for axis in (0, 1):
+                    # The max() handles an astronaut that already starts out of bounds.
+                    into_low = (step[:, axis] < 0) & (pos[:, axis] + step[:, axis] < low)
+                    times[into_low, 2 * axis] = np.maximum(0.0, (low - pos[into_low, axis]) / step[into_low, axis])
+                    into_high = (step[:, axis] > 0) & (pos[:, axis] + step[:, axis] > high[axis])
+                    times[into_high, 2 * axis + 1] = np.maximum(
+                        0.0, (high[axis] - pos[into_high, axis]) / step[into_high, axis])
+                if len(contact):
+                    # ``utils.swept_circle_hit`` against every asteroid at once.
+                    offsets = pos[:, None, :] - self.obstacle_pos[None, :, :]
+                    c = (offsets ** 2).sum(axis=2) - contact ** 2
+                    b = (offsets * step[:, None, :]).sum(axis=2)
+                    a = (step ** 2).sum(axis=1)[:, None]
+                    discriminant = b * b - a * c
+                    t = (-b - np.sqrt(discriminant)) / a
+                    ahead = (c >= 0) & (a > 0) & (b < 0) & (discriminant >= 0) & (t <= 1)
+                    times[:, len(WALL_NORMALS):] = np.where(c < 0, np.where(b < 0, 0.0, np.inf),
+                                                            np.where(ahead, t, np.inf))
+            # The earliest impact wins, and on a tie the one ``sprites.Player`` checks first.
+            first = np.argmin(times, axis=1)
+            impact_time = times[np.arange(len(rows)), first]
+            blocked = impact_time < 1
+            impact_time = np.where(blocked, impact_time, 1.0)
+            self.pos[rows] += step * impact_time[:, None]
+            rows, first, impact_time = rows[blocked], first[blocked], impact_time[blocked]
+
+            normal = np.zeros((len(rows), 2))
+            walls = first < len(WALL_NORMALS)
+            normal[walls] = WALL_NORMALS[first[walls]]
+            vel = self.vel[rows]
+            # Bounce off the edge. The pull alone can carry an astronaut into an edge it is moving away from,
+            # and then the velocity is left alone.
+            into = (vel * normal).sum(axis=1)
+            vel -= normal * np.where(walls & (into < 0), 2 * into, 0.0)[:, None]
+            # Bounce straight away from the asteroid, losing some speed.
+            rocks = ~walls
+            away = self.pos[rows[rocks]] - self.obstacle_pos[first[rocks] - len(WALL_NORMALS)]
+            length = np.linalg.norm(away, axis=1)
+            normal[rocks] = np.divide(away, length[:, None], out=np.zeros_like(away), where=length[:, None] > 0)
+            speed = np.linalg.norm(vel[rocks], axis=1) * sprites.ASTEROID_BOUNCE
+            bounced = (length > 0) & (speed > 0)
+            vel[np.flatnonzero(rocks)[bounced]] = normal[rocks][bounced] * speed[bounced, None]
+            self.vel[rows] = vel
+            hit[rows[rocks]] = True
+
+            # Spend the rest of the step moving along the new velocity, with the rest of the pull.
+            # The pull would only push the astronaut straight back into what it hit, so that part is dropped.
+            dt[rows] *= 1 - impact_time
+            pull[rows] *= (1 - impact_time)[:, None]
+            into = (pull[rows] * normal).sum(axis=1)
+            pull[rows] -= normal * np.minimum(into, 0.0)[:, None]
+            motion[rows] = vel * dt[rows, None] + pull[rows]
+            rows = rows[motion[rows].any(axis=1)]
+        return hit
+
+    def observe(self) -> np.ndarray:
+        """Return an array of shape ``(count, OBSERVATION_SIZE)`` describing what each astronaut sees.
+
+        Each row holds: position (0 to 1 across the world), velocity (pixels per second / 100),
+        the sine and cosine of the angle, the tank (0 to 1), the offset to the exit (/ 1000),
+        the offset to the nearest asteroid's center (/ 1000), and the gap to that asteroid's surface (/ 1000).
+        """
+        radians = np.radians(self.angle)
+        to_exit = (self.exit_pos - self.pos) / 1000
+        if len(self.obstacle_pos):
+            offsets = self.obstacle_pos[None, :, :] - self.pos[:, None, :]
+            gaps = np.linalg.norm(offsets, axis=2) - self.obstacle_radius[None, :] - sprites.PLAYER_CIRCLE_RADIUS
+            nearest = np.argmin(gaps, axis=1)
+            rows = np.arange(self.count)
+            to_obstacle = offsets[rows, nearest] / 1000
+            gap = gaps[rows, nearest] / 1000
+        else:
+            to_obstacle = np.zeros((self.count, 2))
+            gap = np.ones(self.count)
+        return np.column_stack((
+            self.pos / self.game_bounds,
+            self.vel / 100,
+            np.sin(radians),
+            np.cos(radians),
+            self.tank / sprites.TANK_MAX,
+            to_exit,
+            to_obstacle,
+            gap,
+        ))
+
+
+if __name__ == "__main__":
+    # Time a batch of astronauts pushing around level 1 at random.
+    import time
+    from pathlib import Path
+    import pygame as pg
+    import level
+
+    pg.display.set_mode((1, 1), pg.HIDDEN)
+    image_directory = Path(__file__, "../../images").resolve()
+    asteroid_filenames = ("Asteroid_60.png", "Asteroid_100.png", "Asteroid_140.png", "Asteroid_160.png")
+    batch = BatchedPlayers(1000, (400, 300), (1600, 1200),
+                           level.SetLevelOneObstacles(image_directory, asteroid_filenames),
+                           level.SetLevelOneItems(image_directory), seed=0)
+    steps = 600
+    start = time.perf_counter()
+    total_reward = np.zeros(batch.count)
+    for _ in range(steps):
+        _, reward, _ = batch.step(batch.rng.uniform(-1, 1, batch.count), batch.rng.random(batch.count) < 0.5, 1 / 60)
+        total_reward += reward
+    elapsed = time.perf_counter() - start
+    print(f"{batch.count} astronauts, {steps} steps: {elapsed:.2f} s "
+          f"({batch.count * steps / elapsed:,.0f} astronaut-steps per second)")
+    print(f"Mean reward: {total_reward.mean():.3f}, reached exit: {batch.done.sum()}")
@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+# This file holds the texture atlas, which packs many small images into a few large ones.
+# Drawing many images from the same big Surface is friendlier to memory than many separate Surfaces.
+# Sprites draw their images as subsurfaces of the pages, which ``fblits`` draws just like an area-rect blit.
+# Pre-rotated frames are not packed here. They come from the sprite bake in bake.py.
+
+# Standard library imports.
+from typing import Optional, Iterable
+from pathlib import Path  # This module allows object-oriented filesystem interaction.
+import hashlib  # Used to fingerprint the source images for the disk cache.
+import json  # The region lookup table is stored as JSON next to the page images.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+import utils
+
+# Constants.
+ATLAS_PAGE_SIZE = 1024  # The width and height of each atlas page, in pixels.
+ATLAS_PADDING = 1  # Empty pixels between packed images, so they never touch.
+ATLAS_CACHE_VERSION = 2  # Bump this when the cache format changes to throw away old caches.
+ATLAS_CACHE_NAME = "atlas"  # The file name stem used for the cached pages and lookup table.
+
+
+class Atlas:
+    """A set of large image pages plus a lookup table of where each named image lives on them."""
+    def __init__(self, pages: list[pg.Surface], regions: dict[str, tuple[int, pg.Rect]]):
+        self.pages = pages
+        self.regions = regions  # Maps an image name to (page index, area on that page).
+        self.images: dict[str, pg.Surface] = {}  # Subsurfaces are made on demand and reused.
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.regions
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def image(self, name: str) -> pg.Surface:
+        """Return a Surface for the named image.
+
+        The Surface is a subsurface, so it shares pixels with its page instead of copying them.
+        It can be used anywhere a normal image can, including rotating and blitting.
+        """
+        if name not in self.images:
+            page, area = self.regions[name]
+            self.images[name] = self.pages[page].subsurface(area)
+        return self.images[name]
+
+    def save(self, directory: Path, key: str):
+        """Write the pages and the lookup table to the given directory."""
+        directory.mkdir(parents=True, exist_ok=True)
+        for index, page in enumerate(self.pages):
+            pg.image.save(page, directory / f"{ATLAS_CACHE_NAME}_{index}.png")
+        table = {
+            "key": key,
+            "pages": len(self.pages),
+            "regions": {name: [page, *area] for name, (page, area) in self.regions.items()},
+        }
+        (directory / f"{ATLAS_CACHE_NAME}.json").write_text(json.dumps(table))
+
+    @classmethod
+    def load(cls, directory: Path, key: str) -> Optional["Atlas"]:
+        """Load an atlas saved with ``save``. Return None if it is missing, damaged, or was built from other images."""
+        try:
+            table = json.loads((directory / f"{ATLAS_CACHE_NAME}.json").read_text())
+            if table["key"] != key:
+                return None
+            pages = [pg.image.load(directory / f"{ATLAS_CACHE_NAME}_{index}.png").convert_alpha()
+                     for index in range(table["pages"])]
+            regions = {name: (page, pg.Rect(area)) for name, (page, *area) in table["regions"].items()}
+            return cls(pages, regions)
+        except (OSError, ValueError, KeyError, TypeError, pg.error):
+            # A broken cache is not an error, it just gets rebuilt.
+            return None
+
+
+def pack(images: dict[str, pg.Surface], page_size: int = ATLAS_PAGE_SIZE) -> Atlas:
+    """Pack the given images onto as few pages as possible and return the Atlas.
+
+    This is a simple shelf packer. Images are sorted tallest first and placed left to right in rows.
+    An image that is bigger than a page gets a page of its own.
+    """
+    page_sizes: list[list[int]] = []  # The used [width, height] of each page.
+    regions: dict[str, tuple[int, pg.Rect]] = {}
+    page = -1
+    x = y = shelf_height = page_size  # Force a new page for the first image.
+    for name, image in sorted(images.items(), key=lambda pair: pair[1].get_height(), reverse=True):
+        width, height = image.get_size()
+        if width > page_size or height > page_size:
+            page_sizes.append([width, height])
+            regions[name] = (len(page_sizes) - 1, pg.Rect(0, 0, width, height))
+            continue
+        if x + width > page_size:
+            # Start a new shelf below the current one.
+            x, y = 0, y + shelf_height + ATLAS_PADDING
+            shelf_height = 0
+        if y + height > page_size:
+            # Start a new page.
+            page_sizes.append([0, 0])
+            page = len(page_sizes) - 1
+            x = y = shelf_height = 0
+        regions[name] = (page, pg.Rect(x, y, width, height))
+        page_sizes[page][0] = max(page_sizes[page][0], x + width)
+        page_sizes[page][1] = max(page_sizes[page][1], y + height)
+        x += width + ATLAS_PADDING
+        shelf_height = max(shelf_height, height)
+
+    # Pages are trimmed to the space actually used.
+    pages = [pg.Surface(size, pg.SRCALPHA) for size in page_sizes]
+    for name, (page, area) in regions.items():
+        # The pages start fully transparent, so taking the max copies the pixels exactly
+        # instead of blending partly transparent edges with the empty page.
+        pages[page].blit(images[name], area, special_flags=pg.BLEND_RGBA_MAX)
+    return Atlas([page.convert_alpha() for page in pages], regions)
+
+
+def build_atlas(image_directory: Path, filenames: Iterable[str], cache_directory: Optional[Path] = None) -> Atlas:
+    """Build an atlas from image files, reusing the cached copy from a previous run when nothing changed.
+
+    The display must be initialized before calling this.
+    """
+    filenames = list(filenames)
+
+    # Fingerprint the sources so that editing any image rebuilds the cache.
+    fingerprint = hashlib.sha1(str(ATLAS_CACHE_VERSION).encode())
+    for name in filenames:
+        path = image_directory / name
+        stat = path.stat() if path.exists() else None
+        fingerprint.update(f"{name}:{stat and stat.st_size}:{stat and stat.st_mtime_ns};".encode())
+    key = fingerprint.hexdigest()
+
+    if cache_directory is not None and (atlas := Atlas.load(cache_directory, key)) is not None:
+        return atlas
+
+    atlas = pack({name: utils.load_image(image_directory / name, convert=False) for name in filenames})
+
+    if cache_directory is not None:
+        try:
+            atlas.save(cache_directory, key)
+        except OSError:
+            pass  # The cache is only an optimization, the game can run without it.
+    return atlas
@@ -0,0 +1,307 @@
+# -*- coding:utf-8 -*-
+# This file holds the baked sprite cache: pre-rotated frames and collision mask images, written to one binary file.
+# At startup the file is memory-mapped and its pixels are used as Surfaces directly, without decoding or copying.
+# The operating system shares the mapped pages, so several copies of the game on one machine share one set of pixels.
+# Bake it ahead of time with ``python src/bake.py``. The game also bakes it when it is missing or out of date.
+# It shouldn't import any local files other than utils, to avoid circular imports.
+
+# Standard library imports.
+from typing import Optional, Iterable, Sequence
+from pathlib import Path  # This module allows object-oriented filesystem interaction.
+import hashlib  # Used to fingerprint the source images.
+import json  # The index of the file is stored as JSON.
+import mmap  # Maps the file into memory instead of reading it.
+import os  # Used to replace the file in one step, so other running copies never see half of it.
+import struct  # Packs the file header.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+from colors import *
+import utils
+
+# Constants.
+BAKE_FILE_NAME = "sprites.bin"
+BAKE_MAGIC = b"EXTSPRIT"  # The first bytes of every bake file.
+BAKE_VERSION = 2  # Bump this when the file format changes to throw away old bakes.
+BAKE_ALIGNMENT = 64  # Each image starts on a multiple of this many bytes.
+# The header is the magic, the version, and the length of the JSON index that follows it.
+BAKE_HEADER = struct.Struct("<8sII")
+# The frames are baked in the pixel format the display wants, so they are drawn straight from the mapped file.
+# This is the format used when there is no display to ask. It is what ``convert_alpha`` makes on little-endian
+# machines. A display that wants a format not listed here gets this one, converted when it is loaded.
+BAKE_PIXEL_FORMAT = "BGRA"
+PIXEL_FORMATS = ("BGRA", "RGBA", "ARGB")  # The formats ``frombuffer`` can wrap, in the order they are tried.
+CIRCLE_PREFIX = "circle:"  # Collision circles are baked under this prefix followed by their radius.
+
+
+def align(size: int) -> int:
+    """Round a byte count up to the next multiple of ``BAKE_ALIGNMENT``."""
+    return -(-size // BAKE_ALIGNMENT) * BAKE_ALIGNMENT
+
+
+def display_pixel_format() -> Optional[str]:
+    """Return the pixel format ``convert_alpha`` makes on the current display.
+
+    Return None if there is no display yet, or it wants a format that can't be wrapped around a buffer.
+    """
+    try:
+        display_masks = pg.Surface((1, 1), pg.SRCALPHA).convert_alpha().get_masks()
+    except pg.error:
+        return None
+    return next((pixel_format for pixel_format in PIXEL_FORMATS
+                 if pg.image.frombuffer(bytes(4), (1, 1), pixel_format).get_masks() == display_masks), None)
+
+
+def needs_conversion(pixel_format: str = BAKE_PIXEL_FORMAT) -> bool:
+    """Return whether frames baked in the given format have to be converted to draw quickly on the current display."""
+    try:
+        display_masks = pg.Surface((1, 1), pg.SRCALPHA).convert_alpha().get_masks()
+    except pg.error:
+        return False  # There is no display yet, so there is nothing to match.
+    return display_masks != pg.image.frombuffer(bytes(4), (1, 1), pixel_format).get_masks()
+
+
+def circle_name(radius: int) -> str:
+    """Return the name the collision circle of the given radius is baked under."""
+    return f"{CIRCLE_PREFIX}{radius}"
+
+
+class BakedSprite:
+    """The pre-rotated frames of one image, and the collision mask image of each frame if it has them.
+
+    Frame ``i`` is the image rotated counterclockwise by ``i * 360 / steps`` degrees.
+    The masks are made from the mask images the first time they are needed, and kept after that.
+    """
+    def __init__(self, frames: Sequence[pg.Surface], mask_images: Sequence[pg.Surface] = ()):
+        self.frames = list(frames)
+        self.mask_images = list(mask_images)
+        self.masks: list[Optional[pg.Mask]] = [None] * len(self.mask_images)
+
+    @property
+    def steps(self) -> int:
+        return len(self.frames)
+
+    def index(self, angle: float) -> int:
+        """Return the index of the frame closest to the given angle, in degrees."""
+        return round(angle % 360 * self.steps / 360) % self.steps
+
+    def frame(self, angle: float) -> pg.Surface:
+        return self.frames[self.index(angle)]
+
+    def mask_image(self, angle: float) -> pg.Surface:
+        return self.mask_images[self.index(angle)]
+
+    def mask(self, angle: float) -> pg.Mask:
+        # Pygame can't wrap a mask around memory it doesn't own, so each mask is built once from its image.
+        index = self.index(angle)
+        if self.masks[index] is None:
+            self.masks[index] = pg.mask.from_surface(self.mask_images[index])
+        return self.masks[index]
+
+
+class SpriteBake:
+    """The baked sprites, by image file name. Collision circles are under ``circle_name(radius)``."""
+    def __init__(self, sprites: dict[str, BakedSprite], mapping: Optional[mmap.mmap] = None):
+        self.sprites = sprites
+        self.mapping = mapping  # The mapped file. It must stay open as long as the Surfaces are used.
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sprites
+
+    def __getitem__(self, name: str) -> BakedSprite:
+        return self.sprites[name]
+
+    def get(self, name: str) -> Optional[BakedSprite]:
+        return self.sprites.get(name)
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.sprites)
+
+    @property
+    def circles(self) -> dict[int, BakedSprite]:
+        """The baked collision circles, by radius."""
+        return {int(name.removeprefix(CIRCLE_PREFIX)): sprite for name, sprite in self.sprites.items()
+                if name.startswith(CIRCLE_PREFIX)}
+
+    @classmethod
+    def load(cls, path: Path, key: str) -> Optional["SpriteBake"]:
+        """Map a bake file into memory. Return None if it is missing, damaged, or was baked from other images."""
+        try:
+            with open(path, "rb") as file:
+                # A private mapping shares its pages with every other process mapping the file,
+                # and copies a page only if something draws onto one of these Surfaces.
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, version, index_size = BAKE_HEADER.unpack_from(mapping)
+            if magic != BAKE_MAGIC or version != BAKE_VERSION:
+                return None
+            index = json.loads(mapping[BAKE_HEADER.size:BAKE_HEADER.size + index_size])
+            if index["key"] != key:
+                return None
+            pixel_format = index["format"]
+            # The image offsets count from the start of the pixels, which come after the index.
+            pixels = memoryview(mapping)[align(BAKE_HEADER.size + index_size):]
+            # Bakes made by ``load_or_bake`` are in the display's format and never need this.
+            # Converting copies the frames out of the mapped file, but that's only once, instead of on every blit.
+            convert = needs_conversion(pixel_format)
+
+            def wrap(offset: int, width: int, height: int) -> pg.Surface:
+                # No pixels are copied, the Surface draws straight from the mapped file.
+                surface = pg.image.frombuffer(pixels[offset:offset + width * height * 4], (width, height),
+                                              pixel_format)
+                return surface.convert_alpha() if convert else surface
+
+            sprites = {name: BakedSprite([wrap(*frame) for frame in entry["frames"]],
+                                         [wrap(*mask) for mask in entry["masks"]])
+                       for name, entry in index["sprites"].items()}
+            return cls(sprites, mapping)
+        except (ValueError, KeyError, TypeError, struct.error, pg.error):
+            # A broken bake is not an error, it just gets baked again.
+            return None
+
+
+def bake_key(image_directory: Path, rotations: dict[str, int], masked: Iterable[str],
+             circle_radii: Iterable[int], pixel_format: str = BAKE_PIXEL_FORMAT) -> str:
+    """Return a fingerprint of everything a bake is made from, so editing any of it bakes again.
+
+    The pixel format is part of it, so moving to a display that wants another format bakes again.
+    """
+    fingerprint = hashlib.sha1(f"{BAKE_VERSION}:{pixel_format}:{sorted(masked)}:{sorted(circle_radii)}".encode())
+    for name, steps in sorted(rotations.items()):
+        path = image_directory / name
+        stat = path.stat() if path.exists() else None
+        fingerprint.update(f"{name}:{stat and stat.st_size}:{stat and stat.st_mtime_ns}:{steps};".encode())
+    return fingerprint.hexdigest()
+
+
+def bake(image_directory: Path, rotations: dict[str, int], masked: Iterable[str], circle_radii: Iterable[int],
+         path: Path, key: str, pixel_format: str = BAKE_PIXEL_FORMAT):
+    """Write a bake file.
+
+    ``rotations`` maps image file names to the number of rotated frames to bake for them.
+    The images named in ``masked`` also get a collision mask image per frame, and a collision circle
+    is baked for each radius in ``circle_radii``. The pixels are written in ``pixel_format``, one of
+    ``PIXEL_FORMATS``. The display does not need to be initialized.
+    """
+    masked = set(masked)
+    sprites: dict[str, tuple[list[pg.Surface], list[pg.Surface]]] = {}
+    for name, steps in rotations.items():
+        image = utils.load_image(image_directory / name, convert=False)
+        frames = [pg.transform.rotate(image, index * 360 / steps) for index in range(steps)]
+        masks = [pg.mask.from_surface(frame).to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
+                 for frame in frames] if name in masked else []
+        sprites[name] = (frames, masks)
+    for radius in circle_radii:
+        circle = pg.mask.from_surface(utils.make_circle_image(radius, CYAN)).to_surface(setcolor=CYAN,
+                                                                                           unsetcolor=TRANS_BLACK)
+        # A circle looks the same at every angle, so it is one frame that is also its own mask image.
+        sprites[circle_name(radius)] = ([circle], [circle])
+
+    # Lay out the images, then write the header, the index, and the pixels.
+    # Image offsets count from the start of the pixels, so they don't depend on the size of the index.
+    # An image used twice, like a circle that is its own mask, is only written once.
+    blobs: list[bytes] = []
+    offsets: dict[int, int] = {}  # Maps id(image) to where its pixels were put.
+    index = {"key": key, "format": pixel_format, "sprites": {}}
+    offset = 0
+    for name, (frames, masks) in sprites.items():
+        entry = index["sprites"][name] = {"frames": [], "masks": []}
+        for kind, images in (("frames", frames), ("masks", masks)):
+            for image in images:
+                if id(image) not in offsets:
+                    offsets[id(image)] = offset
+                    blobs.append(pg.image.tobytes(image, pixel_format))
+                    offset += align(len(blobs[-1]))
+                entry[kind].append([offsets[id(image)], *image.get_size()])
+    index_bytes = json.dumps(index).encode()
+    pixels_start = align(BAKE_HEADER.size + len(index_bytes))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as file:
+        file.write(BAKE_HEADER.pack(BAKE_MAGIC, BAKE_VERSION, len(index_bytes)))
+        file.write(index_bytes)
+        file.write(bytes(pixels_start - BAKE_HEADER.size - len(index_bytes)))
+        for blob in blobs:
+            file.write(blob)
+            file.write(bytes(-len(blob) % BAKE_ALIGNMENT))
+    # Replacing the file in one step means a game that is starting up sees the old bake or the new one, never half.
+    os.replace(temporary_path, path)
+
+
+def load_or_bake(image_directory: Path, rotations: dict[str, int], masked: Iterable[str] = (),
+                 circle_radii: Iterable[int] = (), cache_directory: Optional[Path] = None) -> Optional[SpriteBake]:
+    """Load the bake from the cache directory, baking it first if it is missing or out of date.
+
+    It is baked in the display's pixel format, so loading it never copies the frames.
+    Return None if there is no cache directory or the bake can't be written. The game then rotates at runtime.
+    """
+    if cache_directory is None:
+        return None
+    masked, circle_radii = list(masked), list(circle_radii)
+    pixel_format = display_pixel_format() or BAKE_PIXEL_FORMAT
+    key = bake_key(image_directory, rotations, masked, circle_radii, pixel_format)
+    path = cache_directory / BAKE_FILE_NAME
+    if (sprite_bake := SpriteBake.load(path, key)) is not None:
+        return sprite_bake
+    try:
+        bake(image_directory, rotations, masked, circle_radii, path, key, pixel_format)
+    except OSError:
+        return None  # The bake is only an optimization, the game can run without it.
+    return SpriteBake.load(path, key)
+
+
+if __name__ == "__main__":
+    # Bake the game's sprites ahead of time and compare loading the bake with building everything at runtime.
+    import time
+    import resources
+
+    pg.display.set_mode((1, 1), pg.HIDDEN)
+    radii = [utils.load_image(resources.IMAGE_DIRECTORY / name, convert=False).get_width() // 2
+             for name in resources.ASTEROID_IMAGE_FILENAMES]
+    bake_path = resources.CACHE_DIRECTORY / BAKE_FILE_NAME
+    display_format = display_pixel_format() or BAKE_PIXEL_FORMAT
+    key = bake_key(resources.IMAGE_DIRECTORY, resources.BAKED_ROTATIONS, resources.BAKED_MASKS, radii, display_format)
+
+    # Bake even if the file is up to date. The new file replaces the old one in one step,
+    # so a game that is running or starting up keeps working the whole time.
+    start = time.perf_counter()
+    bake(resources.IMAGE_DIRECTORY, resources.BAKED_ROTATIONS, resources.BAKED_MASKS, radii, bake_path, key,
+         display_format)
+    print(f"Baked {len(resources.BAKED_ROTATIONS) + len(radii)} sprites to {bake_path} "
+          f"({bake_path.stat().st_size / 2 ** 20:.1f} MB) in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    baked = SpriteBake.load(bake_path, key)
+    print(f"Mapping the bake: {(time.perf_counter() - start) * 1000:.1f} ms")
+    for name in resources.BAKED_ROTATIONS:
+        sprite_bytes = sum(frame.get_width() * frame.get_height() * 4
+                           for frame in (*baked[name].frames, *baked[name].mask_images))
+        print(f"    {name}: {baked[name].steps} frames, {sprite_bytes / 2 ** 20:.1f} MB")
+
+    # A bake in a format the display doesn't want has every frame copied out of the file when it is loaded.
+    other_format = next(pixel_format for pixel_format in PIXEL_FORMATS if pixel_format != display_format)
+    other_path = bake_path.with_name(f"{other_format}.{BAKE_FILE_NAME}")
+    other_key = bake_key(resources.IMAGE_DIRECTORY, resources.BAKED_ROTATIONS, resources.BAKED_MASKS, radii,
+                         other_format)
+    bake(resources.IMAGE_DIRECTORY, resources.BAKED_ROTATIONS, resources.BAKED_MASKS, radii, other_path, other_key,
+         other_format)
+    start = time.perf_counter()
+    SpriteBake.load(other_path, other_key)
+    print(f"Loading a bake in {other_format}, which converts every frame: "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    other_path.unlink()
+
+    start = time.perf_counter()
+    for name, steps in resources.BAKED_ROTATIONS.items():
+        image = utils.load_image(resources.IMAGE_DIRECTORY / name, alpha=True)
+        frames = [pg.transform.rotate(image, index * 360 / steps) for index in range(steps)]
+        if name in resources.BAKED_MASKS:
+            for frame in frames:
+                pg.mask.from_surface(frame).to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
+    print(f"Decoding and rotating the same frames at runtime: {(time.perf_counter() - start) * 1000:.1f} ms")
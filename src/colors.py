@@ -22,3 +22,11 @@ GAME_BORDER = Color(85, 85, 85)
 SMOKE = Color(40, 40, 40)
 TANK_BG_COLOR = (64, 0, 0, 255)
 TRANS_BLACK = (0, 0, 0, 0)
+
+# Minimap colors.
+MINIMAP_BACKGROUND = Color(0, 0, 0, 160)
+MINIMAP_ASTEROID = Color(120, 120, 120)
+MINIMAP_FUEL = Color(255, 40, 40)
+MINIMAP_EXIT = Color(140, 60, 255)
+MINIMAP_TELEPORTER = Color(120, 180, 255)
+MINIMAP_PLAYER = WHITE
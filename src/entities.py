@@ -0,0 +1,213 @@
+# -*- coding:utf-8 -*-
+# This file holds the entity store, which keeps the per-object numbers of the game objects in typed arrays.
+# The game objects in sprites.py are small handles that point into the store.
+# It shouldn't import any local files other than utils, to avoid circular imports.
+
+# Standard library imports.
+from typing import Sequence, Optional, Iterable
+from array import array  # Compact, typed arrays of numbers.
+import sys  # Used to measure object sizes for the memory report.
+
+# Third-party library imports.
+import pygame as pg
+try:
+    import numpy as np  # The bulk updates use NumPy when it is installed. The game runs without it.
+except ImportError:
+    np = None
+
+# Local library imports.
+import utils
+
+# The kind of entity stored in each slot. Items store their ``ItemType`` value instead.
+OBSTACLE_KIND = 0
+
+
+class EntityStore:
+    """Keeps position, velocity, angle, rotation speed, radius, kind, and cooldown of many entities in typed arrays.
+
+    Each entity is an index into the arrays. Removed indices are reused by the next added entity.
+    Numbers in a typed array take 8 bytes each instead of a full Python object, and the bulk updates
+    touch one array at a time instead of visiting every object.
+    Cooldowns are stored as the game time they end at, so they cost nothing per frame.
+    """
+    def __init__(self, clock: utils.GameClock = utils.GAME_CLOCK):
+        self.clock = clock
+        self.x = array("d")
+        self.y = array("d")
+        self.vx = array("d")
+        self.vy = array("d")
+        self.angle = array("d")
+        self.rot_speed = array("d")
+        self.radius = array("d")
+        self.cooldown_end = array("d")
+        self.kind = array("b")
+        self.alive = array("b")
+        self.free: list[int] = []  # Indices of removed entities, ready to be reused.
+
+    def __len__(self) -> int:
+        return len(self.alive) - len(self.free)
+
+    @property
+    def arrays(self) -> tuple[array, ...]:
+        return self.x, self.y, self.vx, self.vy, self.angle, self.rot_speed, self.radius, self.cooldown_end, self.kind, self.alive
+
+    def clear(self):
+        """Remove every entity. Handles made before this must not be used anymore."""
+        for values in self.arrays:
+            del values[:]
+        self.free = []
+
+    def add(self, pos: Sequence[float], kind: int, angle: float = 0, rot_speed: float = 0, radius: float = 0) -> int:
+        """Add an entity and return its index."""
+        values = (pos[0], pos[1], 0, 0, angle, rot_speed, radius, 0, kind, 1)
+        if self.free:
+            index = self.free.pop()
+            for column, value in zip(self.arrays, values):
+                column[index] = value
+            return index
+        for column, value in zip(self.arrays, values):
+            column.append(value)
+        return len(self.alive) - 1
+
+    def remove(self, index: int):
+        """Remove an entity. Its index will be given to a later entity."""
+        if self.alive[index]:
+            self.alive[index] = 0
+            self.rot_speed[index] = 0
+            self.cooldown_end[index] = 0
+            self.free.append(index)
+
+    def update(self, dt: float):
+        """Rotate every entity in one pass over the arrays, in place."""
+        if np is not None:
+            # NumPy works straight on the memory of the arrays, without copying them.
+            # The views only live for this call, because an array can't grow while a view of it exists.
+            angle = np.frombuffer(self.angle)
+            angle += np.frombuffer(self.rot_speed) * dt
+            np.mod(angle, 360, out=angle)
+            return
+        angle = self.angle
+        for index, speed in enumerate(self.rot_speed):
+            if speed:
+                angle[index] = (angle[index] + speed * dt) % 360
+
+    def memory_report(self, handles: Iterable["Entity"] = ()) -> dict[str, float]:
+        """Return the memory used by the store and, optionally, by the handles pointing into it.
+
+        Surface and mask sizes are estimated from their pixel counts. Subsurfaces share their
+        parent's pixels, so they are not counted, and images shared by many entities are counted once.
+        """
+        handles = list(handles)
+        count = max(len(self), 1)
+        array_bytes = sum(len(values) * values.itemsize for values in self.arrays)
+        handle_bytes = sum(sys.getsizeof(handle) for handle in handles)
+        seen: set[int] = set()
+        image_bytes = 0
+        for handle in handles:
+            for name in (name for cls in type(handle).__mro__ for name in getattr(cls, "__slots__", ())):
+                value = getattr(handle, name, None)
+                if id(value) in seen:
+                    continue
+                seen.add(id(value))
+                if isinstance(value, pg.Surface) and value.get_parent() is None:
+                    image_bytes += value.get_width() * value.get_height() * value.get_bytesize()
+                elif isinstance(value, pg.Mask):
+                    image_bytes += value.get_size()[0] * value.get_size()[1] // 8
+        return {
+            "entities": len(self),
+            "array_bytes": array_bytes,
+            "array_bytes_per_entity": sum(values.itemsize for values in self.arrays),
+            "handle_bytes_per_entity": handle_bytes / max(len(handles), 1),
+            "image_bytes": image_bytes,
+            "image_bytes_per_entity": image_bytes / count,
+            "total_bytes": array_bytes + handle_bytes + image_bytes,
+        }
+
+
+# The store used by the game objects unless they are given another one.
+# The game and the multiplayer sessions give each level a store of its own, so this one is for scripts and tools.
+WORLD = EntityStore()
+
+
+class Entity:
+    """A handle to one entity in an ``EntityStore``, exposing its numbers as attributes."""
+    __slots__ = ("store", "index")
+
+    def __init__(self, pos: Sequence[float], kind: int, angle: float = 0, rot_speed: float = 0, radius: float = 0,
+                 store: Optional[EntityStore] = None):
+        self.store = store if store is not None else WORLD
+        self.index = self.store.add(pos, kind, angle, rot_speed, radius)
+
+    def kill(self):
+        """Remove this entity from its store. The handle must not be used afterward."""
+        self.store.remove(self.index)
+
+    # Reading the position makes a new Vector2, so write it back as a whole: ``entity.pos += offset`` works,
+    # but ``entity.pos.x += 1`` only changes the copy.
+    @property
+    def pos(self) -> pg.Vector2:
+        return pg.Vector2(self.store.x[self.index], self.store.y[self.index])
+
+    @pos.setter
+    def pos(self, value: Sequence[float]):
+        self.store.x[self.index], self.store.y[self.index] = value[0], value[1]
+
+    @property
+    def vel(self) -> pg.Vector2:
+        return pg.Vector2(self.store.vx[self.index], self.store.vy[self.index])
+
+    @vel.setter
+    def vel(self, value: Sequence[float]):
+        self.store.vx[self.index], self.store.vy[self.index] = value[0], value[1]
+
+    @property
+    def angle(self) -> float:
+        return self.store.angle[self.index]
+
+    @angle.setter
+    def angle(self, value: float):
+        self.store.angle[self.index] = value
+
+    @property
+    def rot_speed(self) -> float:
+        return self.store.rot_speed[self.index]
+
+    @rot_speed.setter
+    def rot_speed(self, value: float):
+        self.store.rot_speed[self.index] = value
+
+    @property
+    def radius(self) -> float:
+        return self.store.radius[self.index]
+
+    @radius.setter
+    def radius(self, value: float):
+        self.store.radius[self.index] = value
+
+    # The cooldown reads as the seconds of game time left, but is stored as the time it ends at.
+    @property
+    def cooldown(self) -> float:
+        return max(self.store.cooldown_end[self.index] - self.store.clock.time, 0.0)
+
+    @cooldown.setter
+    def cooldown(self, value: float):
+        self.store.cooldown_end[self.index] = self.store.clock.time + value
+
+    @property
+    def kind(self) -> int:
+        return self.store.kind[self.index]
+
+
+if __name__ == "__main__":
+    # Print the memory report for a world with thousands of asteroids.
+    # The display isn't needed, the game objects work fine with unconverted images.
+    import random
+    import entities  # The game objects use the imported module's store, not this script's copy.
+    import sprites
+    import utils
+
+    asteroid_image = utils.make_circle_image(30, (128, 128, 128))
+    obstacles = [sprites.Obstacle((random.uniform(0, 10000), random.uniform(0, 10000)), asteroid_image)
+                 for _ in range(5000)]
+    for key, value in entities.WORLD.memory_report(obstacles).items():
+        print(f"{key}: {value:,.1f}")
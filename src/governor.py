@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+# This file holds the quality governor, which trades visual quality for frame-rate on slow machines.
+# It shouldn't import any other local files, to avoid circular imports.
+
+# Standard library imports.
+from typing import NamedTuple, Optional, Sequence
+from collections import deque  # A fast fixed-length queue, used for the recent frame times.
+import logging  # The governor logs every quality change it makes.
+
+logger = logging.getLogger(__name__)
+
+
+class QualityLevel(NamedTuple):
+    """One step on the quality ladder. Everything the governor can turn down is here."""
+    name: str
+    smoke_emission: float  # Multiplies the smoke emission rate.
+    max_smoke_particles: Optional[int]  # The most smoke particles alive at once, or None for no limit.
+    rotation_step: float  # Asteroids and portals only rotate in steps of this many degrees. 0 is smooth.
+    portal_dust_rate: float  # Portal dust particles spawned per second, per portal.
+    debug_overlays: bool  # Whether the debug collision masks are drawn.
+
+
+# The quality levels, from best to cheapest.
+QUALITY_LEVELS = (
+    QualityLevel("high", 1.0, 1000, 0, 10, True),
+    QualityLevel("medium", 0.75, 600, 2, 6, True),
+    QualityLevel("low", 0.5, 300, 5, 4, False),
+    QualityLevel("lowest", 0.25, 150, 10, 2.5, False),
+)
+
+
+class QualityGovernor:
+    """Watches recent frame times and moves up or down the quality ladder to hold a target frame time.
+
+    The frame times it is given should be the time spent working on each frame, not the time between frames.
+    A frame-rate cap sleeps the rest of each frame away, so a machine with plenty of time to spare would
+    otherwise look like it is right at the target.
+    Quality drops a level when the average frame takes longer than the target, and rises a level when
+    frames are comfortably under it. After each change it waits ``settle_time`` seconds, so the effect of
+    the change shows up in the frame times before it decides again.
+    """
+    def __init__(self, target_frame_time: float, levels: Sequence[QualityLevel] = QUALITY_LEVELS,
+                 window: int = 30, settle_time: float = 1.0, raise_margin: float = 0.6):
+        """The target frame time is in seconds.
+
+        ``window`` is how many recent frames are averaged. Quality is only raised when the average frame takes
+        less than ``raise_margin`` of the target, which stops it from bouncing between two levels.
+        """
+        self.target_frame_time = target_frame_time
+        self.levels = levels
+        self.level = 0
+        self.frame_times: deque[float] = deque(maxlen=window)
+        self.settle_time = settle_time
+        self.raise_margin = raise_margin
+        self.time_since_change = 0.0
+        self.decisions: list[str] = []  # Every change made, for showing in debug mode.
+
+    @property
+    def settings(self) -> QualityLevel:
+        return self.levels[self.level]
+
+    @property
+    def average_frame_time(self) -> float:
+        return sum(self.frame_times) / len(self.frame_times) if self.frame_times else 0.0
+
+    def update(self, frame_time: float, dt: Optional[float] = None) -> bool:
+        """Record the last frame time, in seconds. Return True if the quality level changed.
+
+        ``dt`` is the real time since the last frame, which the settle time is counted in.
+        It is the frame time if it isn't given.
+        """
+        self.frame_times.append(frame_time)
+        self.time_since_change += frame_time if dt is None else dt
+        if self.time_since_change < self.settle_time or len(self.frame_times) < self.frame_times.maxlen:
+            return False
+
+        average = self.average_frame_time
+        if average > self.target_frame_time and self.level < len(self.levels) - 1:
+            self.set_level(self.level + 1, average)
+            return True
+        if average < self.target_frame_time * self.raise_margin and self.level > 0:
+            self.set_level(self.level - 1, average)
+            return True
+        return False
+
+    def set_level(self, level: int, average: float = 0.0):
+        """Switch to the given quality level and log what changed."""
+        old, new = self.settings, self.levels[level]
+        changes = ", ".join(f"{field} {getattr(old, field)} -> {getattr(new, field)}"
+                            for field in QualityLevel._fields[1:] if getattr(old, field) != getattr(new, field))
+        decision = (f"Quality {old.name} -> {new.name} (average frame {average * 1000:.1f} ms, "
+                    f"target {self.target_frame_time * 1000:.1f} ms): {changes}")
+        logger.info(decision)
+        self.decisions.append(decision)
+        self.level = level
+        self.time_since_change = 0.0
+        self.frame_times.clear()
@@ -0,0 +1,243 @@
+# -*- coding:utf-8 -*-
+# This file holds the dynamic asteroid simulation, where asteroids drift, pull on each other and the player,
+# and bump into each other.
+# Gravity between every pair of asteroids would cost O(N^2), so it uses a Barnes-Hut quadtree instead:
+# far away groups of asteroids are treated as one big asteroid at their center of mass, which costs O(N log N).
+# It shouldn't import any local files other than entities, to avoid circular imports.
+
+# Standard library imports.
+from typing import Sequence, Optional, Iterable
+import math  # C-style math functions.
+import random  # Random number generation.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+import entities
+
+# Constants.
+GRAVITY_CONSTANT = 600  # Scales how hard asteroids pull. Each asteroid's mass is its radius squared.
+GRAVITY_SOFTENING = 20  # Pixels added to every distance, so very close asteroids don't fling each other away.
+BARNES_HUT_THETA = 0.5  # The accuracy setting. 0 is exact, bigger is faster and rougher. 0.5 to 1 is typical.
+MAX_ASTEROID_DRIFT = 20  # The fastest an asteroid starts out drifting, in pixels per second.
+MAX_TREE_DEPTH = 24  # Asteroids closer than this many halvings of the world share a leaf instead of splitting forever.
+
+
+class QuadNode:
+    """One square of the quadtree, holding either a few bodies (a leaf) or four smaller squares."""
+    __slots__ = ("x", "y", "half", "depth", "mass", "com_x", "com_y", "bodies", "children")
+
+    def __init__(self, x: float, y: float, half: float, depth: int = 0):
+        self.x = x  # The center of the square.
+        self.y = y
+        self.half = half  # Half the width of the square.
+        self.depth = depth
+        self.mass = 0.0
+        self.com_x = 0.0  # The center of mass of everything inside.
+        self.com_y = 0.0
+        self.bodies: list[int] = []  # The bodies in a leaf. Empty once the node is split.
+        self.children: Optional[list[QuadNode]] = None
+
+    def child_for(self, x: float, y: float) -> "QuadNode":
+        return self.children[(x >= self.x) + 2 * (y >= self.y)]
+
+    def split(self):
+        quarter = self.half / 2
+        self.children = [QuadNode(self.x + dx * quarter, self.y + dy * quarter, quarter, self.depth + 1)
+                         for dy in (-1, 1) for dx in (-1, 1)]
+
+
+class QuadTree:
+    """A Barnes-Hut quadtree over a set of point masses."""
+    def __init__(self, xs: Sequence[float], ys: Sequence[float], masses: Sequence[float]):
+        self.xs, self.ys, self.masses = xs, ys, masses
+        if xs:
+            min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+            half = max(max_x - min_x, max_y - min_y) / 2 + 1
+            self.root = QuadNode((min_x + max_x) / 2, (min_y + max_y) / 2, half)
+        else:
+            self.root = QuadNode(0, 0, 1)
+        for body in range(len(xs)):
+            self.insert(body)
+        self.summarize(self.root)
+
+    def insert(self, body: int):
+        x, y = self.xs[body], self.ys[body]
+        node = self.root
+        while True:
+            if node.children is not None:
+                node = node.child_for(x, y)
+            elif not node.bodies or node.depth >= MAX_TREE_DEPTH:
+                node.bodies.append(body)
+                return
+            else:
+                # The leaf is taken, so split it and push its body down a level.
+                node.split()
+                for other in node.bodies:
+                    node.child_for(self.xs[other], self.ys[other]).bodies.append(other)
+                node.bodies = []
+                node = node.child_for(x, y)
+
+    def summarize(self, root: QuadNode):
+        """Fill in the mass and center of mass of every node, from the leaves up."""
+        order = [root]
+        for node in order:  # Breadth-first, so reversing it visits children before their parents.
+            if node.children is not None:
+                order.extend(node.children)
+        for node in reversed(order):
+            if node.children is not None:
+                parts = [(child.mass, child.com_x, child.com_y) for child in node.children if child.mass]
+            else:
+                parts = [(self.masses[body], self.xs[body], self.ys[body]) for body in node.bodies]
+            mass = sum(part[0] for part in parts)
+            if mass:
+                node.mass = mass
+                node.com_x = sum(m * x for m, x, _ in parts) / mass
+                node.com_y = sum(m * y for m, _, y in parts) / mass
+
+    def acceleration(self, x: float, y: float, theta: float, gravity: float, softening: float,
+                     skip: int = -1) -> tuple[float, float]:
+        """Return the pull on a point from every body in the tree, ignoring the body ``skip``.
+
+        A node that looks small from the point (its width over its distance is under ``theta``)
+        is treated as a single mass.
+        """
+        ax = ay = 0.0
+        theta_squared = theta * theta
+        softening_squared = softening * softening
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not node.mass:
+                continue
+            if node.children is None:
+                for body in node.bodies:
+                    if body == skip:
+                        continue
+                    dx, dy = self.xs[body] - x, self.ys[body] - y
+                    distance_squared = dx * dx + dy * dy + softening_squared
+                    pull = gravity * self.masses[body] / (distance_squared * math.sqrt(distance_squared))
+                    ax += dx * pull
+                    ay += dy * pull
+                continue
+            dx, dy = node.com_x - x, node.com_y - y
+            distance_squared = dx * dx + dy * dy + softening_squared
+            width = node.half * 2
+            if width * width < theta_squared * distance_squared:
+                pull = gravity * node.mass / (distance_squared * math.sqrt(distance_squared))
+                ax += dx * pull
+                ay += dy * pull
+            else:
+                stack.extend(node.children)
+        return ax, ay
+
+
+class AsteroidGravity:
+    """Moves the asteroids under their mutual gravity and bounces them off each other and the game edges.
+
+    Asteroid positions and velocities live in the entity store. Call ``step`` once per frame,
+    then ``acceleration_at`` gives the pull on anything else, like the player.
+    """
+    def __init__(self, game_bounds: Sequence[float], theta: float = BARNES_HUT_THETA,
+                 gravity: float = GRAVITY_CONSTANT, softening: float = GRAVITY_SOFTENING, restitution: float = 0.8):
+        self.game_bounds = pg.Vector2(game_bounds)  # noqa
+        self.theta = theta
+        self.gravity = gravity
+        self.softening = softening
+        self.restitution = restitution  # The fraction of speed kept when two asteroids bounce.
+        self.tree = QuadTree([], [], [])
+
+    @staticmethod
+    def start_drifting(asteroids: Iterable[entities.Entity], max_speed: float = MAX_ASTEROID_DRIFT):
+        """Give each asteroid a small random velocity."""
+        for asteroid in asteroids:
+            drift = pg.Vector2()
+            drift.from_polar((random.uniform(0, max_speed), random.uniform(0, 360)))
+            asteroid.vel = drift
+
+    def acceleration_at(self, pos: Sequence[float]) -> pg.Vector2:
+        """Return the pull of all the asteroids at a position, as of the last step."""
+        return pg.Vector2(self.tree.acceleration(pos[0], pos[1], self.theta, self.gravity, self.softening))
+
+    def step(self, dt: float, asteroids: Sequence[entities.Entity]):
+        """Move the asteroids forward by ``dt`` seconds."""
+        if not asteroids or not dt:
+            return
+        store = asteroids[0].store
+        indices = [asteroid.index for asteroid in asteroids]
+        xs = [store.x[i] for i in indices]
+        ys = [store.y[i] for i in indices]
+        radii = [store.radius[i] for i in indices]
+        masses = [radius * radius for radius in radii]
+
+        # Gravity. Velocity is updated before position, which keeps orbits stable.
+        self.tree = QuadTree(xs, ys, masses)
+        for body, i in enumerate(indices):
+            ax, ay = self.tree.acceleration(xs[body], ys[body], self.theta, self.gravity, self.softening, body)
+            store.vx[i] += ax * dt
+            store.vy[i] += ay * dt
+            xs[body] += store.vx[i] * dt
+            ys[body] += store.vy[i] * dt
+
+        self.collide(store, indices, xs, ys, radii, masses)
+
+        for body, i in enumerate(indices):
+            store.x[i], store.y[i] = xs[body], ys[body]
+
+    def collide(self, store: entities.EntityStore, indices: list[int], xs: list[float], ys: list[float],
+                radii: list[float], masses: list[float]):
+        """Bounce the asteroids off the game edges and each other. Changes ``xs`` and ``ys`` in place."""
+        width, height = self.game_bounds
+        for body, i in enumerate(indices):
+            radius = radii[body]
+            if xs[body] - radius < 0 or xs[body] + radius > width:
+                xs[body] = min(max(xs[body], radius), width - radius)
+                store.vx[i] *= -self.restitution
+            if ys[body] - radius < 0 or ys[body] + radius > height:
+                ys[body] = min(max(ys[body], radius), height - radius)
+                store.vy[i] *= -self.restitution
+
+        # Find touching pairs with a grid of cells as big as the largest asteroid,
+        # so each asteroid only checks the asteroids in its own and neighboring cells.
+        cell_size = max(radii) * 2
+        grid: dict[tuple[int, int], list[int]] = {}
+        for body in range(len(indices)):
+            grid.setdefault((int(xs[body] // cell_size), int(ys[body] // cell_size)), []).append(body)
+        for (cell_x, cell_y), bodies in grid.items():
+            neighbors = [other for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                         for other in grid.get((cell_x + dx, cell_y + dy), ())]
+            for body in bodies:
+                for other in neighbors:
+                    if other <= body:
+                        continue  # Each pair is handled once.
+                    self.bounce(store, indices[body], indices[other], body, other, xs, ys, radii, masses)
+
+    def bounce(self, store: entities.EntityStore, i: int, j: int, body: int, other: int,
+               xs: list[float], ys: list[float], radii: list[float], masses: list[float]):
+        """Separate two asteroids if they overlap and bounce them apart along the line between their centers."""
+        dx, dy = xs[other] - xs[body], ys[other] - ys[body]
+        distance = math.hypot(dx, dy)
+        overlap = radii[body] + radii[other] - distance
+        if overlap <= 0:
+            return
+        if distance:
+            nx, ny = dx / distance, dy / distance
+        else:
+            nx, ny = 1.0, 0.0
+        total_mass = masses[body] + masses[other]
+        # Push them apart, the lighter asteroid moving further.
+        share = masses[other] / total_mass
+        xs[body] -= nx * overlap * share
+        ys[body] -= ny * overlap * share
+        xs[other] += nx * overlap * (1 - share)
+        ys[other] += ny * overlap * (1 - share)
+        # Only bounce if they are moving toward each other.
+        approach = (store.vx[i] - store.vx[j]) * nx + (store.vy[i] - store.vy[j]) * ny
+        if approach <= 0:
+            return
+        impulse = (1 + self.restitution) * approach / total_mass
+        store.vx[i] -= impulse * masses[other] * nx
+        store.vy[i] -= impulse * masses[other] * ny
+        store.vx[j] += impulse * masses[body] * nx
+        store.vy[j] += impulse * masses[body] * ny
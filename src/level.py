@@ -1,66 +1,77 @@
 from pathlib import Path
+from typing import Optional
 import sprites
 import utils
+import atlas as texture_atlas
+
+
+# Each level function puts its objects in the given entity store, or in the shared one if it isn't given one.
+
+# Load a level image, taking it from the texture atlas when one is given and holds it.
+def LoadImage(path: Path, atlas: Optional[texture_atlas.Atlas] = None):
+    if atlas is not None and path.name in atlas:
+        return atlas.image(path.name)
+    return utils.load_image(path, alpha=True)
 
 # The function to create and place obsracles for level 1.
-def SetLevelOneObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES):
-    asteroid_images = {name: utils.load_image(IMAGE_DIRECTORY / name, alpha=True)
+def SetLevelOneObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES,atlas=None,store=None):
+    asteroid_images = {name: LoadImage(IMAGE_DIRECTORY / name, atlas)
                        for name in ASTEROID_IMAGE_FILENAMES}
 
-    obstacles = [sprites.Obstacle((300, 250), asteroid_images["Asteroid_60.png"]),
-                 sprites.Obstacle((600, 450), asteroid_images["Asteroid_140.png"]),
-                 sprites.Obstacle((250, 900), asteroid_images["Asteroid_60.png"]),
-                 sprites.Obstacle((750, 550), asteroid_images["Asteroid_100.png"]),
-                 sprites.Obstacle((850, 1050), asteroid_images["Asteroid_100.png"]),
-                 sprites.Obstacle((1400, 900), asteroid_images["Asteroid_160.png"]),
-                 sprites.Obstacle((1500, 650), asteroid_images["Asteroid_60.png"]),
-                 sprites.Obstacle((1500, 1050), asteroid_images["Asteroid_100.png"]),
+    obstacles = [sprites.Obstacle((300, 250), asteroid_images["Asteroid_60.png"], store=store),
+                 sprites.Obstacle((600, 450), asteroid_images["Asteroid_140.png"], store=store),
+                 sprites.Obstacle((250, 900), asteroid_images["Asteroid_60.png"], store=store),
+                 sprites.Obstacle((750, 550), asteroid_images["Asteroid_100.png"], store=store),
+                 sprites.Obstacle((850, 1050), asteroid_images["Asteroid_100.png"], store=store),
+                 sprites.Obstacle((1400, 900), asteroid_images["Asteroid_160.png"], store=store),
+                 sprites.Obstacle((1500, 650), asteroid_images["Asteroid_60.png"], store=store),
+                 sprites.Obstacle((1500, 1050), asteroid_images["Asteroid_100.png"], store=store),
                  ]
 
     return obstacles
 
 
 # The function to create and place the items for level 1.
-def SetLevelOneItems(IMAGE_DIRECTORY):
-    fuel_item_image = utils.load_image(IMAGE_DIRECTORY / "Fire_ex.png", alpha=True)
-    exit_image = utils.load_image(IMAGE_DIRECTORY/ "Portal.png", alpha=True)
+def SetLevelOneItems(IMAGE_DIRECTORY,atlas=None,store=None):
+    fuel_item_image = LoadImage(IMAGE_DIRECTORY / "Fire_ex.png", atlas)
+    exit_image = LoadImage(IMAGE_DIRECTORY/ "Portal.png", atlas)
 
     items = [
-        sprites.Item((750, 1050), fuel_item_image),
-        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT)
+        sprites.Item((750, 1050), fuel_item_image, store=store),
+        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT, store=store)
     ]
     
     return items
 # The function to create and place obsracles for level 2.
-def SetLevelTwoObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES):
-    asteroid_images = {name: utils.load_image(IMAGE_DIRECTORY / name, alpha=True)
+def SetLevelTwoObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES,atlas=None,store=None):
+    asteroid_images = {name: LoadImage(IMAGE_DIRECTORY / name, atlas)
                        for name in ASTEROID_IMAGE_FILENAMES}
     obstacles = [
-                sprites.Obstacle((1200, 100), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1150, 250), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1150, 450), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1150, 650), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1150, 850), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1200, 1050), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((150, 1050), asteroid_images["Asteroid_100.png"]),
-                sprites.Obstacle((135, 900), asteroid_images["Asteroid_140.png"])
+                sprites.Obstacle((1200, 100), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1150, 250), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1150, 450), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1150, 650), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1150, 850), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1200, 1050), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((150, 1050), asteroid_images["Asteroid_100.png"], store=store),
+                sprites.Obstacle((135, 900), asteroid_images["Asteroid_140.png"], store=store)
                 
                 ]
 
     return obstacles
 
 # The function to create and place obsracles for level 2.
-def SetLevelTwoItems(IMAGE_DIRECTORY):
-    fuel_item_image = utils.load_image(IMAGE_DIRECTORY / "Fire_ex.png", alpha=True)
-    exit_image = utils.load_image(IMAGE_DIRECTORY/ "Portal.png", alpha=True)
-    teleporter_image = utils.load_image(IMAGE_DIRECTORY / "Teleporter.png", alpha=True)
+def SetLevelTwoItems(IMAGE_DIRECTORY,atlas=None,store=None):
+    fuel_item_image = LoadImage(IMAGE_DIRECTORY / "Fire_ex.png", atlas)
+    exit_image = LoadImage(IMAGE_DIRECTORY/ "Portal.png", atlas)
+    teleporter_image = LoadImage(IMAGE_DIRECTORY / "teleporter.png", atlas)
     
     # create teleporters
     teleporters = {
-        'A': sprites.Teleporter((900, 1070), teleporter_image, 'A'),
-        'B': sprites.Teleporter((1400, 1000), teleporter_image, 'B'),
-        # 'C': sprites.Teleporter((1100, 700), teleporter_image, 'C'),
-        # 'D': sprites.Teleporter((500, 200), teleporter_image, 'D')
+        'A': sprites.Teleporter((900, 1070), teleporter_image, 'A', store=store),
+        'B': sprites.Teleporter((1400, 1000), teleporter_image, 'B', store=store),
+        # 'C': sprites.Teleporter((1100, 700), teleporter_image, 'C', store=store),
+        # 'D': sprites.Teleporter((500, 200), teleporter_image, 'D', store=store)
     }  
 
     # links teleporters
@@ -71,45 +82,45 @@ def SetLevelTwoItems(IMAGE_DIRECTORY):
 
     
     items = [
-        sprites.Item((750, 1050), fuel_item_image),
-        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT),
+        sprites.Item((750, 1050), fuel_item_image, store=store),
+        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT, store=store),
         *teleporters.values()
     ]
 
     return items
 
 # The function to create and place obsracles for level 2.
-def SetLevelThreeObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES):
-    asteroid_images = {name: utils.load_image(IMAGE_DIRECTORY / name, alpha=True)
+def SetLevelThreeObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES,atlas=None,store=None):
+    asteroid_images = {name: LoadImage(IMAGE_DIRECTORY / name, atlas)
                        for name in ASTEROID_IMAGE_FILENAMES}
     obstacles = [
-                sprites.Obstacle((700, 100), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((650, 350), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((375, 500), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((1400, 1000), asteroid_images["Asteroid_100.png"]),
-                sprites.Obstacle((1550, 950), asteroid_images["Asteroid_100.png"]),
-                sprites.Obstacle((1350, 1150), asteroid_images["Asteroid_100.png"]),
-                sprites.Obstacle((100, 975), asteroid_images["Asteroid_160.png"]),
-                sprites.Obstacle((400, 1100), asteroid_images["Asteroid_160.png"]),
+                sprites.Obstacle((700, 100), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((650, 350), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((375, 500), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((1400, 1000), asteroid_images["Asteroid_100.png"], store=store),
+                sprites.Obstacle((1550, 950), asteroid_images["Asteroid_100.png"], store=store),
+                sprites.Obstacle((1350, 1150), asteroid_images["Asteroid_100.png"], store=store),
+                sprites.Obstacle((100, 975), asteroid_images["Asteroid_160.png"], store=store),
+                sprites.Obstacle((400, 1100), asteroid_images["Asteroid_160.png"], store=store),
                 
                 ]
 
     return obstacles
 
 # The function to create and place obsracles for level 2.
-def SetLevelThreeItems(IMAGE_DIRECTORY):
-    fuel_item_image = utils.load_image(IMAGE_DIRECTORY / "Fire_ex.png", alpha=True)
-    exit_image = utils.load_image(IMAGE_DIRECTORY/ "Portal.png", alpha=True)
-    teleporter_image = utils.load_image(IMAGE_DIRECTORY / "Teleporter.png", alpha=True)
+def SetLevelThreeItems(IMAGE_DIRECTORY,atlas=None,store=None):
+    fuel_item_image = LoadImage(IMAGE_DIRECTORY / "Fire_ex.png", atlas)
+    exit_image = LoadImage(IMAGE_DIRECTORY/ "Portal.png", atlas)
+    teleporter_image = LoadImage(IMAGE_DIRECTORY / "teleporter.png", atlas)
     
     # create teleporters
     teleporters = {
-        'A': sprites.Teleporter((600, 200), teleporter_image, 'A'),
-        'B': sprites.Teleporter((1300, 200), teleporter_image, 'B'),
-        'C':  sprites.Teleporter((500, 400), teleporter_image, 'C'),
-        'D':  sprites.Teleporter((1500, 1100), teleporter_image, 'D'),
-        'E':  sprites.Teleporter((150, 450), teleporter_image, 'E'),
-        'F':  sprites.Teleporter((200, 1150), teleporter_image, 'F'),
+        'A': sprites.Teleporter((600, 200), teleporter_image, 'A', store=store),
+        'B': sprites.Teleporter((1300, 200), teleporter_image, 'B', store=store),
+        'C':  sprites.Teleporter((500, 400), teleporter_image, 'C', store=store),
+        'D':  sprites.Teleporter((1500, 1100), teleporter_image, 'D', store=store),
+        'E':  sprites.Teleporter((150, 450), teleporter_image, 'E', store=store),
+        'F':  sprites.Teleporter((200, 1150), teleporter_image, 'F', store=store),
 
     }  
 
@@ -124,8 +135,8 @@ def SetLevelThreeItems(IMAGE_DIRECTORY):
     teleporters['F'].link(teleporters['E'])
     
     items = [
-        sprites.Item((800, 600), fuel_item_image),
-        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT),
+        sprites.Item((800, 600), fuel_item_image, store=store),
+        sprites.Item((1450,300),exit_image,sprites.ItemType.EXIT, store=store),
         *teleporters.values()
     ]
 
@@ -7,10 +7,11 @@
 
 # Standard library imports.
 import sys  # This module provides information about the system and enables us to terminate the program.
-from pathlib import Path  # This module allows object-oriented filesystem interaction.
-import random  # Random number generation.
 import math  # C-style math functions.
 import functools  # Don't worry about this import. It's advanced.
+import logging  # Used to report what the quality governor changes.
+import threading  # Used to tell whether the simulation thread is asking to quit.
+from typing import NamedTuple, Optional
 
 # Third-party library imports.
 # I am abbreviating `pygame` here to `pg` because it will be used a lot.
@@ -19,38 +20,67 @@ import pygame as pg
 
 # Local library imports.
 from colors import *
+from resources import *  # The sizes, paths, and image lists, which netplay.py shares.
 import utils
 import sprites
-import level
 import webbrowser
 import menu
+import entities
+import governor
+import gravity
+import minimap
+import throttle
+import pipeline
+import snapshots
 
 # Constants.
 FPS = 0  # Set to 0 for unbounded frame-rate. Setting this to 60 will limit the game to 60 fps.
-SCREEN_SIZE = pg.Vector2(800, 600)  # This is a Vector2 to enable easy mathematical operations later.
-
-APPLICATION_DIRECTORY = Path(__file__, "../..").resolve()  # This is the top level folder of the project.
-IMAGE_DIRECTORY = APPLICATION_DIRECTORY / "images"  # The path to the folder of images.
-SOUND_DIRECTORY = APPLICATION_DIRECTORY / "sounds"  # The path to the folder of sounds and music.
-FONT_PATH = APPLICATION_DIRECTORY / "kenney_font.ttf"  # The path to the font file.
-
-ASTEROID_IMAGE_FILENAMES = (  # The file names of the asteroid images.
-    "Asteroid_60.png",
-    "Asteroid_100.png",
-    "Asteroid_140.png",
-    "Asteroid_160.png",
-)
-BACKGROUND_IMAGE_FILENAME = "Level Design/Background.png"
-
-FUEL_LEVEL_TEXT_POS = pg.Vector2(32, 50)
+DYNAMIC_ASTEROIDS = False  # Set to True to make the asteroids drift and pull on each other and the player.
+TARGET_FRAME_TIME = 1 / 60  # The quality governor lowers quality when frames take longer than this, in seconds.
+# The world can be drawn at a lower resolution and stretched to fill the screen, trading sharpness for frame-rate.
+# 1 draws at full resolution. 0.5 draws a quarter of the pixels. The HUD is always drawn at full resolution.
+RENDER_SCALE = 1.0
+# Simulate the next frame on another thread while this one is drawn. Each frame shows up one frame later.
+# This is experimental. It hasn't been measured to be faster yet, and is slower on one core. See pipeline.py.
+PIPELINED_RENDERING = False
+RESIZABLE_WINDOW = False  # Let the window be resized. The game is stretched to fit, without drawing more pixels.
+
+SMOKE_BURST = 8  # Smoke particles released at once when the extinguisher opens.
+IMAGE_CACHE_BUDGET = 32 * 1024 * 1024  # The bytes of cached images (particles, text, etc.) all caches may share.
+
+MINIMAP_SIZE = pg.Vector2(160, 120)  # The size of the minimap, in pixels.
+MINIMAP_POS = SCREEN_SIZE - MINIMAP_SIZE - (10, 10)  # The minimap goes in the bottom-right corner.
 FUEL_LEVEL_IMAGE_POS = pg.Vector2(10, 25)
 
+
+class Frame(NamedTuple):
+    """Everything needed to draw one frame. It holds copies, so the game can move on while it is being drawn."""
+    blits: tuple  # The sorted contents of the render queue.
+    camera: pg.Vector2
+    player_pos: pg.Vector2
+    player_angle: float
+    tank_level: float
+    timer: int
+    debug: bool
+    show_minimap: bool
+    paused: bool
+    quality: governor.QualityLevel
+    picked_up: tuple  # The items picked up this frame, which must come off the minimap.
+    minimap_items: Optional[tuple]  # Every item on the minimap, when some came back after going to an earlier state.
+    obstacle_positions: Optional[tuple]  # Where the asteroids are, if they move.
+
+
 # Helpful application functions.
 def terminate() -> None:
     """Terminate the application safely.
 
     This is where you would save the game or generally ensure clean termination.
     """
+    # Pygame can only be shut down by the main thread.
+    # When the simulation thread wants to quit, the exit is raised again on the main thread,
+    # and pygame quits by itself when Python exits.
+    if threading.current_thread() is not threading.main_thread():
+        raise SystemExit
     # Quit pygame to close the window and free system resources.
     pg.quit()
     # Terminate python execution.
@@ -59,13 +89,26 @@ def terminate() -> None:
 
 def main(levelnum) -> None:
     """This is the main application code."""
+    # Show the quality governor's decisions in the console.
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
     # Pygame must be initialized before anything can be done with it.
     pg.init()
     pg.mixer.init()
 
     #Set game clock and start time
     timer = 60
-    game_clock = utils.Timer(1000)
+    # Everything in the game runs on the game clock, which starts over for each level.
+    # It can be paused or slowed down without the wall clock getting in the way.
+    utils.GAME_CLOCK.reset()
+
+    def count_down_timer():
+        nonlocal timer
+        timer -= 1
+        if timer < 0:
+            terminate()
+
+    # The level timer counts down once per second of game time.
+    utils.GAME_CLOCK.schedule(1, count_down_timer, 1)
     
     # Load in the sounds and music.
     hit_sound = pg.mixer.Sound(SOUND_DIRECTORY / "mixkit-boxer-getting-hit-2055.wav")
@@ -85,7 +128,8 @@ def main(levelnum) -> None:
 
     # Create the main window.
     # Don't worry about the other arguments to this function.
-    screen = pg.display.set_mode(SCREEN_SIZE)
+    # `SCALED` keeps the screen Surface at SCREEN_SIZE no matter the window size, and stretches it to fit.
+    screen = pg.display.set_mode(SCREEN_SIZE, pg.SCALED | pg.RESIZABLE if RESIZABLE_WINDOW else 0)
     # Create the Clock object, which will keep track of frame-rate and delta-time.
     clock = pg.time.Clock()
     # Debug variable.
@@ -94,14 +138,28 @@ def main(levelnum) -> None:
     debug_font = pg.Font(None, 24)
     # Create a nice font.
     kenney_font = pg.Font(FONT_PATH, 18)
+    # Rendering text is slow, and the HUD text rarely changes, so the rendered text is cached.
+    # All the image caches share one memory budget.
+    utils.IMAGE_CACHES.budget = IMAGE_CACHE_BUDGET
+    tank_text_cache = utils.ImageCache(lambda text: kenney_font.render(text, True, RED), "tank text")
+    timer_text_cache = utils.ImageCache(lambda text: debug_font.render(text, True, WHITE, BLACK), "timer text")
     # Create the game bounds (width and height).
-    game_size = pg.Vector2(1600, 1200)
+    game_size = pg.Vector2(GAME_SIZE)
     # Get the background image.
     background_image = utils.load_image(IMAGE_DIRECTORY / BACKGROUND_IMAGE_FILENAME)
+    # When the world is drawn at a lower resolution, it is drawn here first and then stretched onto the screen.
+    if RENDER_SCALE != 1:
+        world_surface = pg.Surface(SCREEN_SIZE * RENDER_SCALE).convert()
+        background_image = pg.transform.scale_by(background_image, RENDER_SCALE)
+    else:
+        world_surface = screen
+    # Pack the small images into a texture atlas, and map in the pre-rotated frames and collision masks.
+    # Both are cached on disk, so this is fast after the first run.
+    texture_atlas, sprite_bake = load_images()
 
     # Create the player object.
     # Center it in the middle of the screen.
-    player = sprites.Player(SCREEN_SIZE // 2, utils.load_image(IMAGE_DIRECTORY / "astro.png", alpha=True))
+    player = sprites.Player(SCREEN_SIZE // 2, texture_atlas.image("astro.png"))
     player_angle_vector = pg.Vector2()  # Used for vector math to draw the player angle debug line.
 
     # This variable helps track the movement events to swap between mouse and keyboard.
@@ -111,57 +169,166 @@ def main(levelnum) -> None:
     using_keyboard = False
 
     # Create and place the obstacles depending on the level.
-    if levelnum == 1:
-        obstacles = level.SetLevelOneObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES)
-        items = level.SetLevelOneItems(IMAGE_DIRECTORY)
-    if levelnum == 2:
-        obstacles = level.SetLevelTwoObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES)
-        items = level.SetLevelTwoItems(IMAGE_DIRECTORY)
-    if levelnum == 3:
-        obstacles = level.SetLevelThreeObstacles(IMAGE_DIRECTORY,ASTEROID_IMAGE_FILENAMES)
-        items = level.SetLevelThreeItems(IMAGE_DIRECTORY)
+    # Their numbers are kept in the level's own entity store, which goes away with the level.
+    world = entities.EntityStore()
+    obstacles, items = make_level(levelnum, texture_atlas, world)
 
+    # In dynamic asteroid mode, the asteroids are simulated with real gravity.
+    asteroid_gravity = None
+    if DYNAMIC_ASTEROIDS:
+        asteroid_gravity = gravity.AsteroidGravity(game_size, restitution=sprites.ASTEROID_BOUNCE)
+        asteroid_gravity.start_drifting(obstacles)
 
     # I'm creating a ParticleGroup here.
     # Don't worry if you don't understand, I'll handle all the particle code.
     make_smoke_circle_image = functools.partial(utils.make_circle_image, color=SMOKE)
-    smoke_particles = utils.ParticleGroup(utils.ImageCache(make_smoke_circle_image), pg.BLEND_ADD)
-    portal_dust_image = utils.load_image(IMAGE_DIRECTORY / "Portal Dust.png", alpha=True)
-    portal_particles = utils.ParticleGroup(utils.ImageCache(lambda _: portal_dust_image))
-
-    portal_dust_spawn_timer = utils.Timer(100)
+    smoke_particles = utils.ParticleGroup(utils.ImageCache(make_smoke_circle_image, "smoke particles"), pg.BLEND_ADD)
+    portal_dust_image = texture_atlas.image("Portal Dust.png")
+    portal_particles = utils.ParticleGroup(utils.ImageCache(lambda _: portal_dust_image, "portal dust"))
+
+    # Particle emitters release particles at a steady rate per second, so the amount of smoke and dust
+    # doesn't depend on the frame-rate.
+    # Their random numbers come from the game's own generator, which the snapshots keep, so rewinding
+    # brings back the same smoke.
+    rng = utils.GAME_RANDOM
+
+    def make_smoke_particle(pos: pg.Vector2) -> utils.SmokeParticle:
+        # Smoke sprays out of the extinguisher, opposite to the direction of thrust.
+        vel_vector = pg.Vector2()
+        vel_vector.from_polar((rng.randint(150, 200), (player.angle + rng.randint(-20, 20) % 360)))
+        return utils.SmokeParticle(pos, vel_vector + player.vel, rng.randint(3, 5), rng)
+
+    def make_portal_dust_emitter(portal: sprites.Item) -> utils.ParticleEmitter:
+        # Dust appears in a ring around the portal and gets sucked in.
+        def make_portal_particle(pos: pg.Vector2) -> utils.PortalParticle:
+            spawn_pos = pg.Vector2()
+            spawn_pos.from_polar((rng.randint(50, 100), rng.randrange(360)))
+            return utils.PortalParticle(pos + spawn_pos, pos)
+        return utils.ParticleEmitter(portal_particles, make_portal_particle, 0, portal.pos)
+
+    smoke_emitter = utils.ParticleEmitter(smoke_particles, make_smoke_particle, SMOKE_EMISSION_RATE, player.pos)
+    portal_dust_emitters = {item: make_portal_dust_emitter(item) for item in items
+                            if item.type is sprites.ItemType.EXIT}
+
+    # The minimap shows the whole level. Press M to hide or show it.
+    level_minimap = minimap.Minimap(MINIMAP_SIZE, game_size, obstacles, items, asteroid_gravity is not None)
+    show_minimap = True
+
+    # All the world sprites are drawn through this queue.
+    render_queue = utils.RenderQueue(RENDER_SCALE)
+
+    # The quality governor turns down particles, rotation smoothness, etc. when the game runs slowly.
+    quality_governor = governor.QualityGovernor(TARGET_FRAME_TIME)
+    # The idle throttle stops the game and slows the loop down while the window is in the background or minimized.
+    idle_throttle = throttle.IdleThrottle()
 
     # Starting tank level.
     tank_level = sprites.TANK_MAX
 
     # The tank image.
-    tank_image = utils.load_image(IMAGE_DIRECTORY / "tank_bar2.png", alpha=True)
-    tank_fill_image = utils.load_image(IMAGE_DIRECTORY / "tank_fill.png", alpha=True)
+    tank_image = texture_atlas.image("tank_bar2.png")
+    tank_fill_image = texture_atlas.image("tank_fill.png")
     tank_fill_bg_image = pg.mask.from_surface(tank_fill_image).to_surface(setcolor=TANK_BG_COLOR,
                                                                           unsetcolor=TRANS_BLACK).convert_alpha()
 
-    # Enter the game loop.
-    while True:
-        # Get the delta-time and fps.
-        # I am abbreviating delta-time here to `dt` because it will be used often.
-        # `dt` is the number of seconds that passed since last frame.
-        # `clock.tick(FPS)` returns the elapsed milliseconds, so we divide by 1000.0 to get the seconds.
-        # This makes the velocities of our objects easier to reason with.
-        dt = clock.tick(FPS) / 1000.0
-        fps = clock.get_fps()  # This is the average frames-per-second over the last ten frames.
+    # Snapshots of the whole game state, for rewinding (hold BACKSPACE), checkpoints (F5 saves, F9 loads),
+    # and restarting the level (R). None of them load anything, they only put the numbers back.
+    game_snapshots = snapshots.GameSnapshots(player, world, [smoke_emitter], rng=rng)
+    level_items = list(items)  # Every item, including picked up ones, so going back can return them.
+    level_start_state = game_snapshots.capture(tank_level, timer)
+    game_snapshots.recent.push(level_start_state)
+    checkpoint_state: Optional[bytes] = None
+    minimap_items: Optional[tuple] = None  # Set when the items change by going back, to redraw the minimap.
+
+    def restore_state(state: bytes):
+        """Put the game back in a captured state and bring the level's lists in line with it."""
+        nonlocal tank_level, timer, minimap_items
+        was_pushing = player.pushing
+        tank_level, timer = game_snapshots.restore(state)
+        # Start or stop the extinguisher sound if the restored state disagrees with it.
+        if player.pushing != was_pushing:
+            frame_pipeline.call_on_main_thread(fire_extinguisher_sound.play if player.pushing
+                                               else fire_extinguisher_sound.stop)
+        # Restoring drops the scheduled calls. The level timer counts down on whole seconds of game time.
+        utils.GAME_CLOCK.schedule(1 - utils.GAME_CLOCK.time % 1, count_down_timer, 1)
+        present = [item for item in level_items if world.alive[item.index]]
+        if present != items:
+            items[:] = present
+            minimap_items = tuple(items)
+            for item in list(portal_dust_emitters):
+                if item not in items:
+                    del portal_dust_emitters[item]
+            for item in items:
+                if item.type is sprites.ItemType.EXIT and item not in portal_dust_emitters:
+                    portal_dust_emitters[item] = make_portal_dust_emitter(item)
+        for obstacle in obstacles:
+            obstacle.update_rects()
+
+    # Each frame is split in two: `simulate` moves the game forward and returns a Frame, and `render` draws it.
+    # Only `render` touches the screen, and it only reads the Frame and images that never change,
+    # so in pipelined mode it can draw one frame while `simulate` works on the next one on another thread.
+    # The mixer isn't safe to use from that thread, so `simulate` asks the pipeline to make its sound calls
+    # on the main thread.
+    def simulate(real_dt: float, events: list[pg.event.Event], keys: pg.key.ScancodeWrapper,
+                 mouse_pos: tuple[int, int]) -> Optional[Frame]:
+        """Run the game for one frame and return what to draw, or None if nothing needs to be drawn."""
+        nonlocal debug, show_minimap, using_keyboard, tank_level, checkpoint_state, minimap_items
+        # Hold BACKSPACE to rewind. Game time stands still while rewinding.
+        rewinding = bool(keys[pg.K_BACKSPACE])
+        # The game clock turns the real time into game time, which is 0 while paused.
+        # It also runs any timers that came due, like the level timer.
+        dt = utils.GAME_CLOCK.advance(0.0 if rewinding else real_dt)
+        # Let the quality governor react to the frame time and apply its current settings.
+        # It is given the time the last frame took to simulate and draw, without the frame-rate cap's sleep,
+        # or a machine keeping up easily at 60 fps would look like it is only just making a 1/60 s target.
+        # The slow idle frames are on purpose, so they must not lower the quality.
+        if not idle_throttle.idle:
+            quality_governor.update(frame_pipeline.work_time, real_dt)
+        quality = quality_governor.settings
+        smoke_particles.max_particles = quality.max_smoke_particles
+        smoke_emitter.rate_scale = quality.smoke_emission
+        for emitter in portal_dust_emitters.values():
+            emitter.rate = quality.portal_dust_rate
         # Handle events.
-        # Pygame provides a queue of events that occurred last frame that we can iterate over.
-        for event in pg.event.get():
+        for event in events:
 
             # `QUIT` is sent when the user hits the X button to close the window.
             if event.type == pg.QUIT:
                 terminate()
 
+            # Go idle when the window loses focus or is minimized, and come back when it returns.
+            if idle_throttle.handle_event(event):
+                if idle_throttle.idle:
+                    # The key or button release would be sent to another window, so let go of the extinguisher now.
+                    player.pushing = False
+                    frame_pipeline.call_on_main_thread(fire_extinguisher_sound.stop)
+                    frame_pipeline.call_on_main_thread(pg.mixer.pause)
+                else:
+                    frame_pipeline.call_on_main_thread(pg.mixer.unpause)
+
             if event.type == pg.KEYDOWN:
                 # Toggle debug mode.
                 if event.key == pg.K_F3:
                     debug = not debug
 
+                # Hide or show the minimap.
+                if event.key == pg.K_m:
+                    show_minimap = not show_minimap
+
+                # Pause or unpause the game.
+                if event.key == pg.K_p:
+                    utils.GAME_CLOCK.paused = not utils.GAME_CLOCK.paused
+
+                # Save a checkpoint, go back to it, or restart the level.
+                if event.key == pg.K_F5:
+                    checkpoint_state = game_snapshots.capture(tank_level, timer)
+                if event.key == pg.K_F9 and checkpoint_state is not None:
+                    restore_state(checkpoint_state)
+                if event.key == pg.K_r:
+                    restore_state(level_start_state)
+                    game_snapshots.recent.clear()
+                    game_snapshots.recent.push(level_start_state)
+
                 if event.key == pg.K_ESCAPE:
                     # The ESCAPE key should bring up a pause menu or something, but we don't have one.
                     # For the time being, we'll just terminate the application.
@@ -170,13 +337,15 @@ def main(levelnum) -> None:
                 if event.key in (pg.K_UP, pg.K_w):
                     # The user wants to use the extinguisher.
                     player.pushing = True
-                    fire_extinguisher_sound.play()
+                    frame_pipeline.call_on_main_thread(fire_extinguisher_sound.play)
+                    if tank_level > 0:
+                        smoke_emitter.burst(SMOKE_BURST, player.pos)
 
             if event.type == pg.KEYUP:
                 if event.key in (pg.K_UP, pg.K_w):
                     # The user wants to stop using the extinguisher.
                     player.pushing = False
-                    fire_extinguisher_sound.stop()
+                    frame_pipeline.call_on_main_thread(fire_extinguisher_sound.stop)
 
             if event.type == pg.MOUSEMOTION:
                 # User wants to use the mouse to move the player.
@@ -186,13 +355,20 @@ def main(levelnum) -> None:
                 if event.button == 1:  # Button 1 is the left mouse button.
                     # The user wants to use the extinguisher.
                     player.pushing = True
-                    fire_extinguisher_sound.play()
+                    frame_pipeline.call_on_main_thread(fire_extinguisher_sound.play)
+                    if tank_level > 0:
+                        smoke_emitter.burst(SMOKE_BURST, player.pos)
 
             if event.type == pg.MOUSEBUTTONUP:
                 if event.button == 1:  # Button 1 is the left mouse button.
                     # The user wants to stop using the extinguisher.
                     player.pushing = False
-                    fire_extinguisher_sound.stop()
+                    frame_pipeline.call_on_main_thread(fire_extinguisher_sound.stop)
+
+        # Rewind one recorded frame for every frame BACKSPACE is held. Nothing moves while rewinding,
+        # so the state is put back exactly as it was recorded. At the oldest state there is nothing to put back.
+        if rewinding and (state := game_snapshots.previous()) is not None:
+            restore_state(state)
 
         # This is another way of handling events.
         # Choosing this method over the other depends on your use case.
@@ -200,7 +376,6 @@ def main(levelnum) -> None:
         # but it can miss multiple small presses between frames.
         # We plan on the frame-rate being as high as possible, so this code saves us some state variables
         # that we would otherwise have to use with the event queue.
-        keys = pg.key.get_pressed()
         if keys[pg.K_LEFT] or keys[pg.K_a]:
             # The user wants to rotate the player angle counterclockwise.
             player.rotate(-sprites.PLAYER_ROTATE_SPEED * dt, obstacles)
@@ -216,7 +391,7 @@ def main(levelnum) -> None:
         if not using_keyboard:
             # Get the desired angle.
             # This is based on the screen center, not on the player position within the screen.
-            desired_angle = pg.Vector2().angle_to(pg.mouse.get_pos() - (SCREEN_SIZE // 2)) % 360
+            desired_angle = pg.Vector2().angle_to(mouse_pos - (SCREEN_SIZE // 2)) % 360
             dist = desired_angle - player.angle  # One of the two modulo distances.
             abs_dist = math.fabs(dist)  # Precalculate this value for later equations.
             # If the shortest modulo distance is too small, don't rotate. This reduces jitter.
@@ -227,12 +402,6 @@ def main(levelnum) -> None:
 
         # Update everything.
 
-        #update timer
-        if game_clock.tick():
-            timer -= 1
-            if timer < 0:
-                terminate()
-
         # Update the tank.
         if player.pushing:
             tank_level -= sprites.TANK_DECREASE * dt
@@ -240,21 +409,30 @@ def main(levelnum) -> None:
                 tank_level = 0
                 player.pushing = False
 
-        # Add smoke particles if extinguisher is active.
-        if player.pushing:
-            vel_vector = pg.Vector2()
-            vel_vector.from_polar((random.randint(150, 200), (player.angle + random.randint(-20, 20) % 360)))
-            smoke_particles.add(utils.SmokeParticle(player.pos, vel_vector + player.vel, random.randint(3, 5)))
+        # Move the asteroids if they're simulated, and find their pull on the player.
+        player_gravity = None
+        if asteroid_gravity is not None:
+            asteroid_gravity.step(dt, obstacles)
+            for obstacle in obstacles:
+                obstacle.update_rects()
+            player_gravity = asteroid_gravity.acceleration_at(player.pos)
 
         # Update the player, playing hit sound if needed.
-        if player.update(dt, game_size, obstacles):
-            hit_sound.play()
+        if not rewinding and player.update(dt, game_size, obstacles, player_gravity):
+            frame_pipeline.call_on_main_thread(hit_sound.play)
+
+        # Add smoke particles along the player's path if extinguisher is active.
+        smoke_emitter.update(dt, player.pos, player.pushing)
 
         # Test for item collision.
+        picked_up = []
         for item in items[:]:  # Loop over a copy of the list because we will be removing items.
             # Using squared distance is faster.
             if item.pos.distance_squared_to(player.pos) < sprites.PLAYER_PICKUP_RANGE ** 2 and not isinstance(item, sprites.Teleporter):
                 items.remove(item)  # De-spawn the item.
+                item.kill()
+                portal_dust_emitters.pop(item, None)
+                picked_up.append(item)
                 # Activate item effects.
                 if item.type is sprites.ItemType.FUEL:
                     tank_level = sprites.TANK_MAX
@@ -262,13 +440,16 @@ def main(levelnum) -> None:
                 if item.type is sprites.ItemType.EXIT:
                     terminate()
 
-        # Update the obstacles.
+        # Rotate everything and count down the teleporter cooldowns in one pass over the entity store.
+        world.update(dt)
+
+        # Update the obstacle images.
         for obstacle in obstacles:
-            obstacle.update(dt)
+            obstacle.update_image(quality.rotation_step)
 
-        # Update the items.
+        # Update the item images.
         for item in items:
-            item.update(dt)
+            item.update_image(quality.rotation_step)
 
         # Check for player interaction with teleporters
         for item in items:
@@ -278,78 +459,111 @@ def main(levelnum) -> None:
 
 
         # Spawn portal dust.
-        if portal_dust_spawn_timer.tick():
-            for item in items:
-                if item.type is sprites.ItemType.EXIT:
-                    spawn_pos = pg.Vector2()
-                    spawn_pos.from_polar((random.randint(50, 100), random.randrange(360)))
-                    portal_particles.add(utils.PortalParticle(item.pos + spawn_pos, item.pos))
+        for portal, emitter in portal_dust_emitters.items():
+            emitter.update(dt, portal.pos)
 
         # Update the particles.
         smoke_particles.update(dt)
         portal_particles.update(dt)
 
+        # Record the state for rewinding. A paused frame would only record the same state again.
+        if dt:
+            game_snapshots.record(tank_level, timer)
+
         # Update the camera.
         camera = pg.Vector2(SCREEN_SIZE) // 2 - player.pos
 
-        # Draw everything to the screen.
-
-        # Clear the screen completely by pasting the background image.
-        screen.blit(background_image, (0, 0))
+        # Nobody can see a minimized window, so skip drawing and go straight to the next frame.
+        if not idle_throttle.visible:
+            return None
 
-        # Draw the obstacles.
-        # There are faster and more efficient ways to create and draw the obstacle images,
-        # but I'm going the simple route for clarity.
+        # Submit the obstacles.
+        # Sprites don't draw themselves directly, they submit their images to the render queue.
+        # The queue sorts everything by layer and blend mode and draws it with a few `fblits` calls.
         for obstacle in obstacles:
-            obstacle.draw(screen, camera)
+            obstacle.draw(render_queue, camera)
             # Draw the collision circles.
-            if debug:
+            if debug and quality.debug_overlays:
                 # pg.draw.circle(screen, CYAN, obstacle.pos + camera, obstacle.radius, 1)
-                screen.blit(obstacle.mask_image, obstacle.mask_rect.topleft + camera)
+                render_queue.submit(obstacle.mask_image, obstacle.mask_rect.topleft + camera, sprites.DEBUG_LAYER)
 
-        # Draw each of the items.
+        # Submit each of the items.
         for item in items:
-            item.draw(screen, camera)
+            item.draw(render_queue, camera)
 
-        # Draw the player.
-        player.draw(screen, camera)
-        # Draw the hit box and player angle.
-        if debug:
-            # pg.draw.circle(screen, CYAN, player.pos + camera, player.radius, 1)
-            screen.blit(player.mask_image, player.rect.topleft + camera)
-            pg.draw.circle(screen, RED, player.pos + camera, sprites.PLAYER_PICKUP_RANGE, 1)
-            player_angle_vector.from_polar((30, player.angle))
-            pg.draw.line(screen, RED, player.pos + camera, player.pos + player_angle_vector + camera, 3)
+        # Submit the player.
+        player.draw(render_queue, camera)
+        if debug and quality.debug_overlays:
+            render_queue.submit(player.mask_image, player.rect.topleft + camera, sprites.DEBUG_LAYER)
+
+        # Submit the particles.
+        smoke_particles.submit(render_queue, camera, sprites.PARTICLE_LAYER)
+        portal_particles.submit(render_queue, camera, sprites.PARTICLE_LAYER)
+
+        # Hand over everything that was submitted, plus copies of what the HUD shows.
+        changed_minimap_items, minimap_items = minimap_items, None
+        return Frame(render_queue.take(), camera, pg.Vector2(player.pos), player.angle, tank_level, timer, debug, show_minimap,
+                     utils.GAME_CLOCK.paused, quality, tuple(picked_up), changed_minimap_items,
+                     tuple(obstacle.pos for obstacle in obstacles) if asteroid_gravity is not None else None)
+
+    def render(frame: Frame):
+        """Draw a frame returned by ``simulate``."""
+        # Draw everything to the screen.
+
+        # Clear the screen completely by pasting the background image.
+        world_surface.blit(background_image, (0, 0))
 
-        # Draw the particles.
-        smoke_particles.draw(screen, camera)
-        portal_particles.draw(screen, camera)
+        # Draw everything that was submitted.
+        render_queue.draw(world_surface, frame.blits)
+        # Stretch the lower resolution world to fill the screen.
+        # Passing the screen as the destination saves making a new Surface every frame.
+        if world_surface is not screen:
+            pg.transform.scale(world_surface, screen.get_size(), screen)
+
+        # Draw the pickup range and player angle.
+        if frame.debug:
+            # pg.draw.circle(screen, CYAN, player.pos + camera, player.radius, 1)
+            pg.draw.circle(screen, RED, frame.player_pos + frame.camera, sprites.PLAYER_PICKUP_RANGE, 1)
+            player_angle_vector.from_polar((30, frame.player_angle))
+            pg.draw.line(screen, RED, frame.player_pos + frame.camera,
+                         frame.player_pos + player_angle_vector + frame.camera, 3)
 
         # The game boundaries.
-        pg.draw.rect(screen, GAME_BORDER, (*camera, *game_size), 10)
+        pg.draw.rect(screen, GAME_BORDER, (*frame.camera, *game_size), 10)
 
         # Draw the tank bar.
         # draw_tank_bar(tank_level, screen)
         # Render the image tank bar.
         screen.blit(tank_fill_bg_image, FUEL_LEVEL_IMAGE_POS)
-        bar_width = tank_image.get_width() * (tank_level / sprites.TANK_MAX)
+        bar_width = tank_image.get_width() * (frame.tank_level / sprites.TANK_MAX)
         screen.blit(tank_fill_image.subsurface(0, 0, bar_width, tank_fill_image.get_height()), FUEL_LEVEL_IMAGE_POS)
         screen.blit(tank_image, FUEL_LEVEL_IMAGE_POS)
         # Display tank level as text.
-        if tank_level == sprites.TANK_MAX:
+        if frame.tank_level == sprites.TANK_MAX:
             tank_text = "Tank: FULL"
-        elif tank_level <= 0:
+        elif frame.tank_level <= 0:
             tank_text = "Tank: EMPTY"
         else:
-            tank_text = f"Tank: {int(tank_level)}/{sprites.TANK_MAX}"
-        tank_text_surf = kenney_font.render(tank_text, True, RED)
+            tank_text = f"Tank: {int(frame.tank_level)}/{sprites.TANK_MAX}"
+        tank_text_surf = tank_text_cache.get_image(tank_text)
         screen.blit(tank_text_surf, FUEL_LEVEL_TEXT_POS)
 
-        timer_surf = debug_font.render(f"Time:{timer} ",True, WHITE, BLACK)
+        timer_surf = timer_text_cache.get_image(f"Time:{frame.timer} ")
         screen.blit(timer_surf,(700,45))
+        # The minimap is only touched by the drawing code, so the picked up items are taken off it here.
+        if frame.minimap_items is not None:
+            level_minimap.set_items(frame.minimap_items)
+        for item in frame.picked_up:
+            level_minimap.remove_item(item)
+        if frame.show_minimap:
+            level_minimap.draw(screen, MINIMAP_POS, frame.player_pos, SCREEN_SIZE, frame.obstacle_positions)
+        if frame.paused:
+            paused_surf = tank_text_cache.get_image("PAUSED")
+            screen.blit(paused_surf, paused_surf.get_rect(center=SCREEN_SIZE // 2))
 
         # Show the fps.
-        if debug:
+        if frame.debug:
+            fps = clock.get_fps()  # This is the average frames-per-second over the last ten frames.
             # Read the documentation to see how to render text.
             # The `font.render` method returns a `pygame.Surface` object, which is like an image.
             fps_surf = debug_font.render(f"FPS: {fps:.2f}", True, WHITE, BLACK)
@@ -362,12 +576,54 @@ def main(levelnum) -> None:
             # image is pasted from its upper-left corner. We shift the image up (by subtracting from the y) by its
             # height, so it is visible.
             screen.blit(fps_surf, (0, SCREEN_SIZE.y - fps_surf.get_height()))
-            
+
+            # The rest of the debug lines are stacked upward from the fps.
+            # They read counters straight from objects the simulation thread updates. A number that is
+            # a frame ahead only shows up in this text, so they aren't copied into the Frame.
+            cache_stats = utils.IMAGE_CACHES.report().values()
+            hits = sum(stats["hits"] for stats in cache_stats)
+            lookups = hits + sum(stats["misses"] for stats in cache_stats)
+            debug_lines = (
+                # How much work the render queue did.
+                f"Draw calls: {render_queue.draw_calls} ({render_queue.blit_count} blits)",
+                # How much memory the image caches use, and how often they already had the image.
+                f"Image caches: {utils.IMAGE_CACHES.total_bytes // 1024} KB, {hits / max(lookups, 1):.1%} hits",
+                # The quality level the governor picked.
+                f"Quality: {frame.quality.name}",
+                # The CPU time the idle throttle saved while the window was in the background.
+                f"Idle CPU saved: {idle_throttle.saved_cpu:.1f} s",
+                # How many frames can be rewound, and the memory they use.
+                f"Rewind: {len(game_snapshots.recent)} frames of {game_snapshots.record_size} bytes "
+                f"({game_snapshots.recent.capacity} max)",
+                # How long each half of the frame took, and whether they overlap.
+                f"{'Pipelined' if frame_pipeline.pipelined else 'Serial'}: simulate "
+                f"{frame_pipeline.simulate_time * 1000:.1f} ms, render {frame_pipeline.render_time * 1000:.1f} ms",
+            )
+            debug_line_y = SCREEN_SIZE.y - fps_surf.get_height()
+            for line in debug_lines:
+                line_surf = debug_font.render(line, True, WHITE, BLACK)
+                debug_line_y -= line_surf.get_height()
+                screen.blit(line_surf, (0, debug_line_y))
 
         # Show the screen.
         # Nothing we just drew is visible yet, so we flip the surface buffers to update the screen.
         pg.display.flip()
 
+    frame_pipeline = pipeline.FramePipeline(simulate, render, PIPELINED_RENDERING)
+
+    # Enter the game loop.
+    while True:
+        # Get the delta-time.
+        # I am abbreviating delta-time here to `dt` because it will be used often.
+        # `dt` is the number of seconds that passed since last frame.
+        # `clock.tick(FPS)` returns the elapsed milliseconds, so we divide by 1000.0 to get the seconds.
+        # This makes the velocities of our objects easier to reason with.
+        # The idle throttle waits longer while nobody is looking at the window.
+        real_dt = idle_throttle.tick(clock, FPS)
+        # Pygame provides a queue of events that occurred last frame that we can iterate over.
+        # Events and input can only be read by the main thread, so they are read here and handed to `simulate`.
+        frame_pipeline.run(real_dt, pg.event.get(), pg.key.get_pressed(), pg.mouse.get_pos())
+
         # That was one frame. Now we go back up to the top and handle events for the next frame!
 
 
@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+# This file holds the minimap, a small overview of the whole level drawn in a corner of the screen.
+
+# Standard library imports.
+from typing import Sequence, Iterable, Optional
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+from colors import *
+import sprites
+
+# Constants.
+MINIMAP_ITEM_RADIUS = 3  # The radius of item and teleporter markers, in minimap pixels.
+MINIMAP_PLAYER_RADIUS = 3  # The radius of the player marker, in minimap pixels.
+
+
+class Minimap:
+    """A scaled-down map of the level.
+
+    Everything that doesn't move is drawn once onto a cached Surface. Each frame only the player,
+    the view rectangle, and any moving asteroids are drawn on top of it.
+    When an item is removed, only the part of the cache under it is redrawn.
+    """
+    def __init__(self, size: Sequence[int], game_size: Sequence[float], obstacles: Sequence[sprites.Obstacle],
+                 items: Iterable[sprites.Item | sprites.Teleporter], moving_obstacles: bool = False):
+        """If ``moving_obstacles`` is True, the asteroids are drawn every frame instead of being cached."""
+        self.size = pg.Vector2(size)  # noqa
+        self.scale = min(self.size.x / game_size[0], self.size.y / game_size[1])
+        self.obstacles = obstacles
+        self.items = list(items)
+        self.moving_obstacles = moving_obstacles
+        self.image = pg.Surface(self.size, pg.SRCALPHA)
+        self.redraw(self.image.get_rect())
+
+    def to_map(self, pos: Sequence[float]) -> pg.Vector2:
+        """Convert a world position to a position on the minimap."""
+        return pg.Vector2(pos) * self.scale
+
+    def item_rect(self, item: sprites.Item | sprites.Teleporter) -> pg.Rect:
+        """Return the part of the minimap an item's marker covers."""
+        rect = pg.Rect(0, 0, MINIMAP_ITEM_RADIUS * 2 + 2, MINIMAP_ITEM_RADIUS * 2 + 2)
+        rect.center = self.to_map(item.pos)
+        return rect
+
+    def redraw(self, area: pg.Rect):
+        """Redraw the static parts of the minimap, but only inside the given area."""
+        self.image.set_clip(area)
+        self.image.fill(MINIMAP_BACKGROUND)
+        pg.draw.rect(self.image, GAME_BORDER, self.image.get_rect(), 1)
+        if not self.moving_obstacles:
+            for obstacle in self.obstacles:
+                pg.draw.circle(self.image, MINIMAP_ASTEROID, self.to_map(obstacle.pos),
+                               max(obstacle.radius * self.scale, 1))
+        for item in self.items:
+            if item.type is sprites.ItemType.TELEPORTER:
+                # Draw the link between teleporters, once per pair.
+                other = item.linked_teleporter
+                if other is not None and other in self.items and id(item) < id(other):
+                    pg.draw.line(self.image, MINIMAP_TELEPORTER, self.to_map(item.pos), self.to_map(other.pos))
+                color = MINIMAP_TELEPORTER
+            elif item.type is sprites.ItemType.EXIT:
+                color = MINIMAP_EXIT
+            else:
+                color = MINIMAP_FUEL
+            pg.draw.circle(self.image, color, self.to_map(item.pos), MINIMAP_ITEM_RADIUS)
+        self.image.set_clip(None)
+
+    def remove_item(self, item: sprites.Item | sprites.Teleporter):
+        """Take an item off the minimap, redrawing only where its marker was."""
+        if item in self.items:
+            self.items.remove(item)
+            self.redraw(self.item_rect(item))
+
+    def set_items(self, items: Iterable[sprites.Item | sprites.Teleporter]):
+        """Replace the items on the minimap, like after going back to an earlier state."""
+        self.items = list(items)
+        self.redraw(self.image.get_rect())
+
+    def draw(self, screen: pg.Surface, pos: Sequence[float], player_pos: Sequence[float], view_size: Sequence[float],
+             obstacle_positions: Optional[Sequence[Sequence[float]]] = None):
+        """Draw the minimap to the screen with its upper-left corner at ``pos``.
+
+        Moving asteroids are drawn at ``obstacle_positions`` if given, one per obstacle, or where they are now.
+        """
+        offset = pg.Vector2(pos)  # noqa
+        screen.blit(self.image, offset)
+        if self.moving_obstacles:
+            if obstacle_positions is None:
+                obstacle_positions = [obstacle.pos for obstacle in self.obstacles]
+            for obstacle, obstacle_pos in zip(self.obstacles, obstacle_positions):
+                pg.draw.circle(screen, MINIMAP_ASTEROID, self.to_map(obstacle_pos) + offset,
+                               max(obstacle.radius * self.scale, 1))
+        # The part of the level that is on screen.
+        view = pg.Rect(0, 0, view_size[0] * self.scale, view_size[1] * self.scale)
+        view.center = self.to_map(player_pos) + offset
+        pg.draw.rect(screen, GAME_BORDER, view.clip(pg.Rect(offset, self.size)), 1)
+        pg.draw.circle(screen, MINIMAP_PLAYER, self.to_map(player_pos) + offset, MINIMAP_PLAYER_RADIUS)
@@ -0,0 +1,824 @@
+# -*- coding:utf-8 -*-
+# This file holds the multiplayer: an authoritative server that runs the levels, and a client that shows them.
+# The server runs many sessions in one process. Each session is one level with a few astronauts in it.
+# It steps every session at a fixed tick, and sends each player only the numbers that changed since the last tick.
+# Start a server with ``python src/netplay.py server`` and join it with ``python src/netplay.py client``.
+# ``python src/netplay.py bench`` runs a server and many bot players over localhost and reports the costs.
+# It is an application of its own, like main.py. It shares the sizes, images, and levels with the game through
+# resources.py, and never imports main.py, so it doesn't load the menus and the rest of the game.
+
+# Standard library imports.
+from typing import NamedTuple, Optional
+from collections import deque  # Holds the recent snapshots on the client.
+import argparse  # Reads the command line.
+import asyncio  # Runs the server, the connections, and the client without threads.
+import functools  # Used to cache the packing of each snapshot layout.
+import itertools  # Hands out player ids.
+import logging  # Reports players joining and leaving.
+import random  # Random number generation.
+import struct  # Packs the messages into bytes.
+import time  # Used to measure the server's CPU time.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+from colors import *
+import utils
+import sprites
+import atlas
+import bake
+import entities
+import governor
+import resources
+
+logger = logging.getLogger(__name__)
+
+# Constants.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47025
+TICK_RATE = 20  # The server steps the sessions and sends snapshots this many times per second.
+MAX_PLAYERS_PER_SESSION = 4  # More players than this start a new session of the same level.
+PLAYER_START = resources.SCREEN_SIZE // 2  # Where the astronauts start, the same as in main.py.
+# The client draws the game this many ticks behind the newest snapshot, so it nearly always has a later one to
+# move toward. More hides more network hiccups but shows everything later.
+INTERPOLATION_DELAY = 2
+SNAPSHOT_HISTORY = 32  # The snapshots the client keeps for interpolation.
+OFFSET_SMOOTHING = 0.02  # How quickly the client lets its estimate of the server clock drift later.
+# A player with more than this many bytes waiting to be sent is skipped, and gets a keyframe when they catch up.
+MAX_SEND_BUFFER = 64 * 1024
+CLIENT_FPS = 60
+
+# Quantization. Each number is sent as a small integer instead of a float.
+POSITION_SCALE = 8  # Positions are sent in eighths of a pixel, which fits an 8192 pixel level in 16 bits.
+VELOCITY_SCALE = 4  # Velocities are sent in quarters of a pixel per second.
+ANGLE_STEPS = 65536  # The player angle is sent in 1/65536ths of a turn.
+OBSTACLE_ANGLE_STEPS = 256  # Asteroid angles only need 1.4 degree steps, which is finer than their baked frames.
+TANK_SCALE = 2  # The tank level is sent in half units.
+
+# The player flags.
+PUSHING_FLAG = 1  # The extinguisher is held down.
+SMOKE_FLAG = 2  # The smoke emitter is on, because the extinguisher is held down and the tank isn't empty.
+FINISHED_FLAG = 4  # The astronaut reached the exit.
+
+# The message types. Every message starts with its type, and is sent after its length.
+JOIN, WELCOME, KEYFRAME, DELTA, INPUT = range(5)
+MESSAGE_LENGTH = struct.Struct("<H")
+JOIN_MESSAGE = struct.Struct("<BB")  # The type and the level number.
+WELCOME_MESSAGE = struct.Struct("<BHBB")  # The type, the player's id, the tick rate, and the level number.
+TICK_HEADER = struct.Struct("<BI")  # The type and the tick, at the start of each snapshot.
+LAYOUT_HEADER = struct.Struct("<BHH")  # The number of players, items, and asteroids, after a keyframe's tick.
+INPUT_MESSAGE = struct.Struct("<Bb?")  # The type, the rotation from -127 to 127, and whether to push.
+# Each player is their position, velocity, angle, tank level, and flags.
+PLAYER_FORMAT = "HHhhHBB"
+PLAYER_MODULI = (0, 0, 0, 0, ANGLE_STEPS, 0, 0)  # The numbers that wrap around, like angles. 0 means no wrapping.
+
+
+def frame(payload: bytes) -> bytes:
+    """Put the length in front of a message, so the other end knows where it stops."""
+    return MESSAGE_LENGTH.pack(len(payload)) + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> bytes:
+    """Read the next message. Raise ``asyncio.IncompleteReadError`` if the connection closes."""
+    (length,) = MESSAGE_LENGTH.unpack(await reader.readexactly(MESSAGE_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+def write_varint(buffer: bytearray, value: int):
+    """Append a signed integer using as few bytes as it needs. Anything from -64 to 63 takes one byte."""
+    value = value << 1 if value >= 0 else (-value << 1) - 1  # Small negative numbers become small positive ones.
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """Read a signed integer written by ``write_varint``. Return it and the offset after it."""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), offset
+
+
+def quantize(value: float, scale: float, low: int, high: int) -> int:
+    """Return ``value * scale`` rounded to an integer and kept between ``low`` and ``high``."""
+    return min(max(round(value * scale), low), high)
+
+
+class SnapshotLayout(NamedTuple):
+    """What a snapshot holds. Deltas can only be taken between snapshots with the same layout."""
+    player_ids: tuple[int, ...]
+    item_count: int
+    obstacle_count: int
+
+    @property
+    def item_bytes(self) -> int:
+        return (self.item_count + 7) // 8
+
+
+@functools.cache
+def layout_codec(layout: SnapshotLayout) -> tuple[struct.Struct, tuple[int, ...]]:
+    """Return the struct that packs a whole snapshot of the layout, and the wrapping of each of its numbers.
+
+    The numbers are each player, then one byte per eight items with a bit set for each item still there,
+    then the angle of each asteroid.
+    """
+    codec = struct.Struct("<" + PLAYER_FORMAT * len(layout.player_ids) + "B" * layout.item_bytes
+                          + "B" * layout.obstacle_count)
+    moduli = PLAYER_MODULI * len(layout.player_ids) + (0,) * layout.item_bytes
+    return codec, moduli + (OBSTACLE_ANGLE_STEPS,) * layout.obstacle_count
+
+
+def encode_keyframe(tick: int, layout: SnapshotLayout, values: tuple[int, ...]) -> bytes:
+    """Return a message holding the whole snapshot."""
+    codec, _ = layout_codec(layout)
+    return b"".join((
+        TICK_HEADER.pack(KEYFRAME, tick),
+        LAYOUT_HEADER.pack(len(layout.player_ids), layout.item_count, layout.obstacle_count),
+        struct.pack(f"<{len(layout.player_ids)}H", *layout.player_ids),
+        codec.pack(*values),
+    ))
+
+
+def encode_delta(tick: int, moduli: tuple[int, ...], baseline: tuple[int, ...], values: tuple[int, ...]) -> bytes:
+    """Return a message holding only the numbers that changed since the baseline.
+
+    It is a bit per number, set if it changed, followed by the difference of each changed number.
+    Things move a little each tick, so most differences take one byte. A still player costs nothing.
+    """
+    changed = 0
+    differences = bytearray()
+    for index, (old, new, modulus) in enumerate(zip(baseline, values, moduli)):
+        if new != old:
+            changed |= 1 << index
+            difference = new - old
+            if modulus:
+                # Take the short way around, so 359 to 1 degree is a difference of 2 and not -358.
+                difference = (difference + modulus // 2) % modulus - modulus // 2
+            write_varint(differences, difference)
+    return TICK_HEADER.pack(DELTA, tick) + changed.to_bytes((len(values) + 7) // 8, "little") + differences
+
+
+class PlayerState(NamedTuple):
+    x: float
+    y: float
+    vx: float
+    vy: float
+    angle: float
+    tank_level: float
+    flags: int
+
+
+class GameSnapshot(NamedTuple):
+    """The state of a session at one tick, as the client sees it."""
+    tick: float  # Interpolated snapshots fall between ticks.
+    players: dict[int, PlayerState]
+    items: tuple[bool, ...]  # Whether each item of the level is still there, in the order the level made them.
+    obstacle_angles: tuple[float, ...]
+
+
+class SnapshotDecoder:
+    """Turns the server's keyframes and deltas back into snapshots.
+
+    Each delta is applied to the snapshot decoded before it, so every message must be decoded in order.
+    """
+    def __init__(self):
+        self.layout: Optional[SnapshotLayout] = None
+        self.values: list[int] = []
+
+    def decode(self, message: bytes) -> Optional[GameSnapshot]:
+        """Decode a snapshot message. Return None if it isn't one, or is a delta with nothing to apply it to."""
+        if len(message) < TICK_HEADER.size:
+            return None
+        kind, tick = TICK_HEADER.unpack_from(message)
+        offset = TICK_HEADER.size
+        if kind == KEYFRAME:
+            player_count, item_count, obstacle_count = LAYOUT_HEADER.unpack_from(message, offset)
+            offset += LAYOUT_HEADER.size
+            player_ids = struct.unpack_from(f"<{player_count}H", message, offset)
+            offset += player_count * 2
+            self.layout = SnapshotLayout(player_ids, item_count, obstacle_count)
+            codec, _ = layout_codec(self.layout)
+            self.values = list(codec.unpack_from(message, offset))
+        elif kind == DELTA and self.layout is not None:
+            _, moduli = layout_codec(self.layout)
+            mask_size = (len(moduli) + 7) // 8
+            changed = int.from_bytes(message[offset:offset + mask_size], "little")
+            offset += mask_size
+            index = 0
+            while changed:
+                if changed & 1:
+                    difference, offset = read_varint(message, offset)
+                    value = self.values[index] + difference
+                    self.values[index] = value % moduli[index] if moduli[index] else value
+                changed >>= 1
+                index += 1
+        else:
+            return None
+        return self.snapshot(tick)
+
+    def snapshot(self, tick: int) -> GameSnapshot:
+        """Return the current numbers as a snapshot, in pixels, degrees, and tank units."""
+        layout, values = self.layout, self.values
+        size = len(PLAYER_FORMAT)
+        players = {}
+        for number, player_id in enumerate(layout.player_ids):
+            x, y, vx, vy, angle, tank_level, flags = values[number * size:(number + 1) * size]
+            players[player_id] = PlayerState(x / POSITION_SCALE, y / POSITION_SCALE, vx / VELOCITY_SCALE,
+                                             vy / VELOCITY_SCALE, angle * 360 / ANGLE_STEPS, tank_level / TANK_SCALE,
+                                             flags)
+        start = len(layout.player_ids) * size
+        item_bits = int.from_bytes(bytes(values[start:start + layout.item_bytes]), "little")
+        items = tuple(bool(item_bits >> number & 1) for number in range(layout.item_count))
+        obstacle_angles = tuple(angle * 360 / OBSTACLE_ANGLE_STEPS for angle in values[start + layout.item_bytes:])
+        return GameSnapshot(tick, players, items, obstacle_angles)
+
+
+def lerp_angle(start: float, end: float, fraction: float) -> float:
+    """Turn from one angle toward another the short way around, in degrees."""
+    return (start + ((end - start + 180) % 360 - 180) * fraction) % 360
+
+
+def interpolate(older: GameSnapshot, newer: GameSnapshot, fraction: float) -> GameSnapshot:
+    """Return the state ``fraction`` of the way from one snapshot to the next.
+
+    Positions and angles move smoothly. Things that switch, like items and flags, come from the older snapshot.
+    Players that only the newer one has are shown where they are in it.
+    """
+    players = {}
+    for player_id, end in newer.players.items():
+        start = older.players.get(player_id)
+        if start is None:
+            players[player_id] = end
+            continue
+        players[player_id] = PlayerState(
+            start.x + (end.x - start.x) * fraction,
+            start.y + (end.y - start.y) * fraction,
+            start.vx + (end.vx - start.vx) * fraction,
+            start.vy + (end.vy - start.vy) * fraction,
+            lerp_angle(start.angle, end.angle, fraction),
+            start.tank_level + (end.tank_level - start.tank_level) * fraction,
+            start.flags,
+        )
+    if len(older.obstacle_angles) == len(newer.obstacle_angles):
+        obstacle_angles = tuple(lerp_angle(start, end, fraction)
+                                for start, end in zip(older.obstacle_angles, newer.obstacle_angles))
+    else:
+        obstacle_angles = newer.obstacle_angles
+    return GameSnapshot(older.tick + (newer.tick - older.tick) * fraction, players, older.items, obstacle_angles)
+
+
+class SnapshotInterpolator:
+    """Shows the game a little in the past, moving smoothly between the two snapshots around that time.
+
+    Snapshots arrive a few times a second, much slower than the screen refreshes, and not evenly spaced.
+    The client keeps an estimate of the server's tick from when the snapshots arrive, and shows the tick
+    ``delay`` ticks before it. The estimate follows the earliest arrivals, because late ones were only held up.
+    """
+    def __init__(self, tick_rate: int, delay: float = INTERPOLATION_DELAY):
+        self.tick_rate = tick_rate
+        self.delay = delay
+        self.snapshots: deque[GameSnapshot] = deque(maxlen=SNAPSHOT_HISTORY)
+        self.offset: Optional[float] = None  # The server tick minus the local time in ticks.
+
+    def add(self, snapshot: GameSnapshot, now: float):
+        """Add a snapshot that arrived at the local time ``now``, in seconds."""
+        self.snapshots.append(snapshot)
+        offset = snapshot.tick - now * self.tick_rate
+        if self.offset is None or offset > self.offset:
+            self.offset = offset
+        else:
+            # Drift slowly toward later arrivals, in case the two clocks run at slightly different speeds.
+            self.offset += (offset - self.offset) * OFFSET_SMOOTHING
+
+    def sample(self, now: float) -> Optional[GameSnapshot]:
+        """Return the state to show at the local time ``now``, or None before the first snapshot."""
+        if not self.snapshots:
+            return None
+        render_tick = now * self.tick_rate + self.offset - self.delay
+        older = self.snapshots[0]
+        if render_tick <= older.tick:
+            return older
+        for newer in itertools.islice(self.snapshots, 1, None):
+            if newer.tick >= render_tick:
+                return interpolate(older, newer, (render_tick - older.tick) / (newer.tick - older.tick))
+            older = newer
+        # The snapshots ran out, so hold the newest one instead of guessing where things went.
+        return older
+
+
+class RemotePlayer:
+    """A connected player: their astronaut, their latest input, and their connection."""
+    __slots__ = ("player_id", "player", "writer", "rotate", "push", "tank_level", "finished", "needs_keyframe",
+                 "bytes_sent")
+
+    def __init__(self, player_id: int, player: sprites.Player, writer: asyncio.StreamWriter):
+        self.player_id = player_id
+        self.player = player
+        self.writer = writer
+        self.rotate = 0.0  # The fraction of full rotation speed to turn at, from -1 to 1.
+        self.push = False  # Whether the extinguisher is held down.
+        self.tank_level = float(sprites.TANK_MAX)
+        self.finished = False  # Astronauts that reached the exit stop moving.
+        self.needs_keyframe = True  # The next snapshot must be a whole one, because there is nothing to delta from.
+        self.bytes_sent = 0
+
+    def quantize(self) -> tuple[int, ...]:
+        """Return the numbers sent for this player, in ``PLAYER_FORMAT``."""
+        player = self.player
+        flags = (PUSHING_FLAG * self.push | SMOKE_FLAG * player.pushing | FINISHED_FLAG * self.finished)
+        return (
+            quantize(player.pos.x, POSITION_SCALE, 0, 0xFFFF),
+            quantize(player.pos.y, POSITION_SCALE, 0, 0xFFFF),
+            quantize(player.vel.x, VELOCITY_SCALE, -0x8000, 0x7FFF),
+            quantize(player.vel.y, VELOCITY_SCALE, -0x8000, 0x7FFF),
+            round(player.angle * ANGLE_STEPS / 360) % ANGLE_STEPS,
+            quantize(self.tank_level, TANK_SCALE, 0, 0xFF),
+            flags,
+        )
+
+
+class Session:
+    """One level and the players in it. Many sessions run side by side in one server.
+
+    Every player has their own astronaut and tank, and they share the level: picking up fuel takes it
+    away for everyone. The astronauts don't touch each other.
+    The session keeps the last snapshot it sent, and sends everyone the same delta from it.
+    Each session has its own entity store and game clock, so its asteroids, pickups, and teleporter cooldowns
+    are its own, and the level goes away with the session.
+    """
+    def __init__(self, level_number: int, texture_atlas: Optional[atlas.Atlas]):
+        self.level_number = level_number
+        self.clock = utils.GameClock()
+        self.store = entities.EntityStore(self.clock)
+        # Items are never taken off their list, because the snapshots send them by their place in it.
+        self.obstacles, self.items = resources.make_level(level_number, texture_atlas, self.store)
+        self.player_image = texture_atlas.image("astro.png")
+        self.players: dict[int, RemotePlayer] = {}
+        self.sent_layout: Optional[SnapshotLayout] = None
+        self.sent_values: tuple[int, ...] = ()
+
+    @property
+    def full(self) -> bool:
+        return len(self.players) >= MAX_PLAYERS_PER_SESSION
+
+    def add_player(self, player_id: int, writer: asyncio.StreamWriter) -> RemotePlayer:
+        remote = self.players[player_id] = RemotePlayer(player_id, sprites.Player(PLAYER_START, self.player_image),
+                                                         writer)
+        return remote
+
+    def remove_player(self, player_id: int):
+        self.players.pop(player_id, None)
+
+    def item_present(self, item: sprites.Item | sprites.Teleporter) -> bool:
+        return bool(self.store.alive[item.index])
+
+    def step(self, dt: float):
+        """Move the level and every astronaut forward by ``dt`` seconds, following the same rules as main.py."""
+        self.clock.advance(dt)  # Runs the teleporter cooldowns.
+        self.store.update(dt)  # Rotates the asteroids and portals.
+        for remote in self.players.values():
+            if remote.finished:
+                continue
+            player = remote.player
+            if remote.rotate:
+                player.rotate(sprites.PLAYER_ROTATE_SPEED * dt * remote.rotate, self.obstacles)
+            player.pushing = remote.push and remote.tank_level > 0
+            if player.pushing:
+                remote.tank_level = max(remote.tank_level - sprites.TANK_DECREASE * dt, 0.0)
+            player.update(dt, resources.GAME_SIZE, self.obstacles)
+
+            for item in self.items:
+                if not self.item_present(item):
+                    continue
+                if isinstance(item, sprites.Teleporter):
+                    if player.rect.colliderect(item.rect):
+                        item.interact(player)
+                elif item.pos.distance_squared_to(player.pos) < sprites.PLAYER_PICKUP_RANGE ** 2:
+                    if item.type is sprites.ItemType.FUEL:
+                        remote.tank_level = sprites.TANK_MAX
+                        item.kill()
+                    elif item.type is sprites.ItemType.EXIT:
+                        # The exit stays for the other players.
+                        remote.finished = True
+                        player.pushing = False
+                        player.vel.update(0, 0)
+
+    def layout(self) -> SnapshotLayout:
+        return SnapshotLayout(tuple(self.players), len(self.items), len(self.obstacles))
+
+    def values(self, layout: SnapshotLayout) -> tuple[int, ...]:
+        """Return the quantized numbers of the current state, in the order ``layout_codec`` packs them."""
+        values = []
+        for remote in self.players.values():
+            values.extend(remote.quantize())
+        item_bits = sum(1 << number for number, item in enumerate(self.items) if self.item_present(item))
+        values.extend(item_bits.to_bytes(layout.item_bytes, "little"))
+        values.extend(round(obstacle.angle * OBSTACLE_ANGLE_STEPS / 360) % OBSTACLE_ANGLE_STEPS
+                      for obstacle in self.obstacles)
+        return tuple(values)
+
+    def broadcast(self, tick: int):
+        """Send every player the snapshot of this tick.
+
+        The delta and the keyframe are each packed once, no matter how many players get them.
+        """
+        layout = self.layout()
+        values = self.values(layout)
+        if layout != self.sent_layout:
+            # Someone joined or left, so everyone starts over from a keyframe.
+            for remote in self.players.values():
+                remote.needs_keyframe = True
+        keyframe = delta = None
+        for remote in self.players.values():
+            if remote.writer.is_closing():
+                continue
+            if remote.writer.transport.get_write_buffer_size() > MAX_SEND_BUFFER:
+                # The connection can't keep up. Skipping breaks the chain of deltas, so start over later.
+                remote.needs_keyframe = True
+                continue
+            if remote.needs_keyframe:
+                keyframe = keyframe or frame(encode_keyframe(tick, layout, values))
+                message = keyframe
+                remote.needs_keyframe = False
+            else:
+                delta = delta or frame(encode_delta(tick, layout_codec(layout)[1], self.sent_values, values))
+                message = delta
+            remote.writer.write(message)
+            remote.bytes_sent += len(message)
+        self.sent_layout, self.sent_values = layout, values
+
+
+class GameServer:
+    """The authoritative server. It runs every session at a fixed tick and sends the players their snapshots.
+
+    The players only send their input, so nobody can move their astronaut anywhere the rules don't allow.
+    Each session runs its own level, so a session can start or end without touching the others.
+    """
+    def __init__(self, tick_rate: int = TICK_RATE):
+        self.tick_rate = tick_rate
+        self.tick = 0
+        self.sessions: list[Session] = []
+        self.player_ids = itertools.count(1)
+        self.texture_atlas: Optional[atlas.Atlas] = None
+        self.sprite_bake: Optional[bake.SpriteBake] = None
+        self.server: Optional[asyncio.Server] = None
+        self.tick_task: Optional[asyncio.Task] = None
+        self.cpu_time = 0.0  # The CPU seconds spent stepping the sessions and sending the snapshots.
+        self.player_ticks = 0  # How many times a player was stepped and sent a snapshot.
+
+    @property
+    def player_count(self) -> int:
+        return sum(len(session.players) for session in self.sessions)
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> int:
+        """Load the images, start listening, and start ticking. Return the port, which is picked if ``port`` is 0."""
+        # The images are only used for collision masks, but they still need a display to be converted.
+        if pg.display.get_surface() is None:
+            pg.display.set_mode((1, 1), pg.HIDDEN)
+        self.texture_atlas, self.sprite_bake = resources.load_images()
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.tick_task = asyncio.create_task(self.run())
+        port = self.server.sockets[0].getsockname()[1]
+        logger.info("Serving on %s:%d at %d ticks per second", host, port, self.tick_rate)
+        return port
+
+    async def close(self):
+        """Stop ticking, disconnect everyone, and stop listening."""
+        if self.tick_task is not None:
+            self.tick_task.cancel()
+        for session in self.sessions:
+            for remote in session.players.values():
+                remote.writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await asyncio.sleep(0)  # Let the connections see they were closed and leave their sessions.
+
+    async def run(self):
+        """Step the sessions at the tick rate. When a tick runs late the next ones don't try to catch up."""
+        loop = asyncio.get_running_loop()
+        tick_time = 1 / self.tick_rate
+        next_tick = loop.time()
+        while True:
+            self.step(tick_time)
+            next_tick += tick_time
+            delay = next_tick - loop.time()
+            if delay < -tick_time:
+                next_tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    def step(self, dt: float):
+        """Run one tick of every session and send out the snapshots."""
+        start = time.process_time()
+        self.tick += 1
+        for session in self.sessions:
+            session.step(dt)
+            session.broadcast(self.tick)
+        self.cpu_time += time.process_time() - start
+        self.player_ticks += self.player_count
+
+    def join(self, level_number: int, writer: asyncio.StreamWriter) -> tuple[Session, RemotePlayer]:
+        """Add a player to a session of the level that has room, starting a new one if none does."""
+        session = next((session for session in self.sessions
+                        if session.level_number == level_number and not session.full), None)
+        if session is None:
+            session = Session(level_number, self.texture_atlas)
+            self.sessions.append(session)
+        return session, session.add_player(next(self.player_ids) & 0xFFFF, writer)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one player from the moment they connect until they leave."""
+        session = remote = None
+        try:
+            kind, level_number = JOIN_MESSAGE.unpack(await read_message(reader))
+            if kind != JOIN or level_number not in resources.LEVELS:
+                return
+            session, remote = self.join(level_number, writer)
+            writer.write(frame(WELCOME_MESSAGE.pack(WELCOME, remote.player_id, self.tick_rate, level_number)))
+            logger.info("Player %d joined level %d (%d in the session, %d sessions)",
+                        remote.player_id, level_number, len(session.players), len(self.sessions))
+            while True:
+                message = await read_message(reader)
+                if not message:
+                    continue  # An empty message doesn't even have a type, so there is nothing to do with it.
+                if message[0] == INPUT:
+                    _, rotate, push = INPUT_MESSAGE.unpack(message)
+                    remote.rotate = max(min(rotate / 127, 1.0), -1.0)
+                    remote.push = push
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error, IndexError, ValueError):
+            pass  # The player left, or sent something that makes no sense.
+        finally:
+            if session is not None:
+                session.remove_player(remote.player_id)
+                logger.info("Player %d left", remote.player_id)
+                if not session.players:
+                    self.sessions.remove(session)
+            writer.close()
+
+
+class NetClient:
+    """A connection to the server: it sends the player's input, and decodes and interpolates the snapshots."""
+    def __init__(self):
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.player_id = 0
+        self.level_number = 0
+        self.decoder = SnapshotDecoder()
+        self.interpolator: Optional[SnapshotInterpolator] = None
+        self.sent_input = b""  # The last input sent. The same input is never sent twice in a row.
+        self.bytes_received = 0
+        self.snapshots_received = 0
+
+    async def connect(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, level_number: int = 1):
+        """Connect and join a session of the level."""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(frame(JOIN_MESSAGE.pack(JOIN, level_number)))
+        _, self.player_id, tick_rate, self.level_number = WELCOME_MESSAGE.unpack(await read_message(self.reader))
+        self.interpolator = SnapshotInterpolator(tick_rate)
+
+    async def receive(self):
+        """Decode snapshots until the connection closes."""
+        try:
+            while True:
+                message = await read_message(self.reader)
+                self.bytes_received += MESSAGE_LENGTH.size + len(message)
+                if (snapshot := self.decoder.decode(message)) is not None:
+                    self.snapshots_received += 1
+                    self.interpolator.add(snapshot, time.monotonic())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def send_input(self, rotate: float, push: bool):
+        """Send the input if it changed. ``rotate`` is the fraction of full rotation speed, from -1 to 1."""
+        message = INPUT_MESSAGE.pack(INPUT, round(max(min(rotate, 1.0), -1.0) * 127), push)
+        if message != self.sent_input:
+            self.writer.write(frame(message))
+            self.sent_input = message
+
+    def sample(self) -> Optional[GameSnapshot]:
+        """Return the state to show now, or None before the first snapshot."""
+        return self.interpolator.sample(time.monotonic())
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def run_client(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, level_number: int = 1):
+    """Join a server and play in a window.
+
+    Turn with LEFT and RIGHT or A and D, and push with UP, W, or the left mouse button. ESCAPE leaves.
+    The window shows the interpolated snapshots. Nothing is simulated here except the particles.
+    """
+    pg.init()
+    pg.display.set_caption("Extinguished (online)")
+    screen = pg.display.set_mode(resources.SCREEN_SIZE)
+    texture_atlas, sprite_bake = resources.load_images()
+    client = NetClient()
+    await client.connect(host, port, level_number)
+    receive_task = asyncio.create_task(client.receive())
+
+    # The client makes its own copy of the level, in the same order as the server, to draw it.
+    world = entities.EntityStore(utils.GameClock())
+    obstacles, level_items = resources.make_level(client.level_number, texture_atlas, world)
+    items = list(level_items)
+    background_image = utils.load_image(resources.IMAGE_DIRECTORY / resources.BACKGROUND_IMAGE_FILENAME)
+    player_image = texture_atlas.image("astro.png")
+    kenney_font = pg.Font(resources.FONT_PATH, 18)
+    tank_text_cache = utils.ImageCache(lambda text: kenney_font.render(text, True, RED), "tank text")
+    render_queue = utils.RenderQueue()
+
+    # The particles come from the emitter state in the snapshots: the smoke flags and the exits still there.
+    smoke_particles = utils.ParticleGroup(
+        utils.ImageCache(functools.partial(utils.make_circle_image, color=SMOKE), "smoke particles"), pg.BLEND_ADD)
+    portal_dust_image = texture_atlas.image("Portal Dust.png")
+    portal_particles = utils.ParticleGroup(utils.ImageCache(lambda _: portal_dust_image, "portal dust"))
+
+    def make_smoke_emitter(player: sprites.Player) -> utils.ParticleEmitter:
+        def make_smoke_particle(pos: pg.Vector2) -> utils.SmokeParticle:
+            vel_vector = pg.Vector2()
+            vel_vector.from_polar((random.randint(150, 200), (player.angle + random.randint(-20, 20) % 360)))
+            return utils.SmokeParticle(pos, vel_vector + player.vel, random.randint(3, 5))
+        return utils.ParticleEmitter(smoke_particles, make_smoke_particle, resources.SMOKE_EMISSION_RATE, player.pos)
+
+    def make_portal_dust_emitter(portal: sprites.Item) -> utils.ParticleEmitter:
+        def make_portal_particle(pos: pg.Vector2) -> utils.PortalParticle:
+            spawn_pos = pg.Vector2()
+            spawn_pos.from_polar((random.randint(50, 100), random.randrange(360)))
+            return utils.PortalParticle(pos + spawn_pos, pos)
+        # The client always draws at the highest quality.
+        dust_rate = governor.QUALITY_LEVELS[0].portal_dust_rate
+        return utils.ParticleEmitter(portal_particles, make_portal_particle, dust_rate, portal.pos)
+
+    astronauts: dict[int, tuple[sprites.Player, utils.ParticleEmitter]] = {}
+    portal_dust_emitters = {item: make_portal_dust_emitter(item) for item in items
+                            if item.type is sprites.ItemType.EXIT}
+    clock = pg.time.Clock()
+    camera = pg.Vector2()
+    try:
+        while not receive_task.done():
+            frame_start = time.perf_counter()
+            dt = clock.tick() / 1000.0
+            for event in pg.event.get():
+                if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                    return
+
+            # Only the input goes to the server.
+            keys = pg.key.get_pressed()
+            rotate = (keys[pg.K_RIGHT] or keys[pg.K_d]) - (keys[pg.K_LEFT] or keys[pg.K_a])
+            push = keys[pg.K_UP] or keys[pg.K_w] or pg.mouse.get_pressed()[0]
+            client.send_input(rotate, push)
+
+            # The portals spin on their own, the asteroids are turned to where the server has them.
+            world.update(dt)
+            snapshot = client.sample()
+            own_state = None
+            if snapshot is not None:
+                for player_id in list(astronauts):
+                    if player_id not in snapshot.players:
+                        del astronauts[player_id]
+                for player_id, state in snapshot.players.items():
+                    if player_id not in astronauts:
+                        player = sprites.Player((state.x, state.y), player_image)
+                        astronauts[player_id] = (player, make_smoke_emitter(player))
+                    player, smoke_emitter = astronauts[player_id]
+                    player.pos.update(state.x, state.y)
+                    player.vel.update(state.vx, state.vy)
+                    player.angle = state.angle
+                    player.update_image()
+                    smoke_emitter.update(dt, player.pos, bool(state.flags & SMOKE_FLAG))
+                for obstacle, angle in zip(obstacles, snapshot.obstacle_angles):
+                    obstacle.angle = angle
+                for item, present in zip(level_items, snapshot.items):
+                    if not present and item in items:
+                        items.remove(item)
+                        item.kill()
+                        portal_dust_emitters.pop(item, None)
+                own_state = snapshot.players.get(client.player_id)
+            for obstacle in obstacles:
+                obstacle.update_image()
+            for item in items:
+                item.update_image()
+            for portal, emitter in portal_dust_emitters.items():
+                emitter.update(dt, portal.pos)
+            smoke_particles.update(dt)
+            portal_particles.update(dt)
+
+            # Draw.
+            if own_state is not None:
+                camera = pg.Vector2(resources.SCREEN_SIZE) // 2 - (own_state.x, own_state.y)
+            screen.blit(background_image, (0, 0))
+            for obstacle in obstacles:
+                obstacle.draw(render_queue, camera)
+            for item in items:
+                item.draw(render_queue, camera)
+            for player, _ in astronauts.values():
+                player.draw(render_queue, camera)
+            smoke_particles.submit(render_queue, camera, sprites.PARTICLE_LAYER)
+            portal_particles.submit(render_queue, camera, sprites.PARTICLE_LAYER)
+            render_queue.flush(screen)
+            pg.draw.rect(screen, GAME_BORDER, (*camera, *resources.GAME_SIZE), 10)
+            if own_state is None:
+                status_text = "Waiting for the server..."
+            elif own_state.flags & FINISHED_FLAG:
+                status_text = "You made it out!"
+            else:
+                status_text = f"Tank: {int(own_state.tank_level)}/{sprites.TANK_MAX}"
+            screen.blit(tank_text_cache.get_image(status_text), resources.FUEL_LEVEL_TEXT_POS)
+            pg.display.flip()
+
+            # Sleeping instead of `clock.tick(CLIENT_FPS)` lets the snapshots arrive while waiting.
+            await asyncio.sleep(max(1 / CLIENT_FPS - (time.perf_counter() - frame_start), 0))
+    finally:
+        receive_task.cancel()
+        await client.close()
+        pg.quit()
+
+
+async def serve(host: str, port: int):
+    server = GameServer()
+    await server.start(host, port)
+    await server.tick_task
+
+
+async def benchmark(session_count: int, players_per_session: int, seconds: float):
+    """Run a server and bot players over localhost, and report the bandwidth and server CPU per player."""
+    server = GameServer()
+    port = await server.start(DEFAULT_HOST, 0)
+    clients = []
+    for number in range(session_count * players_per_session):
+        client = NetClient()
+        await client.connect(DEFAULT_HOST, port, number // players_per_session % len(resources.LEVELS) + 1)
+        clients.append(client)
+    receive_tasks = [asyncio.create_task(client.receive()) for client in clients]
+    # Count from when everyone is in, so the keyframes of joining don't count.
+    await asyncio.sleep(1)
+    start_bytes = [client.bytes_received for client in clients]
+    start_cpu, start_player_ticks = server.cpu_time, server.player_ticks
+    start = time.perf_counter()
+
+    # The bots change their input now and then, like a person would, and show the game like a client would.
+    while time.perf_counter() - start < seconds:
+        for client in clients:
+            if random.random() < 0.05:
+                client.send_input(random.choice((-1, 0, 0, 1)), random.random() < 0.5)
+            client.sample()
+        await asyncio.sleep(1 / CLIENT_FPS)
+    elapsed = time.perf_counter() - start
+    cpu_time = server.cpu_time - start_cpu
+    player_ticks = server.player_ticks - start_player_ticks
+
+    received = [client.bytes_received - start for client, start in zip(clients, start_bytes)]
+    session = server.sessions[0]
+    layout = session.layout()
+    keyframe_size = MESSAGE_LENGTH.size + len(encode_keyframe(server.tick, layout, session.values(layout)))
+    print(f"{len(server.sessions)} sessions, {server.player_count} players, {server.tick_rate} ticks per second, "
+          f"{elapsed:.1f} s")
+    print(f"Per player: {sum(received) / len(clients) / elapsed:,.0f} bytes per second "
+          f"({keyframe_size * server.tick_rate:,} with a keyframe every tick)")
+    print(f"Server CPU: {cpu_time / player_ticks * 1e6:.0f} us per player per tick, "
+          f"{cpu_time / elapsed:.1%} of a core in total")
+    print(f"One core could serve about {player_ticks / cpu_time / server.tick_rate:,.0f} players")
+
+    for task in receive_tasks:
+        task.cancel()
+    for client in clients:
+        await client.close()
+    await server.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Extinguished multiplayer.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server_parser = commands.add_parser("server", help="run a server")
+    client_parser = commands.add_parser("client", help="join a server")
+    for command_parser in (server_parser, client_parser):
+        command_parser.add_argument("--host", default=DEFAULT_HOST)
+        command_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client_parser.add_argument("--level", type=int, choices=sorted(resources.LEVELS), default=1)
+    bench_parser = commands.add_parser("bench", help="measure bandwidth and server CPU with bot players")
+    bench_parser.add_argument("--sessions", type=int, default=25)
+    bench_parser.add_argument("--players", type=int, default=MAX_PLAYERS_PER_SESSION, help="players per session")
+    bench_parser.add_argument("--seconds", type=float, default=10)
+    arguments = parser.parse_args()
+
+    if arguments.command == "server":
+        asyncio.run(serve(arguments.host, arguments.port))
+    elif arguments.command == "client":
+        asyncio.run(run_client(arguments.host, arguments.port, arguments.level))
+    else:
+        logging.getLogger(__name__).setLevel(logging.WARNING)  # Hundreds of bots joining is not news.
+        asyncio.run(benchmark(arguments.sessions, arguments.players, arguments.seconds))
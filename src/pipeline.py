@@ -0,0 +1,154 @@
+# -*- coding:utf-8 -*-
+# This file holds the frame pipeline, which can simulate the next frame on a worker thread while this one is drawn.
+# Pygame-ce lets go of the GIL while it blits and transforms, so the Python simulation code can run at the same time.
+# It shouldn't import any local files, to avoid circular imports.
+
+# Standard library imports.
+from typing import Callable, Generic, Optional, TypeVar
+from concurrent.futures import ThreadPoolExecutor  # Runs the simulation on a worker thread.
+import queue  # Hands calls from the simulation to the main thread.
+import time  # Used to time each stage.
+
+Snapshot = TypeVar("Snapshot")
+
+
+class FramePipeline(Generic[Snapshot]):
+    """Runs each frame as two stages: ``simulate``, which returns a snapshot, then ``render``, which draws it.
+
+    Without pipelining the stages run back to back. With pipelining, the simulation of frame N+1 runs on
+    a worker thread while the main thread renders frame N. The screen then shows each frame one frame later.
+
+    Pipelining is experimental, and the game leaves it off. In theory a frame takes about as long as the slower
+    stage instead of both added together, but only if the render spends most of its time in pygame-ce calls
+    that let go of the GIL, and there is a spare core. No measurement has shown a gain yet: on one core the
+    benchmark below runs 10 to 30% slower pipelined, because the two threads fight over the GIL.
+
+    The snapshot must only hold copies and images that the simulation never changes afterward,
+    because the next simulation step is already running while it is drawn.
+    ``simulate`` can return None when there is nothing to draw.
+    Anything the simulation raises, including ``SystemExit``, is raised again on the main thread.
+    Pygame calls that aren't safe off the main thread, like playing sounds, go through ``call_on_main_thread``.
+    """
+    def __init__(self, simulate: Callable[..., Snapshot], render: Callable[[Snapshot], None], pipelined: bool = True):
+        self.simulate = simulate
+        self.render = render
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="simulation") if pipelined else None
+        self.snapshot: Optional[Snapshot] = None  # The simulated frame waiting to be rendered.
+        self.main_thread_calls: queue.SimpleQueue = queue.SimpleQueue()  # Calls waiting for the main thread.
+        self.simulate_time = 0.0  # The seconds the last simulation step took.
+        self.render_time = 0.0  # The seconds the last render took.
+
+    @property
+    def pipelined(self) -> bool:
+        return self.executor is not None
+
+    @property
+    def work_time(self) -> float:
+        """The seconds the last frame kept the game busy, not counting any time spent waiting for the next one.
+
+        Pipelined, the stages overlap, so it is the slower one. Otherwise it is both added together.
+        """
+        if self.pipelined:
+            return max(self.simulate_time, self.render_time)
+        return self.simulate_time + self.render_time
+
+    def call_on_main_thread(self, function: Callable[..., object], *args):
+        """Run a function on the main thread once the current simulation step is done."""
+        self.main_thread_calls.put((function, args))
+
+    def run_main_thread_calls(self):
+        while True:
+            try:
+                function, args = self.main_thread_calls.get_nowait()
+            except queue.Empty:
+                return
+            function(*args)
+
+    def timed_simulate(self, *args) -> Snapshot:
+        start = time.perf_counter()
+        snapshot = self.simulate(*args)
+        self.simulate_time = time.perf_counter() - start
+        return snapshot
+
+    def timed_render(self, snapshot: Snapshot):
+        start = time.perf_counter()
+        self.render(snapshot)
+        self.render_time = time.perf_counter() - start
+
+    def run(self, *args):
+        """Run one frame. The arguments are passed to ``simulate``."""
+        if self.executor is None:
+            self.snapshot = self.timed_simulate(*args)
+            self.run_main_thread_calls()
+            if self.snapshot is not None:
+                self.timed_render(self.snapshot)
+            return
+        future = self.executor.submit(self.timed_simulate, *args)
+        if self.snapshot is not None:
+            self.timed_render(self.snapshot)
+        try:
+            self.snapshot = future.result()
+        finally:
+            self.run_main_thread_calls()
+
+    def close(self):
+        """Stop the worker thread."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+if __name__ == "__main__":
+    # Time a busy scene with and without pipelining.
+    # The simulation is dynamic asteroids, which is pure Python. The render fills a big world, draws it with
+    # the render queue, and smooth-scales it onto the screen, which is almost all pygame-ce.
+    import os
+    import random
+    import pygame as pg
+    import entities
+    import gravity
+    import sprites
+    import utils
+
+    pg.display.set_mode((800, 600), pg.HIDDEN)
+    screen = pg.display.get_surface()
+    world_size = pg.Vector2(1600, 1200)
+    world = pg.Surface(world_size).convert()
+    asteroid_images = [utils.make_circle_image(radius, (128, 128, 128)) for radius in (30, 50, 70, 80)]
+    obstacles = [sprites.Obstacle((random.uniform(0, world_size.x), random.uniform(0, world_size.y)),
+                                  random.choice(asteroid_images)) for _ in range(300)]
+    asteroid_gravity = gravity.AsteroidGravity(world_size)
+    asteroid_gravity.start_drifting(obstacles)
+    render_queue = utils.RenderQueue()
+
+    def simulate(dt: float) -> tuple:
+        asteroid_gravity.step(dt, obstacles)
+        entities.WORLD.update(dt)
+        for obstacle in obstacles:
+            obstacle.update_rects()
+            obstacle.update_image(5)
+            obstacle.draw(render_queue, pg.Vector2())
+        return render_queue.take()
+
+    def render(blits: tuple):
+        world.fill((0, 0, 0))
+        render_queue.draw(world, blits)
+        pg.transform.smoothscale(world, screen.get_size(), screen)
+        pg.display.flip()
+
+    frames = 200
+    print(f"{os.cpu_count()} CPU cores, {len(obstacles)} asteroids, {frames} frames")
+    if (os.cpu_count() or 1) < 2:
+        print("Pipelining can't overlap anything on one core, so expect it to be slower here.")
+    for pipelined in (False, True):
+        frame_pipeline = FramePipeline(simulate, render, pipelined)
+        simulate_total = render_total = 0.0
+        start = time.perf_counter()
+        for _ in range(frames):
+            frame_pipeline.run(1 / 60)
+            simulate_total += frame_pipeline.simulate_time
+            render_total += frame_pipeline.render_time
+        elapsed = time.perf_counter() - start
+        frame_pipeline.close()
+        print(f"{'Pipelined' if pipelined else 'Serial':>9}: {elapsed / frames * 1000:.2f} ms per frame "
+              f"(simulate {simulate_total / frames * 1000:.2f} ms, render {render_total / frames * 1000:.2f} ms)")
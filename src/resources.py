@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+# This file holds what the game and the multiplayer share: the sizes, the paths and image lists, loading the images,
+# and making the levels. main.py imports it by wildcard, like colors.py:
+# ```from resources import *```
+# It must never import main.py or netplay.py, so either one can use it without loading the other.
+
+# Standard library imports.
+from typing import Optional
+from pathlib import Path  # This module allows object-oriented filesystem interaction.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+import atlas
+import bake
+import entities
+import level
+import sprites
+
+# Constants.
+SCREEN_SIZE = pg.Vector2(800, 600)  # This is a Vector2 to enable easy mathematical operations later.
+GAME_SIZE = pg.Vector2(1600, 1200)  # The size of every level.
+
+APPLICATION_DIRECTORY = Path(__file__, "../..").resolve()  # This is the top level folder of the project.
+IMAGE_DIRECTORY = APPLICATION_DIRECTORY / "images"  # The path to the folder of images.
+SOUND_DIRECTORY = APPLICATION_DIRECTORY / "sounds"  # The path to the folder of sounds and music.
+FONT_PATH = APPLICATION_DIRECTORY / "kenney_font.ttf"  # The path to the font file.
+CACHE_DIRECTORY = APPLICATION_DIRECTORY / "cache"  # Generated files that speed up loading are kept here.
+
+ASTEROID_IMAGE_FILENAMES = (  # The file names of the asteroid images.
+    "Asteroid_60.png",
+    "Asteroid_100.png",
+    "Asteroid_140.png",
+    "Asteroid_160.png",
+)
+BACKGROUND_IMAGE_FILENAME = "Level Design/Background.png"
+ATLAS_IMAGE_FILENAMES = (  # The images that are packed into the texture atlas.
+    *ASTEROID_IMAGE_FILENAMES,
+    "astro.png",
+    "Fire_ex.png",
+    "Portal.png",
+    "teleporter.png",
+    "Portal Dust.png",
+    "stopwatch.png",
+    "tank_bar.png",
+    "tank_bar2.png",
+    "tank_fill.png",
+)
+
+# The images baked into pre-rotated frames, and how many frames each gets. See bake.py.
+# The asteroids and portals are drawn from their frames at the "low" and "lowest" quality rotation steps,
+# so they get exactly that fine, and finer steps rotate at runtime. The player always uses its frames.
+# The bake file is 38.5 MB: 26.3 MB of asteroids, 4.9 MB of portal, and 7.1 MB of astronaut frames and masks.
+# It is baked in the display's pixel format and mapped, not read, so it loads in about 2 ms and only the frames
+# that get drawn take up memory. A bake that had to be converted would take about 30 ms and a full copy.
+# Halving a count halves that image's share of the file. The astronaut keeps 2 degree frames, because it
+# always draws from them and turns the most. At 5 degrees like the rest it would save about 4 MB.
+BAKED_ROTATIONS = {
+    **{name: 72 for name in ASTEROID_IMAGE_FILENAMES},  # Every 5 degrees.
+    "Portal.png": 72,
+    "astro.png": 180,  # Every 2 degrees.
+}
+BAKED_MASKS = ("astro.png",)  # The baked images that also need a collision mask for each frame.
+
+SMOKE_EMISSION_RATE = 120  # Smoke particles per second while the extinguisher is active.
+FUEL_LEVEL_TEXT_POS = pg.Vector2(32, 50)  # Where the tank text goes on the screen.
+
+LEVELS = {  # The functions that make the asteroids and items of each level.
+    1: (level.SetLevelOneObstacles, level.SetLevelOneItems),
+    2: (level.SetLevelTwoObstacles, level.SetLevelTwoItems),
+    3: (level.SetLevelThreeObstacles, level.SetLevelThreeItems),
+}
+
+
+def load_images() -> tuple[atlas.Atlas, Optional[bake.SpriteBake]]:
+    """Build the texture atlas and map in the baked sprites, so sprites don't make them while the game runs.
+
+    The atlas is cached on disk, so this is fast after the first run.
+    The bake must be kept as long as the sprites are used. The display must already be set up.
+    """
+    texture_atlas = atlas.build_atlas(IMAGE_DIRECTORY, ATLAS_IMAGE_FILENAMES, cache_directory=CACHE_DIRECTORY)
+    asteroid_radii = [texture_atlas.image(name).get_width() // 2 for name in ASTEROID_IMAGE_FILENAMES]
+    sprite_bake = bake.load_or_bake(IMAGE_DIRECTORY, BAKED_ROTATIONS, BAKED_MASKS, asteroid_radii, CACHE_DIRECTORY)
+    if sprite_bake is not None:
+        sprites.use_baked_sprites(sprite_bake, {name: texture_atlas.image(name) for name in BAKED_ROTATIONS})
+    return texture_atlas, sprite_bake
+
+
+def make_level(level_number: int, texture_atlas: Optional[atlas.Atlas] = None,
+               store: Optional[entities.EntityStore] = None
+               ) -> tuple[list[sprites.Obstacle], list[sprites.Item | sprites.Teleporter]]:
+    """Return the asteroids and items of a level, with their numbers kept in the given entity store."""
+    make_obstacles, make_items = LEVELS[level_number]
+    return (make_obstacles(IMAGE_DIRECTORY, ASTEROID_IMAGE_FILENAMES, texture_atlas, store),
+            make_items(IMAGE_DIRECTORY, texture_atlas, store))
@@ -1,7 +1,6 @@
 # -*- coding:utf-8 -*-
 # This file holds various game objects like the player, obstacles, and items.
 # Standard library imports.
-import random
 import math
 from typing import Sequence, Optional
 from enum import Enum, auto
@@ -12,6 +11,8 @@ import pygame as pg
 # Local library imports.
 from colors import *
 import utils
+import entities
+import bake
 
 # Constants
 PLAYER_ROTATE_SPEED = 300  # The speed the keyboard can rotate the player angle.
@@ -26,6 +27,60 @@ TELEPORTER_POSITION = pg.Vector2(400, 300)
 
 MAX_ASTEROID_ROT_SPEED = 20  # The maximum speed an asteroid can rotate at.
 ASTEROID_BOUNCE = 0.8  # The percentage of speed to keep when bouncing off an asteroid.
+MAX_SWEEP_BOUNCES = 4  # The most impacts the player can resolve in a single update.
+
+# Render layers for the ``utils.RenderQueue``. Lower layers are drawn first.
+OBSTACLE_LAYER = 0
+ITEM_LAYER = 1
+PLAYER_LAYER = 2
+PARTICLE_LAYER = 3
+DEBUG_LAYER = 4
+
+
+# Rotated images are cached when rotation is done in steps, because then only a few angles are ever used.
+# Smooth rotation isn't cached, since nearly every angle would be new.
+ROTATED_IMAGES = utils.ImageCache(lambda key: pg.transform.rotate(*key), "rotated sprites")
+
+
+def rotation_angle(angle: float, step: float) -> float:
+    """Return the angle an image should be drawn at, rounded to the nearest ``step`` degrees if step isn't 0."""
+    return round(angle / step) * step % 360 if step else angle
+
+
+# Images with pre-rotated frames in the baked sprite cache, and the baked collision circles by radius.
+# Sprites using these images look up their frames and masks instead of making them. See bake.py.
+BAKED_SPRITES: dict[pg.Surface, bake.BakedSprite] = {}
+BAKED_CIRCLES: dict[int, bake.BakedSprite] = {}
+
+
+def use_baked_sprites(sprite_bake: bake.SpriteBake, images: dict[str, pg.Surface]):
+    """Make sprites use the baked frames and masks. ``images`` maps the baked names to the images sprites are given."""
+    BAKED_SPRITES.clear()
+    BAKED_CIRCLES.clear()
+    for name, image in images.items():
+        if name in sprite_bake:
+            BAKED_SPRITES[image] = sprite_bake[name]
+    BAKED_CIRCLES.update(sprite_bake.circles)
+
+
+def rotated_image(image: pg.Surface, angle: float, step: float = 0) -> pg.Surface:
+    """Return the image rotated by the angle, rounded to the nearest ``step`` degrees if step isn't 0.
+
+    Baked images use the baked frame closest to that angle, unless the step is finer than the baked frames.
+    """
+    if (baked := BAKED_SPRITES.get(image)) is not None and step >= 360 / baked.steps:
+        return baked.frame(rotation_angle(angle, step))
+    if not step:
+        return pg.transform.rotate(image, angle)
+    return ROTATED_IMAGES.get_image((image, rotation_angle(angle, step)))
+
+
+def rotation_source(image: pg.Surface, angle: float, step: float = 0) -> Optional[tuple[pg.Surface, float]]:
+    """Return ``(image, angle)`` if ``rotated_image`` makes a new image for this every time, or None if it reuses one.
+
+    Sprites pass it to the render queue, which can then rotate a scaled copy of the image instead.
+    """
+    return None if step else (image, angle)
 
 
 # Item type enumeration.
@@ -39,6 +94,11 @@ class ItemType(Enum):
 
 
 class Player:
+    # There is only ever one player, so it keeps its own vectors instead of living in the entity store.
+    # The slots still save the per-instance dictionary.
+    __slots__ = ("pos", "vel", "acc", "angle", "pushing", "radius", "base_image", "image", "rect",
+                 "mask", "mask_image")
+
     def __init__(self, pos: Sequence[float], image: pg.Surface):
         # I'm not using type hints for some variables here because their type is obvious.
         self.pos = pg.Vector2(pos)  # noqa The position of the player, in pixels.
@@ -48,27 +108,31 @@ class Player:
         self.pushing = False  # Whether the extinguisher is active and pushing.
         self.radius = PLAYER_CIRCLE_RADIUS  # The radius of the collision circle.
         self.base_image = image  # Store a copy of the original image to avoid rotation corruption.
-        self.image = pg.transform.rotate(self.base_image, -self.angle)  # This image is used for drawing.
-        self.rect = self.image.get_rect(center=self.pos)  # This is used only for drawing.
-
-        # Create the player mask.
-        self.mask = pg.mask.from_surface(self.image)
-        self.mask_image = self.mask.to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
+        # Create the image, which is used for drawing, and the player mask.
+        self.update_image()
 
-    def update(self, dt: float, game_bounds: pg.Vector2, obstacles: list["Obstacle"]) -> bool:
+    def update(self, dt: float, game_bounds: pg.Vector2, obstacles: list["Obstacle"],
+               gravity: Optional[pg.Vector2] = None) -> bool:
         """Update the player.
 
         This function handles movement, collision detection, etc.
+        When the asteroids are simulated with real gravity, pass in their pull on the player as ``gravity``.
         It returns a bool indicating a collision with an asteroid.
         """
         # this portion of the code will handle the gravity of the asteroids
-
-        for obstacle in obstacles:
+        # The pull is collected into one displacement so it gets swept along with the velocity.
+        gravity_motion = pg.Vector2(0, 0)
+        if gravity is not None:
+            self.vel += gravity * dt
+        # With real gravity passed in, the simple pull below is skipped.
+        for obstacle in obstacles if gravity is None else ():
             # the amount of acceleration towards the planet
             accel = 45
 
-            dx = obstacle.pos.x - self.pos.x
-            dy = obstacle.pos.y - self.pos.y
+            # Reading an entity's position makes a new Vector2, so it is only read once.
+            obstacle_pos = obstacle.pos
+            dx = obstacle_pos.x - self.pos.x
+            dy = obstacle_pos.y - self.pos.y
             distance = math.sqrt(dx ** 2 + dy ** 2)
             direction_x = 0
             direction_y = 0
@@ -77,38 +141,22 @@ class Player:
                 direction_x = dx / distance
                 direction_y = dy / distance
 
-            self.pos.x += direction_x * accel * dt
-            self.pos.y += direction_y * accel * dt
+            gravity_motion.x += direction_x * accel * dt
+            gravity_motion.y += direction_y * accel * dt
 
         # Update the acceleration if the extinguisher is active.
         if self.pushing:
             self.acc.from_polar((-PLAYER_PUSH_ACC, self.angle))
         else:
             self.acc = pg.Vector2(0, 0)
-        # Update the velocity and position based on acceleration and delta-time.
+        # Update the velocity based on acceleration and delta-time.
         self.vel += self.acc * dt
-        self.pos += self.vel * dt
-
-        # Collision detection with the game boundaries.
-        # The player bounces off the game edges.
-        if self.pos.x - self.radius < 0:
-            self.vel.x *= -1
-            self.pos.x = self.radius
-        if self.pos.x + self.radius > game_bounds.x:
-            self.vel.x *= -1
-            self.pos.x = game_bounds.x - self.radius
-        if self.pos.y - self.radius < 0:
-            self.vel.y *= -1
-            self.pos.y = self.radius
-        if self.pos.y + self.radius > game_bounds.y:
-            self.vel.y *= -1
-            self.pos.y = game_bounds.y - self.radius
+        # Move along the frame's path, bouncing off the game edges and asteroids at the moment of impact.
+        # Testing the whole path instead of only the end position means a long frame can't skip past anything.
+        hit = self.sweep(self.vel * dt + gravity_motion, dt, game_bounds, obstacles)
 
         # Update the image and rect.
-        self.image = pg.transform.rotate(self.base_image, -self.angle)
-        self.mask = pg.mask.from_surface(self.image)
-        self.mask_image = self.mask.to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
-        self.rect = self.image.get_rect(center=self.pos)
+        self.update_image()
 
         # Collide with obstacles.
         for obstacle in obstacles:
@@ -117,11 +165,99 @@ class Player:
                 self.vel = point - obstacle.pos + self.rect.topleft
                 self.vel.scale_to_length(vel_length)
                 return True  # Indicate a hit sound is to be played.
+        return hit
 
+    def sweep(self, motion: pg.Vector2, dt: float, game_bounds: pg.Vector2, obstacles: list["Obstacle"]) -> bool:
+        """Move the player's collision circle by ``motion``, resolving each impact at its time of impact.
+
+        ``motion`` is the velocity times ``dt``, plus any other displacement for the frame, like the asteroid pull.
+        After a bounce, the rest of the frame is spent travelling along the new velocity, and the rest of the
+        other displacement still applies, minus any part of it pushing into what was just hit.
+        The sweep uses the round collision circle, not the mask, so it stops the player where the circle
+        touches. The mask test in ``update`` only catches the parts of the image that stick out of it.
+        It returns a bool indicating a collision with an asteroid.
+        """
+        hit = False
+        pull = motion - self.vel * dt  # The part of the motion that doesn't come from the velocity.
+        # Reading an entity's position makes a new Vector2, so each one is read once, not once per bounce.
+        circles = [(obstacle.pos, self.radius + obstacle.radius) for obstacle in obstacles]
+        for _ in range(MAX_SWEEP_BOUNCES):
+            if not motion:
+                break
+            # Find the earliest impact along the path, as a fraction of ``motion``.
+            impact_time = 1.0
+            normal: Optional[pg.Vector2] = None
+            hit_obstacle_pos: Optional[pg.Vector2] = None
+
+            # The game boundaries. The max() handles a player that already starts out of bounds.
+            if motion.x < 0 and self.pos.x + motion.x < self.radius:
+                wall_time = max(0.0, (self.radius - self.pos.x) / motion.x)
+                if wall_time < impact_time:
+                    impact_time, normal = wall_time, pg.Vector2(1, 0)
+            if motion.x > 0 and self.pos.x + motion.x > game_bounds.x - self.radius:
+                wall_time = max(0.0, (game_bounds.x - self.radius - self.pos.x) / motion.x)
+                if wall_time < impact_time:
+                    impact_time, normal = wall_time, pg.Vector2(-1, 0)
+            if motion.y < 0 and self.pos.y + motion.y < self.radius:
+                wall_time = max(0.0, (self.radius - self.pos.y) / motion.y)
+                if wall_time < impact_time:
+                    impact_time, normal = wall_time, pg.Vector2(0, 1)
+            if motion.y > 0 and self.pos.y + motion.y > game_bounds.y - self.radius:
+                wall_time = max(0.0, (game_bounds.y - self.radius - self.pos.y) / motion.y)
+                if wall_time < impact_time:
+                    impact_time, normal = wall_time, pg.Vector2(0, -1)
+
+            # The asteroids.
+            for obstacle_pos, radius in circles:
+                obstacle_time = utils.swept_circle_hit(self.pos, motion, obstacle_pos, radius)
+                if obstacle_time is not None and obstacle_time < impact_time:
+                    impact_time, normal, hit_obstacle_pos = obstacle_time, None, obstacle_pos
+
+            self.pos += motion * impact_time
+            if normal is None and hit_obstacle_pos is None:
+                break  # Nothing was in the way.
+
+            if hit_obstacle_pos is not None:
+                # Bounce straight away from the asteroid, losing some speed.
+                normal = self.pos - hit_obstacle_pos
+                if normal:
+                    normal.normalize_ip()
+                    vel_length = self.vel.length() * ASTEROID_BOUNCE
+                    if vel_length:
+                        self.vel = normal * vel_length
+                hit = True
+            elif self.vel.dot(normal) < 0:
+                # Bounce off the edge. The pull alone can carry the player into an edge it is moving away from,
+                # and then the velocity is left alone.
+                self.vel.reflect_ip(normal)
+            # Spend the rest of the frame moving along the new velocity, with the rest of the pull.
+            # The pull would only push the player straight back into what it hit, so that part is dropped.
+            dt *= 1 - impact_time
+            pull *= 1 - impact_time
+            if (into := pull.dot(normal)) < 0:
+                pull -= normal * into
+            motion = self.vel * dt + pull
+        return hit
+
+
+    def update_image(self):
+        """Rebuild the image, mask, and rect from the current angle and position."""
+        if (baked := BAKED_SPRITES.get(self.base_image)) is not None:
+            self.image = baked.frame(-self.angle)
+            self.mask = baked.mask(-self.angle)
+            self.mask_image = baked.mask_image(-self.angle)
+        else:
+            self.image = pg.transform.rotate(self.base_image, -self.angle)
+            self.mask = pg.mask.from_surface(self.image)
+            self.mask_image = self.mask.to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
+        self.rect = self.image.get_rect(center=self.pos)  # This is used only for drawing.
 
     def rotate(self, angle: float, obstacles: list["Obstacle"]):
         """Set the player's angle to the given angle, or not if it would collide with an asteroid."""
-        test_mask = pg.mask.from_surface(pg.transform.rotate(self.base_image, -angle))
+        if (baked := BAKED_SPRITES.get(self.base_image)) is not None:
+            test_mask = baked.mask(-angle)
+        else:
+            test_mask = pg.mask.from_surface(pg.transform.rotate(self.base_image, -angle))
         mask_top_left = test_mask.get_rect(center=self.pos).topleft
         for obstacle in obstacles:
             if test_mask.overlap(obstacle.mask, pg.Vector2(obstacle.mask_rect.topleft) - mask_top_left):
@@ -129,23 +265,34 @@ class Player:
         self.angle += angle
         self.angle %= 360
 
-    def draw(self, screen: pg.Surface, camera: pg.Vector2):
-        """Draw the player to the screen."""
-        screen.blit(self.image, self.rect.topleft + camera)
+    def draw(self, queue: utils.RenderQueue, camera: pg.Vector2):
+        """Submit the player to the render queue."""
+        # The player always uses its baked frames when it has them, since they come with its masks.
+        source = None if self.base_image in BAKED_SPRITES else rotation_source(self.base_image, -self.angle)
+        queue.submit(self.image, (self.rect.x + camera.x, self.rect.y + camera.y), PLAYER_LAYER, source=source)
 
 
-class Obstacle:
-    def __init__(self, pos: Sequence[float], image: pg.Surface):
-        self.pos = pg.Vector2(pos)  # noqa
-        self.rot_speed = random.randint(-MAX_ASTEROID_ROT_SPEED, MAX_ASTEROID_ROT_SPEED)
+class Obstacle(entities.Entity):
+    # The position, angle, rotation speed, and radius live in the entity store.
+    __slots__ = ("base_image", "image", "image_angle", "image_source", "rect", "mask_image", "mask", "mask_rect")
+
+    def __init__(self, pos: Sequence[float], image: pg.Surface, store: Optional[entities.EntityStore] = None):
+        rot_speed = utils.GAME_RANDOM.randint(-MAX_ASTEROID_ROT_SPEED, MAX_ASTEROID_ROT_SPEED)
+        angle = utils.GAME_RANDOM.randrange(360)
+        super().__init__(pos, entities.OBSTACLE_KIND, angle, rot_speed, image.get_width() // 2, store)
         self.base_image = image
-        self.radius = self.base_image.get_width() // 2
 
-        self.angle = random.randrange(360)
-        self.image = pg.transform.rotate(self.base_image, self.angle)
+        self.image = rotated_image(self.base_image, self.angle)
+        self.image_angle = self.angle  # The angle the image was rotated to.
+        self.image_source = rotation_source(self.base_image, self.angle)  # For the render queue.
         self.rect = self.image.get_rect(center=self.pos)  # Used only for drawing.
-        self.mask_image = utils.make_circle_image(image.get_width() // 2, CYAN)
-        self.mask = pg.mask.from_surface(self.mask_image)
+        # The collision circle, shared with every asteroid of the same size when it is baked.
+        if (baked := BAKED_CIRCLES.get(image.get_width() // 2)) is not None:
+            self.mask_image = baked.frame(0)
+            self.mask = baked.mask(0)
+        else:
+            self.mask_image = utils.make_circle_image(image.get_width() // 2, CYAN)
+            self.mask = pg.mask.from_surface(self.mask_image)
         self.mask_rect = self.mask.get_rect(center=self.pos)  # For drawing and collision detection.
         # self.mask = pg.mask.from_surface(self.image)
         # self.mask_image = self.mask.to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
@@ -154,56 +301,102 @@ class Obstacle:
         """Update the obstacle.
 
         Rotate the image, etc.
+        The game loop rotates every entity at once with ``EntityStore.update`` and only calls ``update_image``.
         """
-        self.angle += self.rot_speed * dt
-        self.angle %= 360
-        self.image = pg.transform.rotate(self.base_image, self.angle)
+        self.angle = (self.angle + self.rot_speed * dt) % 360
+        self.update_image()
+
+    def update_image(self, rotation_step: float = 0):
+        """Rebuild the image and rect from the current angle.
+
+        With a ``rotation_step``, the image only turns in steps of that many degrees, which is much cheaper.
+        """
+        image_angle = rotation_angle(self.angle, rotation_step)
+        if image_angle == self.image_angle:
+            return  # The image wouldn't change.
+        self.image = rotated_image(self.base_image, image_angle, rotation_step)
+        self.image_angle = image_angle
+        self.image_source = rotation_source(self.base_image, image_angle, rotation_step)
         self.rect = self.image.get_rect(center=self.pos)
         # self.mask = pg.mask.from_surface(self.image)
         # self.mask_image = self.mask.to_surface(setcolor=CYAN, unsetcolor=TRANS_BLACK)
 
-    def draw(self, screen: pg.Surface, camera: pg.Vector2):
-        """Draw the obstacle to the screen."""
-        screen.blit(self.image, self.rect.topleft + camera)
+    def update_rects(self):
+        """Move the rects to the current position. Needed only when the obstacle moves."""
+        pos = self.pos
+        self.rect.center = pos
+        self.mask_rect.center = pos
+
+    def draw(self, queue: utils.RenderQueue, camera: pg.Vector2):
+        """Submit the obstacle to the render queue."""
+        queue.submit(self.image, (self.rect.x + camera.x, self.rect.y + camera.y), OBSTACLE_LAYER,
+                     source=self.image_source)
 
 
-class Item:
+class Item(entities.Entity):
     """Basic Item class, just a container with a position, image, and item type."""
-    def __init__(self, pos: Sequence[float], image: pg.Surface, item_type: ItemType = ItemType.FUEL):
-        self.type = item_type
-        self.pos = pg.Vector2(pos)  # noqa
+    # The position, angle, rotation speed, and type live in the entity store.
+    __slots__ = ("base_image", "image", "image_angle", "image_source", "rect")
+
+    def __init__(self, pos: Sequence[float], image: pg.Surface, item_type: ItemType = ItemType.FUEL,
+                 store: Optional[entities.EntityStore] = None):
+        rot_speed = PORTAL_ROTATE_SPEED if utils.GAME_RANDOM.random() > 0.5 else -PORTAL_ROTATE_SPEED
+        # Only the exit portal rotates.
+        super().__init__(pos, item_type.value, 0, rot_speed if item_type is ItemType.EXIT else 0, 0, store)
         self.base_image = image
         self.image = image
+        self.image_angle = 0.0  # The angle the image was rotated to.
+        self.image_source = None  # For the render queue. The unrotated image is drawn as it is.
         self.rect = self.image.get_rect(center=pos)
-        self.angle = 0
-        self.rot_speed = PORTAL_ROTATE_SPEED if random.random() > 0.5 else -PORTAL_ROTATE_SPEED
+
+    @property
+    def type(self) -> ItemType:
+        return ItemType(self.kind)
 
     def update(self, dt: float):
-        """Update the item. Currently only used for rotating the exit portal."""
-        # Don't update if not the exit portal.
-        if self.type is not ItemType.EXIT:
+        """Update the item. Currently only used for rotating the exit portal.
+
+        The game loop rotates every entity at once with ``EntityStore.update`` and only calls ``update_image``.
+        """
+        self.angle = (self.angle + self.rot_speed * dt) % 360
+        self.update_image()
+
+    def update_image(self, rotation_step: float = 0):
+        """Rebuild the image and rect from the current angle.
+
+        With a ``rotation_step``, the image only turns in steps of that many degrees, which is much cheaper.
+        """
+        # Don't update if the image wouldn't change.
+        image_angle = rotation_angle(self.angle, rotation_step)
+        if image_angle == self.image_angle:
             return
         # Rotate the image and update the rect.
-        self.angle += self.rot_speed * dt
-        self.angle %= 360
-        self.image = pg.transform.rotate(self.base_image, self.angle)
+        self.image = rotated_image(self.base_image, image_angle, rotation_step)
+        self.image_angle = image_angle
+        self.image_source = rotation_source(self.base_image, image_angle, rotation_step)
         self.rect = self.image.get_rect(center=self.pos)
 
-    def draw(self, screen: pg.Surface, camera: pg.Vector2):
-        """Draw the item to the screen."""
-        screen.blit(self.image, self.rect.topleft + camera)
+    def draw(self, queue: utils.RenderQueue, camera: pg.Vector2):
+        """Submit the item to the render queue."""
+        queue.submit(self.image, (self.rect.x + camera.x, self.rect.y + camera.y), ITEM_LAYER,
+                     source=self.image_source)
 
-class Teleporter:
+class Teleporter(entities.Entity):
     COOLDOWN_TIME = 2 #adds a wait period to prevent teleport spam
+    # The position and cooldown live in the entity store.
+    __slots__ = ("image", "rect", "identifier", "linked_teleporter")
 
-    def __init__(self, pos: Sequence[float], image: pg.Surface, identifier: str):
-        self.pos = pg.Vector2(pos)
+    def __init__(self, pos: Sequence[float], image: pg.Surface, identifier: str,
+                 store: Optional[entities.EntityStore] = None):
+        super().__init__(pos, ItemType.TELEPORTER.value, store=store)  # cooldown starts at 0
         self.image = image
         self.rect = self.image.get_rect(center=pos)
         self.identifier = identifier
         self.linked_teleporter: Optional['Teleporter'] = None  # Link to another teleporter
-        self.type = ItemType.TELEPORTER
-        self.cooldown = 0  #initialize cooldown
+
+    @property
+    def type(self) -> ItemType:
+        return ItemType.TELEPORTER
 
     def link(self, other: 'Teleporter'):
         """Link this teleporter to another teleporter."""
@@ -218,12 +411,16 @@ class Teleporter:
             self.cooldown = self.COOLDOWN_TIME #Sets cooldown to teleporter
             self.linked_teleporter.cooldown = self.COOLDOWN_TIME #also sets a cooldown to linked teleporter
 
-    def draw(self, screen: pg.Surface, camera: pg.Vector2):
-        """Draw the teleporter to the screen."""
-        screen.blit(self.image, self.rect.topleft + camera)
+    def draw(self, queue: utils.RenderQueue, camera: pg.Vector2):
+        """Submit the teleporter to the render queue."""
+        queue.submit(self.image, (self.rect.x + camera.x, self.rect.y + camera.y), ITEM_LAYER)
 
     def update(self, dt: float):
-        """Update method for any future functionality (e.g., animations)."""
-        if self.cooldown > 0:
-            self.cooldown -= dt
-        # pass
+        """Update method for any future functionality (e.g., animations).
+
+        The cooldown runs on the game clock, so it doesn't need updating here.
+        """
+        pass
+
+    def update_image(self, rotation_step: float = 0):
+        """Teleporters don't animate yet."""
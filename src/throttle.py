@@ -0,0 +1,115 @@
+# -*- coding:utf-8 -*-
+# This file holds the idle throttle, which stops the game from using a whole CPU core when nobody is looking at it.
+# With an unbounded frame-rate the game loop never sleeps, even when the window is minimized or in the background.
+# It shouldn't import any local files other than utils, to avoid circular imports.
+
+# Standard library imports.
+import logging  # The throttle logs how much CPU time each idle stretch saved.
+import time  # Used to measure wall and CPU time.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+import utils
+
+logger = logging.getLogger(__name__)
+
+# Constants.
+UNFOCUSED_FPS = 10  # The frame-rate while the window is visible but in the background.
+HIDDEN_FPS = 2  # The frame-rate while the window is minimized or hidden. Only events are handled.
+
+
+class IdleThrottle:
+    """Watches the window events and slows the game loop down while the window is unfocused or minimized.
+
+    While idle the game clock is suspended, so nothing moves and no timers run, and the loop ticks at a low
+    frame-rate. While minimized nothing is drawn either. When the window comes back the game carries on
+    from where it stopped, and the time spent idle never reaches the game.
+    The CPU time saved is estimated from how much CPU the game used per second while it was active.
+    """
+    def __init__(self, clock: utils.GameClock = utils.GAME_CLOCK, unfocused_fps: int = UNFOCUSED_FPS,
+                 hidden_fps: int = HIDDEN_FPS):
+        self.clock = clock
+        self.unfocused_fps = unfocused_fps
+        self.hidden_fps = hidden_fps
+        self.focused = True
+        self.minimized = False
+        self.was_idle = False  # Whether the last frame was an idle frame.
+
+        # CPU and wall time spent active and idle, for working out the savings.
+        self.active_wall = self.active_cpu = 0.0
+        self.idle_wall = self.idle_cpu = 0.0
+        self.saved_cpu = 0.0  # The total CPU seconds saved so far.
+        self.idle_started_wall = self.idle_started_cpu = 0.0
+        self.last_wall = time.perf_counter()
+        self.last_cpu = time.process_time()
+
+    @property
+    def idle(self) -> bool:
+        return not self.focused or self.minimized
+
+    @property
+    def visible(self) -> bool:
+        """Whether there is any point drawing the frame."""
+        return not self.minimized
+
+    @property
+    def active_cpu_fraction(self) -> float:
+        """The fraction of a CPU core the game used while it was active."""
+        return self.active_cpu / self.active_wall if self.active_wall else 1.0
+
+    def handle_event(self, event: pg.event.Event) -> bool:
+        """Update the window state from an event. Return True if the game just went idle or came back."""
+        was_idle = self.idle
+        if event.type == pg.WINDOWFOCUSLOST:
+            self.focused = False
+        elif event.type == pg.WINDOWFOCUSGAINED:
+            self.focused = True
+        elif event.type in (pg.WINDOWMINIMIZED, pg.WINDOWHIDDEN):
+            self.minimized = True
+        elif event.type in (pg.WINDOWRESTORED, pg.WINDOWSHOWN, pg.WINDOWMAXIMIZED):
+            self.minimized = False
+        else:
+            return False
+        if self.idle == was_idle:
+            return False
+        self.clock.suspended = self.idle
+        if self.idle:
+            self.idle_started_wall, self.idle_started_cpu = self.idle_wall, self.idle_cpu
+        else:
+            self.report()
+        return True
+
+    def tick(self, clock: pg.time.Clock, fps: int) -> float:
+        """Wait for the next frame and return the real seconds since the last one, like ``clock.tick(fps) / 1000``.
+
+        While idle this waits for the low frame-rate instead of ``fps``. The first frame after coming back
+        returns 0, so the time spent waiting is not counted as a long frame.
+        """
+        idle = self.idle
+        real_dt = clock.tick(self.hidden_fps if self.minimized else self.unfocused_fps if idle else fps)
+        self.measure(idle)
+        resumed = self.was_idle and not idle
+        self.was_idle = idle
+        return 0.0 if resumed else real_dt / 1000.0
+
+    def measure(self, idle: bool):
+        """Add the wall and CPU time since the last frame to the active or idle totals."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        if idle:
+            self.idle_wall += wall - self.last_wall
+            self.idle_cpu += cpu - self.last_cpu
+        else:
+            self.active_wall += wall - self.last_wall
+            self.active_cpu += cpu - self.last_cpu
+        self.last_wall, self.last_cpu = wall, cpu
+
+    def report(self):
+        """Log the CPU time saved by the idle stretch that just ended."""
+        idle_wall = self.idle_wall - self.idle_started_wall
+        idle_cpu = self.idle_cpu - self.idle_started_cpu
+        saved = max(idle_wall * self.active_cpu_fraction - idle_cpu, 0.0)
+        self.saved_cpu += saved
+        logger.info("Idle for %.1f s using %.2f s of CPU, saving about %.1f s (%.1f s in total)",
+                    idle_wall, idle_cpu, saved, self.saved_cpu)
@@ -6,6 +6,13 @@
 from typing import Hashable, Callable, Sequence, Optional, Iterable
 from pathlib import Path  # This module allows object-oriented filesystem interaction.
 import random  # Random number generation.
+import math  # C-style math functions.
+import itertools  # Iteration helpers, used here for grouping.
+from operator import itemgetter  # Fast key functions for sorting and grouping.
+from collections import OrderedDict  # A dict that remembers order, used for least-recently-used eviction.
+import weakref  # Lets the cache registry see caches without keeping them alive.
+import heapq  # A priority queue, used to run scheduled calls in order.
+import threading  # The image caches can be used from the simulation and render threads at once.
 
 # Third-party library imports.
 import pygame as pg
@@ -58,33 +65,294 @@ def make_circle_image(radius: int, color: Sequence[int]) -> pg.Surface:
     return image
 
 
+def swept_circle_hit(start: pg.Vector2, motion: pg.Vector2, center: pg.Vector2, radius: float) -> Optional[float]:
+    """Return the fraction of ``motion`` at which a moving point first touches a circle, or None if it doesn't.
+
+    Sweeping a circle against another circle is the same as sweeping a point against a circle
+    whose radius is the sum of the two radii, so pass the combined radius here.
+    A point that already overlaps the circle and is moving inwards hits at 0.
+    """
+    offset = start - center
+    # Solve |offset + t * motion| = radius for t. This is a quadratic a*t^2 + 2*b*t + c = 0.
+    c = offset.length_squared() - radius * radius
+    b = offset.dot(motion)
+    if c < 0:
+        # Already overlapping, so only moving further in counts as a hit.
+        return 0.0 if b < 0 else None
+    a = motion.length_squared()
+    if a == 0 or b >= 0:  # Not moving, or moving away from the circle.
+        return None
+    discriminant = b * b - a * c
+    if discriminant < 0:  # The path misses the circle entirely.
+        return None
+    t = (-b - math.sqrt(discriminant)) / a
+    return t if t <= 1 else None
+
+
+class ScheduledCall:
+    """A callback waiting in a ``TimerWheel``. Keep it around to cancel the call."""
+    __slots__ = ("due", "callback", "interval", "cancelled")
+
+    def __init__(self, due: float, callback: Callable[[], None], interval: Optional[float] = None):
+        self.due = due  # The game time the callback is due at, in seconds.
+        self.callback = callback
+        self.interval = interval  # Repeating calls are rescheduled this many seconds after they were due.
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Runs callbacks at game times, doing work only for the slots the clock passes over.
+
+    Time is split into ticks of ``resolution`` seconds, and each call goes in the slot for the tick it is due in.
+    Advancing the wheel only looks at the slots for the ticks that passed, plus the one it is in now,
+    so calls that are far off cost nothing per frame.
+    Calls more than one full turn of the wheel away just stay in their slot until their turn.
+    Every tick is found by rounding down, so a call runs on the first advance that reaches its due time.
+    """
+    def __init__(self, resolution: float = 0.01, slot_count: int = 512):
+        self.resolution = resolution
+        self.slots: list[list[ScheduledCall]] = [[] for _ in range(slot_count)]
+        self.tick = -1  # The last tick that is completely over. Its calls have all run.
+        self.count = 0  # The number of calls waiting.
+
+    def __len__(self) -> int:
+        return self.count
+
+    def tick_at(self, time: float) -> int:
+        """Return the tick a game time falls in."""
+        return math.floor(time / self.resolution)
+
+    def clear(self, time: float = 0.0):
+        """Drop every call, and start the wheel at the given game time."""
+        self.slots = [[] for _ in self.slots]
+        self.tick = self.tick_at(time) - 1
+        self.count = 0
+
+    def _add(self, call: ScheduledCall):
+        # A call is never put in a tick that is already over, or it would wait a full turn.
+        tick = max(self.tick_at(call.due), self.tick + 1)
+        self.slots[tick % len(self.slots)].append(call)
+        self.count += 1
+
+    def schedule(self, due: float, callback: Callable[[], None], interval: Optional[float] = None) -> ScheduledCall:
+        """Run the callback at the given game time, and then every ``interval`` seconds if one is given."""
+        call = ScheduledCall(due, callback, interval)
+        self._add(call)
+        return call
+
+    def advance(self, now: float):
+        """Run every call that is due at or before ``now``, in seconds of game time."""
+        target = self.tick_at(now)  # The tick ``now`` is in. It isn't over, so its later calls must wait.
+        if target <= self.tick:
+            return
+        # After a long jump every slot gets looked at once, instead of going around the wheel many times.
+        ticks = range(self.tick + 1, target + 1) if target - self.tick < len(self.slots) else range(len(self.slots))
+        self.tick = target - 1
+        due_calls = []
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            waiting = []
+            for call in slot:
+                if call.cancelled:
+                    self.count -= 1
+                elif call.due <= now:
+                    due_calls.append(call)
+                    self.count -= 1
+                else:
+                    waiting.append(call)
+            slot[:] = waiting
+        # Run the calls in the order they were due. A repeating call that is due again before ``now``
+        # (after a long frame) goes back in the heap, so it catches up on every repeat it missed.
+        heap = [(call.due, order, call) for order, call in enumerate(due_calls)]
+        heapq.heapify(heap)
+        order = len(heap)
+        while heap:
+            _, _, call = heapq.heappop(heap)
+            if call.cancelled:
+                continue  # An earlier callback cancelled it.
+            call.callback()
+            if call.interval is not None and not call.cancelled:
+                # Repeat from when it was due, so a late frame doesn't make the interval drift.
+                call.due += max(call.interval, self.resolution)
+                if call.due <= now:
+                    heapq.heappush(heap, (call.due, order, call))
+                    order += 1
+                else:
+                    self._add(call)
+
+
+class GameClock:
+    """The one clock the game runs on. It advances once per frame and can be paused or sped up and slowed down.
+
+    Everything that moves or expires should use the ``dt`` returned by ``advance`` or the clock's ``time``,
+    never the wall clock, so pausing and time scaling affect the whole game the same way.
+    """
+    def __init__(self, resolution: float = 0.01, slot_count: int = 512):
+        self.time = 0.0  # Seconds of game time since the clock was reset.
+        self.dt = 0.0  # The game time that passed in the last frame.
+        self.scale = 1.0  # How fast game time runs compared to real time.
+        self.paused = False  # Paused by the player.
+        self.suspended = False  # Stopped by the game itself, like while the window is minimized.
+        self.wheel = TimerWheel(resolution, slot_count)
+
+    @property
+    def ticks(self) -> int:
+        """Milliseconds of game time, like ``pygame.time.get_ticks()``."""
+        return int(self.time * 1000)
+
+    def reset(self):
+        """Set the time back to 0, unpause, and drop every scheduled call."""
+        self.time = 0.0
+        self.dt = 0.0
+        self.paused = False
+        self.suspended = False
+        self.wheel.clear()
+
+    def restore(self, time: float):
+        """Jump to a game time, like when rewinding, and drop every scheduled call."""
+        self.time = time
+        self.dt = 0.0
+        self.wheel.clear(time)
+
+    def advance(self, real_dt: float) -> float:
+        """Move game time forward by the real seconds that passed, run the calls that came due, and return ``dt``."""
+        self.dt = 0.0 if self.paused or self.suspended else real_dt * self.scale
+        self.time += self.dt
+        self.wheel.advance(self.time)
+        return self.dt
+
+    def schedule(self, delay: float, callback: Callable[[], None], interval: Optional[float] = None) -> ScheduledCall:
+        """Run the callback after ``delay`` seconds of game time, and then every ``interval`` seconds if given."""
+        return self.wheel.schedule(self.time + delay, callback, interval)
+
+
+# The clock the game runs on.
+GAME_CLOCK = GameClock()
+# The random numbers the game uses. The snapshots seed this one generator, not the `random` module,
+# so nothing else that uses random numbers is disturbed by rewinding.
+GAME_RANDOM = random.Random()
+
+
 class Timer:
-    """A utility class for checking when certain time periods have passed."""
-    def __init__(self, interval: float = 0, start: int = 0):
+    """A utility class for checking when certain time periods have passed.
+
+    It runs on game time, so it stops while the game is paused.
+    """
+    def __init__(self, interval: float = 0, start: int = 0, clock: GameClock = GAME_CLOCK):
         """The interval is the length of time in milliseconds.
 
         An optional start value gives the timer a starting point in milliseconds.
         """
         self.interval = interval
         self.last_tick = start
+        self.clock = clock
 
     def tick(self, interval: Optional[float] = None) -> bool:
         """Return a bool indicating if the time period specified by ``interval`` has passed.
 
         If no interval is given to ``tick``, it uses the interval passed into the class constructor.
         """
-        if pg.time.get_ticks() - self.last_tick >= (self.interval if interval is None else interval):
-            self.last_tick = pg.time.get_ticks()
+        now = self.clock.ticks
+        if now - self.last_tick >= (self.interval if interval is None else interval):
+            self.last_tick = now
             return True
         return False
 
 
+def surface_bytes(surface: pg.Surface) -> int:
+    """Return roughly how many bytes of pixel data a Surface owns.
+
+    Subsurfaces share their parent's pixels, so they own nothing.
+    """
+    if surface.get_parent() is not None:
+        return 0
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class CacheRegistry:
+    """Keeps track of every ``ImageCache`` so they can share one memory budget and be reported together.
+
+    When the caches together hold more than ``budget`` bytes, the biggest cache evicts
+    its least recently used images until everything fits again. A budget of None means no limit.
+    """
+    def __init__(self, budget: Optional[int] = None):
+        self.budget = budget
+        self.caches: weakref.WeakSet[ImageCache] = weakref.WeakSet()
+        # One cache can evict from another, so all the caches in a registry share one lock.
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.caches)
+
+    def register(self, cache: "ImageCache"):
+        """Add a cache. A cache named like one already here is renamed with a number, so the report shows both."""
+        with self.lock:
+            names = {other.name for other in self.caches}
+            if cache.name in names:
+                number = 2
+                while f"{cache.name} {number}" in names:
+                    number += 1
+                cache.name = f"{cache.name} {number}"
+            self.caches.add(cache)
+
+    @property
+    def total_bytes(self) -> int:
+        # The render thread can add or evict images while this adds them up, so it holds the lock too.
+        with self.lock:
+            return sum(cache.bytes for cache in self.caches)
+
+    def enforce_budget(self, keep: Optional["ImageCache"] = None):
+        """Evict images until the caches fit in the budget.
+
+        ``keep`` is a cache whose most recent image must survive, because it is about to be used.
+        """
+        if self.budget is None:
+            return
+        with self.lock:
+            total = self.total_bytes
+            while total > self.budget:
+                # Evict from the biggest cache that still has something it can give up.
+                candidates = [cache for cache in self.caches if len(cache) > (1 if cache is keep else 0)]
+                if not candidates:
+                    return
+                total -= max(candidates, key=lambda cache: cache.bytes).evict()
+
+    def report(self) -> dict[str, dict[str, int]]:
+        """Return the counters of every registered cache, keyed by cache name. The names are unique."""
+        with self.lock:
+            return {cache.name: cache.stats() for cache in self.caches}
+
+
+# The registry all image caches join unless they are given another one.
+IMAGE_CACHES = CacheRegistry()
+
+
 # These are for high-performance particle systems.
 class ImageCache:
-    """Utility class for caching images from certain data for fast access."""
-    def __init__(self, make_image_func: Callable[[Hashable], pg.Surface]):
-        self.cache: dict[Hashable, pg.Surface] = {}
+    """Utility class for caching images from certain data for fast access.
+
+    The cache can be limited to ``max_bytes`` of pixel data, and also counts toward the budget of its registry.
+    When it is over either limit, the least recently used images are evicted first.
+    """
+    def __init__(self, make_image_func: Callable[[Hashable], pg.Surface], name: str = "image cache",
+                 max_bytes: Optional[int] = None, registry: Optional[CacheRegistry] = IMAGE_CACHES):
+        self.cache: OrderedDict[Hashable, pg.Surface] = OrderedDict()
         self.make_image = make_image_func
+        self.name = name
+        self.max_bytes = max_bytes
+        self.registry = registry
+        self.bytes = 0  # The pixel data currently held.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = registry.lock if registry is not None else threading.RLock()
+        if registry is not None:
+            registry.register(self)
 
     def __len__(self) -> int:
         return len(self.cache)
@@ -94,13 +362,49 @@ class ImageCache:
         return len(self)
 
     def clear_cache(self):
-        self.cache: dict[Hashable, pg.Surface] = {}
+        self.cache: OrderedDict[Hashable, pg.Surface] = OrderedDict()
+        self.bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        """Return the cache counters."""
+        return {"images": len(self), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    def evict(self) -> int:
+        """Remove the least recently used image and return the number of bytes freed."""
+        _, image = self.cache.popitem(last=False)
+        freed = surface_bytes(image)
+        self.bytes -= freed
+        self.evictions += 1
+        return freed
+
+    def warm(self, items: Iterable[Hashable]):
+        """Create and cache the images for the given items ahead of time, so they don't cost anything mid-game."""
+        for item in items:
+            self.get_image(item)
 
     def get_image(self, item: Hashable) -> pg.Surface:
         """If the requested image exists, return it. Otherwise, create, cache, and return the image."""
-        if item not in self.cache:
-            self.cache[item] = self.make_image(item)
-        return self.cache[item]
+        with self.lock:
+            try:
+                image = self.cache[item]
+            except KeyError:
+                pass
+            else:
+                self.hits += 1
+                self.cache.move_to_end(item)
+                return image
+
+            self.misses += 1
+            image = self.cache[item] = self.make_image(item)
+            self.bytes += surface_bytes(image)
+            # Make room, but never throw away the image that was just asked for.
+            if self.max_bytes is not None:
+                while self.bytes > self.max_bytes and len(self.cache) > 1:
+                    self.evict()
+            if self.registry is not None:
+                self.registry.enforce_budget(keep=self)
+            return image
 
 
 class Particle:
@@ -120,16 +424,17 @@ class Particle:
 
 class SmokeParticle(Particle):
     """The extinguisher smoke particles that appear when the player is thrusting."""
-    def __init__(self, pos: Sequence[float], vel: Sequence[float], radius: int):
+    def __init__(self, pos: Sequence[float], vel: Sequence[float], radius: int, rng: random.Random = GAME_RANDOM):
         self.pos = pg.Vector2(pos)  # noqa
         self.vel = pg.Vector2(vel)  # noqa
         self.radius = radius
-        self.life_time = random.randint(1500, 2000)
-        self.start_time = pg.time.get_ticks()
+        self.life_time = rng.randint(1500, 2000)
+        self.age = 0.0  # In milliseconds, counted from the dt it is given, so it follows game time.
 
     def update(self, dt: float, *args, **kwargs) -> bool:
         # Delete the particles when their lifetime expires.
-        if pg.time.get_ticks() - self.start_time >= self.life_time:
+        self.age += dt * 1000
+        if self.age >= self.life_time:
             return False
         self.pos += self.vel * dt
         return True
@@ -168,20 +473,26 @@ class PortalParticle(Particle):
 class ParticleGroup:
     """The container class that holds, updates, and draws particles."""
     def __init__(self, image_cache: ImageCache, blend: int = pg.BLENDMODE_NONE,
-                 particles: Optional[list[Particle]] = None):
+                 particles: Optional[list[Particle]] = None, max_particles: Optional[int] = None):
         self.particles: list[Particle] = particles if particles is not None else []
         self.image_cache = image_cache
         self.blend = blend
+        self.max_particles = max_particles  # New particles are dropped once there are this many, unless None.
 
     def __len__(self):
         return len(self.particles)
 
     def add(self, particles: Particle | Iterable[Particle]):
-        """Add a particle or a sequence of particles to the ParticleGroup."""
+        """Add a particle or a sequence of particles to the ParticleGroup.
+
+        Particles past ``max_particles`` are dropped.
+        """
         if isinstance(particles, Particle):
-            self.particles.append(particles)
-        else:
+            particles = (particles,)
+        if self.max_particles is None:
             self.particles.extend(particles)
+        else:
+            self.particles.extend(itertools.islice(particles, max(self.max_particles - len(self.particles), 0)))
 
     def update(self, dt: float, *args, **kwargs):
         """Update all the particles, deleting them when they expire."""
@@ -195,3 +506,153 @@ class ParticleGroup:
     def draw(self, screen: pg.Surface, camera: pg.Vector2, blend: int = pg.BLENDMODE_NONE):
         """Blit all particles on the screen with a certain blend mode."""
         screen.fblits([self._get_draw_tuple(p, camera) for p in self.particles], blend if blend else self.blend)  # noqa
+
+    def submit(self, queue: "RenderQueue", camera: pg.Vector2, layer: int = 0, blend: int = pg.BLENDMODE_NONE):
+        """Submit all particles to a ``RenderQueue`` instead of drawing them immediately."""
+        queue.submit_many([self._get_draw_tuple(p, camera) for p in self.particles], layer,
+                          blend if blend else self.blend)
+
+
+class ParticleEmitter:
+    """Emits particles into a ParticleGroup at a steady rate per second, no matter the frame-rate.
+
+    Particles due in the middle of a frame are placed along the path the emitter moved that frame,
+    and aged by the part of the frame they already existed for, so a fast emitter leaves an even trail.
+    The emitter's ``max_per_update`` caps how many particles a single long frame can make,
+    and the group's ``max_particles`` caps how many are alive at once.
+    """
+    def __init__(self, group: ParticleGroup, make_particle: Callable[[pg.Vector2], Particle], rate: float,
+                 pos: Sequence[float] = (0, 0), max_per_update: int = 50, max_gap: float = 100):
+        """``make_particle`` takes the spawn position and returns a new particle. The rate is in particles per second.
+
+        If the emitter jumps further than ``max_gap`` pixels in one frame (like a teleport),
+        the particles are not spread along the jump.
+        """
+        self.group = group
+        self.make_particle = make_particle
+        self.rate = rate
+        self.rate_scale = 1.0  # Multiplies the rate, so emission can be turned down without losing the base rate.
+        self.max_per_update = max_per_update
+        self.max_gap = max_gap
+        self.pos = pg.Vector2(pos)  # noqa
+        self.owed = 0.0  # Fractions of a particle carried over to the next frame.
+
+    def burst(self, count: int, pos: Optional[Sequence[float]] = None):
+        """Emit a number of particles at once, at the emitter position or the given one."""
+        pos = self.pos if pos is None else pg.Vector2(pos)  # noqa
+        self.group.add([self.make_particle(pos) for _ in range(count)])
+
+    def update(self, dt: float, pos: Sequence[float], active: bool = True) -> int:
+        """Move the emitter to ``pos`` and emit the particles due over ``dt`` seconds. Return how many were emitted."""
+        start, self.pos = self.pos, pg.Vector2(pos)  # noqa
+        if not active:
+            self.owed = 0.0
+            return 0
+        self.owed += self.rate * self.rate_scale * dt
+        count = int(self.owed)
+        self.owed -= count
+        count = min(count, self.max_per_update)
+        if not count:
+            return 0
+        if start.distance_squared_to(self.pos) > self.max_gap ** 2:
+            start = self.pos
+        interval = dt / count
+        particles = []
+        for i in range(count):
+            # Particle ``i`` was due partway through the frame, so place it along the path at that moment
+            # and move it forward by the time it has existed since.
+            fraction = (i + 1) / count
+            particle = self.make_particle(start.lerp(self.pos, fraction))
+            if particle.update((count - 1 - i) * interval):
+                particles.append(particle)
+        self.group.add(particles)
+        return len(particles)
+
+
+class RenderQueue:
+    """Collects the blits for a frame and draws them with as few ``fblits`` calls as possible.
+
+    Sprites submit their image, position, layer, and blend mode. When the queue is flushed,
+    everything is sorted by layer and then blend mode, and each run that shares both is one ``fblits`` call.
+    Lower layers are drawn first. Order is kept for submissions that share a layer and blend mode.
+
+    With a ``scale`` other than 1, every image and position is scaled when flushed, for drawing onto
+    a smaller (or bigger) surface than the screen. Scaled images are kept as long as the original image is.
+    An image that is rotated fresh every frame would never be found among the scaled images, so its sprite
+    passes the unrotated image and the angle as ``source``, and the queue rotates a scaled copy of that instead.
+    """
+    def __init__(self, scale: float = 1.0):
+        self.queue: list[tuple[int, int, pg.Surface, Sequence[float], Optional[tuple[pg.Surface, float]]]] = []
+        self.draw_calls = 0  # The number of ``fblits`` calls made by the last flush.
+        self.blit_count = 0  # The number of images drawn by the last flush.
+        self.scale = scale
+        self.scaled_images: weakref.WeakKeyDictionary[pg.Surface, pg.Surface] = weakref.WeakKeyDictionary()
+
+    def set_scale(self, scale: float):
+        """Change the scale images and positions are drawn at."""
+        if scale != self.scale:
+            self.scale = scale
+            self.scaled_images = weakref.WeakKeyDictionary()
+
+    def scaled_image(self, image: pg.Surface) -> pg.Surface:
+        """Return the image at the queue's scale."""
+        try:
+            return self.scaled_images[image]
+        except KeyError:
+            scaled = self.scaled_images[image] = pg.transform.scale_by(image, self.scale)
+            return scaled
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def submit(self, image: pg.Surface, pos: Sequence[float], layer: int = 0, blend: int = pg.BLENDMODE_NONE,
+               source: Optional[tuple[pg.Surface, float]] = None):
+        """Queue an image to be drawn at the given position.
+
+        ``source`` is the ``(image, angle)`` a freshly rotated image was made from, if it was.
+        """
+        self.queue.append((layer, blend, image, pos, source))
+
+    def submit_many(self, blits: Iterable[tuple[pg.Surface, Sequence[float]]], layer: int = 0,
+                    blend: int = pg.BLENDMODE_NONE):
+        """Queue a sequence of ``(image, pos)`` pairs that share a layer and blend mode."""
+        self.queue.extend((layer, blend, image, pos, None) for image, pos in blits)
+
+    def take(self) -> tuple[tuple[int, int, pg.Surface, Sequence[float], Optional[tuple[pg.Surface, float]]], ...]:
+        """Empty the queue and return its contents, sorted and ready for ``draw``.
+
+        The result doesn't change when more is submitted, so it can be drawn on another thread.
+        """
+        # ``list.sort`` is stable, so submission order is kept within each layer and blend mode.
+        self.queue.sort(key=itemgetter(0, 1))
+        queued = tuple(self.queue)
+        self.queue.clear()
+        return queued
+
+    def scaled_blit(self, image: pg.Surface, pos: Sequence[float],
+                    source: Optional[tuple[pg.Surface, float]]) -> tuple[pg.Surface, tuple[float, float]]:
+        """Return the image and position to draw at the queue's scale."""
+        scale = self.scale
+        if source is None:
+            return self.scaled_image(image), (pos[0] * scale, pos[1] * scale)
+        # Rotate the scaled source, and center it where the full size image would have been centered.
+        rotated = pg.transform.rotate(self.scaled_image(source[0]), source[1])
+        return rotated, ((pos[0] + image.get_width() / 2) * scale - rotated.get_width() / 2,
+                         (pos[1] + image.get_height() / 2) * scale - rotated.get_height() / 2)
+
+    def draw(self, screen: pg.Surface,
+             queued: Sequence[tuple[int, int, pg.Surface, Sequence[float], Optional[tuple[pg.Surface, float]]]]):
+        """Draw the sorted contents of a queue returned by ``take``."""
+        self.draw_calls = 0
+        self.blit_count = len(queued)
+        for (_, blend), run in itertools.groupby(queued, key=itemgetter(0, 1)):
+            if self.scale == 1:
+                screen.fblits([(image, pos) for _, _, image, pos, _ in run], blend)  # noqa
+            else:
+                screen.fblits([self.scaled_blit(image, pos, source)  # noqa
+                               for _, _, image, pos, source in run], blend)
+            self.draw_calls += 1
+
+    def flush(self, screen: pg.Surface):
+        """Draw everything in the queue to the screen and empty the queue."""
+        self.draw(screen, self.take())
@@ -0,0 +1,11 @@
+# -*- coding:utf-8 -*-
+# This file sets up the tests. They import the game modules from src, and run without a window or sound.
+
+# Standard library imports.
+from pathlib import Path  # This module allows object-oriented filesystem interaction.
+import os  # Used to pick the dummy video and audio drivers.
+import sys  # Used to make the game modules importable.
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, str(Path(__file__, "../../src").resolve()))
@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+# Tests for the batched astronauts, checked against the player they copy.
+
+# Third-party library imports.
+import numpy as np
+import pygame as pg
+import pytest
+
+# Local library imports.
+import agents
+import entities
+import sprites
+import utils
+
+GAME_BOUNDS = (1200, 900)
+DT = 1 / 30
+
+
+def make_level(store: entities.EntityStore):
+    obstacles = [sprites.Obstacle(pos, utils.make_circle_image(radius, (128, 128, 128)), store)
+                 for pos, radius in (((500, 400), 80), ((800, 300), 50), ((300, 700), 70))]
+    # The exit is tucked in a corner, out of the way.
+    exit_portal = sprites.Item((1190, 890), pg.Surface((10, 10)), sprites.ItemType.EXIT, store)
+    return obstacles, [exit_portal]
+
+
+def make_player(pos) -> sprites.Player:
+    # A see-through image has an empty mask, so the player's mask tests never do anything.
+    return sprites.Player(pos, pg.Surface((10, 10), pg.SRCALPHA))
+
+
+@pytest.mark.parametrize("dynamic", [False, True])
+def test_astronauts_move_like_the_player(dynamic):
+    obstacles, items = make_level(entities.EntityStore())
+    starts = [(350, 400), (500, 230), (1100, 820), (650, 650)]
+    batch = agents.BatchedPlayers(len(starts), (0, 0), GAME_BOUNDS, obstacles, items)
+    batch.pos[:] = starts
+    players = [make_player(start) for start in starts]
+    rng = np.random.default_rng(4)
+    hits = 0
+    for _ in range(600):
+        rotate = rng.uniform(-1, 1, len(players))
+        push = rng.random(len(players)) < 0.6
+        # A fixed pull toward the middle of the level stands in for the real gravity.
+        gravity = (np.array(GAME_BOUNDS) / 2 - batch.pos) * 0.2 if dynamic else None
+        _, rewards, done = batch.step(rotate, push, DT, gravity)
+        for row, player in enumerate(players):
+            player.rotate(rotate[row] * sprites.PLAYER_ROTATE_SPEED * DT, obstacles)
+            player.pushing = bool(push[row] and batch.tank[row] > 0 or batch.pushing[row])
+            player_gravity = None if gravity is None else pg.Vector2(tuple(gravity[row]))
+            hits += player.update(DT, pg.Vector2(GAME_BOUNDS), obstacles, player_gravity)
+            assert tuple(player.pos) == pytest.approx(tuple(batch.pos[row]), abs=1e-6)
+            assert tuple(player.vel) == pytest.approx(tuple(batch.vel[row]), abs=1e-6)
+        assert not done.any()
+    assert hits  # The test only means something if there were some bounces.
+
+
+def test_fast_astronauts_do_not_tunnel():
+    obstacles, items = make_level(entities.EntityStore())
+    batch = agents.BatchedPlayers(2, (200, 400), GAME_BOUNDS, obstacles, items)
+    batch.vel[:] = ((9000, 0), (-9000, 0))
+    _, rewards, _ = batch.step(np.zeros(2), np.zeros(2, dtype=bool), DT)
+    # The first one would jump clean over the asteroid at (500, 400) if only its end position were tested.
+    assert batch.pos[0, 0] < 500 - 80 - sprites.PLAYER_CIRCLE_RADIUS + 1e-6
+    assert rewards[0] < 0 and batch.vel[0, 0] < 0
+    # The second one bounces off the left edge and stays in the level.
+    assert batch.pos[1, 0] >= sprites.PLAYER_CIRCLE_RADIUS and batch.vel[1, 0] > 0
+
+
+def test_pull_into_an_edge_does_not_flip_the_velocity():
+    start = sprites.PLAYER_CIRCLE_RADIUS + 1
+    # An asteroid just past the left edge, close enough for its simple pull to work.
+    obstacles = [sprites.Obstacle((start - 200, 450), utils.make_circle_image(20, (128, 128, 128)),
+                                  entities.EntityStore())]
+    batch = agents.BatchedPlayers(1, (start, 450), GAME_BOUNDS, obstacles, [])
+    # Moving away from the edge, but slower than the pull carries the astronaut into it.
+    batch.vel[:] = (10, 0)
+    batch.step(np.zeros(1), np.zeros(1, dtype=bool), DT)
+    assert tuple(batch.vel[0]) == (10, 0)
+    # It reaches the edge 1 pixel away partway through the step, then spends the rest moving away from it.
+    impact_time = 1 / ((agents.PLAYER_GRAVITY_ACC - 10) * DT)
+    assert batch.pos[0, 0] == pytest.approx(sprites.PLAYER_CIRCLE_RADIUS + 10 * DT * (1 - impact_time))
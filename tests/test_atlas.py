@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+# Tests for the texture atlas shelf packer and its disk cache.
+
+# Standard library imports.
+import itertools  # Used to compare every pair of packed areas.
+import random  # Random number generation.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import atlas
+
+
+@pytest.fixture(autouse=True)
+def display():
+    # Packing converts the pages, which needs a display.
+    pg.display.set_mode((1, 1), pg.HIDDEN)
+    yield
+    pg.display.quit()
+
+
+def make_images(count: int, seed: int = 0) -> dict[str, pg.Surface]:
+    rng = random.Random(seed)
+    images = {}
+    for number in range(count):
+        image = pg.Surface((rng.randint(4, 120), rng.randint(4, 120)), pg.SRCALPHA)
+        image.fill((rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+        images[f"image_{number}.png"] = image
+    return images
+
+
+def test_packed_images_fit_on_their_pages_without_overlapping():
+    images = make_images(200)
+    packed = atlas.pack(images, page_size=256)
+    assert len(packed) == len(images)
+    assert len(packed.pages) > 1
+    for name, (page, area) in packed.regions.items():
+        assert area.size == images[name].get_size()
+        assert packed.pages[page].get_rect().contains(area)
+    for (_, (page, area)), (_, (other_page, other_area)) in itertools.combinations(packed.regions.items(), 2):
+        if page == other_page:
+            # The padding keeps even neighbors from touching.
+            assert not area.inflate(2 * atlas.ATLAS_PADDING, 2 * atlas.ATLAS_PADDING).colliderect(other_area)
+
+
+def test_packed_images_keep_their_pixels():
+    images = make_images(20)
+    packed = atlas.pack(images, page_size=256)
+    for name, image in images.items():
+        packed_image = packed.image(name)
+        assert packed_image.get_parent() is not None  # A subsurface, sharing its page's pixels.
+        assert packed_image.get_at((0, 0)) == image.get_at((0, 0))
+        assert packed_image.get_at((image.get_width() - 1, image.get_height() - 1)) == image.get_at(
+            (image.get_width() - 1, image.get_height() - 1))
+
+
+def test_an_image_bigger_than_a_page_gets_its_own_page():
+    images = {"small.png": pg.Surface((10, 10), pg.SRCALPHA), "big.png": pg.Surface((300, 50), pg.SRCALPHA)}
+    packed = atlas.pack(images, page_size=256)
+    big_page, big_area = packed.regions["big.png"]
+    assert packed.pages[big_page].get_size() == (300, 50)
+    assert packed.regions["small.png"][0] != big_page
+
+
+def test_the_cache_round_trips(tmp_path):
+    packed = atlas.pack(make_images(30), page_size=256)
+    packed.save(tmp_path, "key")
+    loaded = atlas.Atlas.load(tmp_path, "key")
+    assert loaded.regions == packed.regions
+    assert atlas.Atlas.load(tmp_path, "other key") is None
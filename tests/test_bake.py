@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+# Tests for the baked sprite cache and how sprites pick between baked and runtime rotation.
+
+# Standard library imports.
+import ctypes  # Used to find where the mapped file is in memory.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import bake
+import sprites
+
+
+@pytest.fixture(autouse=True)
+def display():
+    # Converting images needs a display.
+    pg.display.set_mode((1, 1), pg.HIDDEN)
+    yield
+    pg.display.quit()
+    sprites.BAKED_SPRITES.clear()
+    sprites.BAKED_CIRCLES.clear()
+
+
+@pytest.fixture
+def image_directory(tmp_path):
+    image = pg.Surface((30, 12), pg.SRCALPHA)
+    image.fill((200, 40, 40, 255))
+    pg.image.save(image, tmp_path / "bar.png")
+    return tmp_path
+
+
+def bake_bar(image_directory, steps: int = 72, pixel_format: str = bake.BAKE_PIXEL_FORMAT) -> bake.SpriteBake:
+    rotations = {"bar.png": steps}
+    key = bake.bake_key(image_directory, rotations, ["bar.png"], [5], pixel_format)
+    bake.bake(image_directory, rotations, ["bar.png"], [5], image_directory / bake.BAKE_FILE_NAME, key, pixel_format)
+    return bake.SpriteBake.load(image_directory / bake.BAKE_FILE_NAME, key)
+
+
+def test_baked_frames_round_trip(image_directory):
+    baked = bake_bar(image_directory)
+    bar = baked["bar.png"]
+    assert bar.steps == 72
+    source = pg.image.load(image_directory / "bar.png").convert_alpha()
+    for angle in (0, 45, 90, 355):
+        expected = pg.transform.rotate(source, angle)
+        frame = bar.frame(angle)
+        assert frame.get_size() == expected.get_size()
+        assert frame.get_at(frame.get_rect().center) == expected.get_at(expected.get_rect().center)
+    assert bar.mask(90).count() == pg.mask.from_surface(pg.transform.rotate(source, 90)).count()
+    assert 5 in baked.circles
+
+
+def test_a_bake_from_other_images_is_not_loaded(image_directory):
+    bake_bar(image_directory)
+    assert bake.SpriteBake.load(image_directory / bake.BAKE_FILE_NAME, "another key") is None
+
+
+def test_frames_are_converted_when_the_display_wants_another_format(image_directory, monkeypatch):
+    assert not bake.needs_conversion()  # The frames are baked in the format this display uses.
+    monkeypatch.setattr(bake, "needs_conversion", lambda *_: True)
+    frame = bake_bar(image_directory)["bar.png"].frame(0)
+    assert frame.get_at((15, 6)) == (200, 40, 40, 255)
+
+
+@pytest.mark.parametrize("pixel_format", bake.PIXEL_FORMATS)
+def test_frames_load_in_any_baked_format(image_directory, pixel_format):
+    frame = bake_bar(image_directory, pixel_format=pixel_format)["bar.png"].frame(0)
+    assert frame.get_at((15, 6)) == (200, 40, 40, 255)
+
+
+def test_the_game_bakes_in_the_display_format(image_directory):
+    pixel_format = bake.display_pixel_format()
+    assert pixel_format in bake.PIXEL_FORMATS and not bake.needs_conversion(pixel_format)
+    baked = bake.load_or_bake(image_directory, {"bar.png": 8}, cache_directory=image_directory / "cache")
+    # An unconverted frame draws from the mapped file, instead of from a copy of its own.
+    mapping_start = ctypes.addressof(ctypes.c_char.from_buffer(baked.mapping))
+    assert 0 <= baked["bar.png"].frame(0)._pixels_address - mapping_start < len(baked.mapping)
+
+
+def test_smooth_rotation_does_not_use_baked_frames(image_directory):
+    baked = bake_bar(image_directory)
+    image = pg.image.load(image_directory / "bar.png").convert_alpha()
+    sprites.use_baked_sprites(baked, {"bar.png": image})
+    # A step of 0 asks for the exact angle, which the 5 degree frames can't give.
+    assert sprites.rotated_image(image, 33, 0).get_size() == pg.transform.rotate(image, 33).get_size()
+    assert sprites.rotation_source(image, 33, 0) == (image, 33)
+    # Steps at least as coarse as the frames use them.
+    assert sprites.rotated_image(image, 33, 5) is baked["bar.png"].frame(35)
+    assert sprites.rotated_image(image, 33, 10) is baked["bar.png"].frame(30)
+    assert sprites.rotation_source(image, 33, 5) is None
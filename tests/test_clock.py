@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+# Tests for the game clock and the timer wheel it schedules calls on.
+
+# Local library imports.
+import utils
+
+
+def test_calls_run_in_the_order_they_are_due():
+    wheel = utils.TimerWheel(resolution=0.01, slot_count=8)
+    fired = []
+    for due in (0.5, 0.013, 0.2, 0.017, 0.011):
+        wheel.schedule(due, lambda due=due: fired.append(due))
+    wheel.advance(1.0)
+    assert fired == [0.011, 0.013, 0.017, 0.2, 0.5]
+    assert len(wheel) == 0
+
+
+def test_a_call_runs_on_the_first_advance_that_reaches_it():
+    wheel = utils.TimerWheel(resolution=0.01)
+    fired = []
+    wheel.schedule(0.005, lambda: fired.append("early"))
+    wheel.schedule(0.008, lambda: fired.append("late"))
+    wheel.advance(0.004)
+    assert fired == []
+    wheel.advance(0.005)
+    assert fired == ["early"]
+    # The tick 0.005 is in isn't over, so the later call in it still runs without waiting a turn.
+    wheel.advance(0.008)
+    assert fired == ["early", "late"]
+
+
+def test_calls_more_than_a_turn_away_wait_for_their_turn():
+    wheel = utils.TimerWheel(resolution=0.01, slot_count=4)
+    fired = []
+    wheel.schedule(0.105, lambda: fired.append(0.105))
+    for step in range(1, 10):
+        wheel.advance(step * 0.01)
+    assert fired == []
+    wheel.advance(0.11)
+    assert fired == [0.105]
+
+
+def test_repeating_calls_catch_up_after_a_long_frame():
+    wheel = utils.TimerWheel(resolution=0.01)
+    fired = []
+    call = wheel.schedule(0.1, lambda: fired.append(len(fired)), interval=0.1)
+    wheel.advance(0.35)
+    assert fired == [0, 1, 2]
+    assert abs(call.due - 0.4) < 1e-9
+    call.cancel()
+    wheel.advance(1.0)
+    assert fired == [0, 1, 2]
+    assert len(wheel) == 0
+
+
+def test_a_callback_can_cancel_a_later_call():
+    wheel = utils.TimerWheel()
+    fired = []
+    later = wheel.schedule(0.2, lambda: fired.append("later"))
+    wheel.schedule(0.1, lambda: (fired.append("first"), later.cancel()))
+    wheel.advance(0.3)
+    assert fired == ["first"]
+
+
+def test_reset_clears_the_pause_flags():
+    clock = utils.GameClock()
+    clock.paused = True
+    clock.suspended = True
+    clock.advance(1.0)
+    assert clock.time == 0.0
+    clock.reset()
+    assert clock.advance(0.5) == 0.5
+
+
+def test_calls_scheduled_after_a_restore_are_not_late():
+    clock = utils.GameClock(resolution=0.01)
+    clock.advance(2.0)
+    clock.restore(1.234)
+    fired = []
+    clock.schedule(0.005, lambda: fired.append(clock.time))
+    clock.advance(0.004)
+    assert fired == []
+    clock.advance(0.001)
+    assert len(fired) == 1 and abs(fired[0] - 1.239) < 1e-9
@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+# Tests for the entity store and the handles that point into it.
+
+# Third-party library imports.
+import pytest
+
+# Local library imports.
+import entities
+import utils
+
+
+def test_removed_indices_are_reused():
+    store = entities.EntityStore()
+    first = store.add((1, 2), entities.OBSTACLE_KIND)
+    second = store.add((3, 4), entities.OBSTACLE_KIND)
+    store.remove(first)
+    assert len(store) == 1
+    assert not store.alive[first]
+    assert store.add((5, 6), entities.OBSTACLE_KIND, radius=7) == first
+    assert (store.x[first], store.y[first], store.radius[first], store.alive[first]) == (5, 6, 7, 1)
+    assert store.x[second] == 3
+
+
+def test_removing_twice_frees_the_index_once():
+    store = entities.EntityStore()
+    index = store.add((0, 0), entities.OBSTACLE_KIND)
+    store.remove(index)
+    store.remove(index)
+    assert store.free == [index]
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_update_rotates_every_entity(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(entities, "np", None)
+    store = entities.EntityStore()
+    store.add((0, 0), entities.OBSTACLE_KIND, angle=350, rot_speed=20)
+    store.add((0, 0), entities.OBSTACLE_KIND, angle=10, rot_speed=-20)
+    store.add((0, 0), entities.OBSTACLE_KIND, angle=90)
+    store.update(1)
+    assert list(store.angle) == pytest.approx([10, 350, 90])
+    # The arrays can still grow after an update.
+    store.add((0, 0), entities.OBSTACLE_KIND)
+    assert len(store) == 4
+
+
+def test_handles_read_and_write_the_store():
+    store = entities.EntityStore()
+    entity = entities.Entity((10, 20), entities.OBSTACLE_KIND, angle=45, store=store)
+    entity.pos += (1, 1)
+    assert entity.pos == (11, 21)
+    assert entity.angle == 45
+    entity.kill()
+    assert len(store) == 0
+    assert len(entities.WORLD) == 0  # The shared store was never touched.
+
+
+def test_cooldowns_run_on_the_store_clock():
+    clock = utils.GameClock()
+    store = entities.EntityStore(clock)
+    entity = entities.Entity((0, 0), entities.OBSTACLE_KIND, store=store)
+    entity.cooldown = 2
+    clock.advance(0.5)
+    assert entity.cooldown == pytest.approx(1.5)
+    clock.paused = True
+    clock.advance(10)
+    assert entity.cooldown == pytest.approx(1.5)
+    clock.paused = False
+    clock.advance(5)
+    assert entity.cooldown == 0
@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+# Tests for the quality governor, which trades visual quality for frame-rate on slow machines.
+
+# Standard library imports.
+import random  # Random number generation.
+
+# Third-party library imports.
+import pytest
+
+# Local library imports.
+import governor
+import pipeline
+
+# Constants.
+TARGET = 1 / 60
+
+
+def run_frames(quality_governor: governor.QualityGovernor, work_time: float, seconds: float = 5):
+    """Feed the governor frames capped at 60 fps, each jittering around the 1/60 s interval like a real clock."""
+    rng = random.Random(1)
+    for _ in range(round(seconds * 60)):
+        quality_governor.update(work_time * rng.uniform(0.8, 1.2), TARGET * rng.uniform(0.9, 1.1))
+
+
+def test_fast_frames_at_the_frame_cap_keep_the_quality():
+    quality_governor = governor.QualityGovernor(TARGET)
+    run_frames(quality_governor, 0.004)
+    assert quality_governor.level == 0 and not quality_governor.decisions
+
+
+def test_slow_frames_lower_the_quality_and_fast_ones_raise_it():
+    quality_governor = governor.QualityGovernor(TARGET)
+    run_frames(quality_governor, 0.025, seconds=1.5)
+    assert quality_governor.level == 1
+    run_frames(quality_governor, 0.004, seconds=1.5)
+    assert quality_governor.level == 0
+
+
+@pytest.mark.parametrize("pipelined, expected", [(False, 0.008), (True, 0.005)])
+def test_the_work_time_of_a_pipelined_frame_is_the_slower_stage(pipelined, expected):
+    frame_pipeline = pipeline.FramePipeline(lambda: None, lambda _: None, pipelined)
+    frame_pipeline.simulate_time, frame_pipeline.render_time = 0.003, 0.005
+    assert frame_pipeline.work_time == pytest.approx(expected)
+    frame_pipeline.close()
@@ -0,0 +1,73 @@
+# -*- coding:utf-8 -*-
+# Tests for the Barnes-Hut quadtree, checked against adding up the pull of every body directly.
+
+# Standard library imports.
+import math  # C-style math functions.
+import random  # Random number generation.
+
+# Third-party library imports.
+import pytest
+
+# Local library imports.
+import gravity
+
+# Constants.
+GRAVITY = gravity.GRAVITY_CONSTANT
+SOFTENING = gravity.GRAVITY_SOFTENING
+
+
+def brute_force(xs, ys, masses, x, y, skip=-1):
+    """The pull on a point from every body, one at a time."""
+    ax = ay = 0.0
+    for body, (bx, by, mass) in enumerate(zip(xs, ys, masses)):
+        if body == skip:
+            continue
+        dx, dy = bx - x, by - y
+        distance_squared = dx * dx + dy * dy + SOFTENING * SOFTENING
+        pull = GRAVITY * mass / distance_squared ** 1.5
+        ax += dx * pull
+        ay += dy * pull
+    return ax, ay
+
+
+def random_bodies(count, seed):
+    rng = random.Random(seed)
+    xs = [rng.uniform(0, 3000) for _ in range(count)]
+    ys = [rng.uniform(0, 3000) for _ in range(count)]
+    masses = [rng.uniform(15, 60) ** 2 for _ in range(count)]
+    return xs, ys, masses
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_theta_zero_is_exact(seed):
+    xs, ys, masses = random_bodies(200, seed)
+    tree = gravity.QuadTree(xs, ys, masses)
+    for body in range(0, 200, 7):
+        expected = brute_force(xs, ys, masses, xs[body], ys[body], body)
+        actual = tree.acceleration(xs[body], ys[body], 0, GRAVITY, SOFTENING, body)
+        assert actual == pytest.approx(expected, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_default_theta_is_close(seed):
+    xs, ys, masses = random_bodies(500, seed)
+    tree = gravity.QuadTree(xs, ys, masses)
+    errors, sizes = [], []
+    for body in range(500):
+        ex, ey = brute_force(xs, ys, masses, xs[body], ys[body], body)
+        ax, ay = tree.acceleration(xs[body], ys[body], gravity.BARNES_HUT_THETA, GRAVITY, SOFTENING, body)
+        errors.append(math.hypot(ax - ex, ay - ey))
+        sizes.append(math.hypot(ex, ey))
+    # Measured against a typical pull, since a body whose pulls nearly cancel out has no useful relative error.
+    typical = sum(sizes) / len(sizes)
+    assert sum(errors) / len(errors) < 0.01 * typical
+    # A few bodies next to a big lopsided node come out worse. That's the price Barnes-Hut pays for its speed.
+    assert max(errors) < 0.25 * typical
+
+
+def test_stacked_bodies_share_a_leaf():
+    xs, ys, masses = [5.0] * 50, [5.0] * 50, [1.0] * 50
+    tree = gravity.QuadTree(xs, ys, masses)
+    assert tree.root.mass == 50
+    ax, ay = tree.acceleration(105, 5, 0, GRAVITY, SOFTENING)
+    assert (ax, ay) == pytest.approx(brute_force(xs, ys, masses, 105, 5))
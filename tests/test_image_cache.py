@@ -0,0 +1,55 @@
+# -*- coding:utf-8 -*-
+# Tests for the image caches and the registry that holds them to one memory budget.
+
+# Third-party library imports.
+import pygame as pg
+
+# Local library imports.
+import utils
+
+IMAGE_BYTES = 10 * 10 * 4  # Every test image is 10 by 10 pixels with 4 bytes each.
+
+
+def make_image(_) -> pg.Surface:
+    return pg.Surface((10, 10), pg.SRCALPHA)
+
+
+def test_hits_misses_and_least_recently_used_eviction():
+    cache = utils.ImageCache(make_image, max_bytes=2 * IMAGE_BYTES, registry=None)
+    first = cache.get_image("a")
+    cache.get_image("b")
+    assert cache.get_image("a") is first  # "a" is now the most recently used.
+    cache.get_image("c")  # Over the limit, so "b" goes.
+    assert set(cache.cache) == {"a", "c"}
+    assert cache.stats() == {"images": 2, "bytes": 2 * IMAGE_BYTES, "hits": 1, "misses": 3, "evictions": 1}
+
+
+def test_the_image_just_made_is_never_evicted():
+    cache = utils.ImageCache(make_image, max_bytes=IMAGE_BYTES // 2, registry=None)
+    assert cache.get_image("a") is cache.cache["a"]
+    assert len(cache) == 1
+
+
+def test_the_budget_is_shared_and_the_biggest_cache_gives_up_images():
+    registry = utils.CacheRegistry(budget=4 * IMAGE_BYTES)
+    big = utils.ImageCache(make_image, "big", registry=registry)
+    small = utils.ImageCache(make_image, "small", registry=registry)
+    big.warm(range(3))
+    small.warm(range(1))
+    assert registry.total_bytes == 4 * IMAGE_BYTES
+    small.get_image(1)
+    assert registry.total_bytes <= registry.budget
+    assert big.evictions == 1 and small.evictions == 0
+    # A cache can't evict the image it was just asked for, even when it is the biggest.
+    small.warm(range(2, 6))
+    assert registry.total_bytes <= registry.budget
+    assert 5 in small.cache
+
+
+def test_caches_with_the_same_name_each_show_up_in_the_report():
+    registry = utils.CacheRegistry()
+    caches = [utils.ImageCache(make_image, registry=registry) for _ in range(3)]
+    report = registry.report()
+    assert len(report) == 3
+    assert set(report) == {"image cache", "image cache 2", "image cache 3"}
+    assert caches[0].name == "image cache"
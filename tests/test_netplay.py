@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+# Tests for the multiplayer snapshots: the numbers the server sends, and the sessions they come from.
+
+# Standard library imports.
+import asyncio  # Runs a server and a client for the connection tests.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import atlas
+import netplay
+import resources
+import sprites
+
+# Constants.
+LAYOUT = netplay.SnapshotLayout((7, 9), item_count=3, obstacle_count=2)
+
+
+@pytest.fixture(scope="module")
+def texture_atlas(tmp_path_factory):
+    # Converting images needs a display.
+    pg.display.set_mode((1, 1), pg.HIDDEN)
+    yield atlas.build_atlas(resources.IMAGE_DIRECTORY, resources.ATLAS_IMAGE_FILENAMES,
+                            cache_directory=tmp_path_factory.mktemp("cache"))
+    pg.display.quit()
+
+
+def make_values(**changes) -> list[int]:
+    # Two players, one byte of item bits, and two asteroid angles.
+    values = [800, 1600, -12, 40, 100, 200, netplay.PUSHING_FLAG,
+              4000, 2400, 0, 0, 0, 200, 0,
+              0b101,
+              10, 250]
+    for index, value in changes.items():
+        values[int(index[1:])] = value
+    return values
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 64, -65, 300, -70000, 2 ** 40])
+def test_varints_round_trip(value):
+    buffer = bytearray(b"x")
+    netplay.write_varint(buffer, value)
+    assert netplay.read_varint(bytes(buffer), 1) == (value, len(buffer))
+    if -64 <= value < 64:
+        assert len(buffer) == 2
+
+
+def test_deltas_decode_to_the_server_values():
+    _, moduli = netplay.layout_codec(LAYOUT)
+    decoder = netplay.SnapshotDecoder()
+    baseline = make_values()
+    decoder.decode(netplay.encode_keyframe(1, LAYOUT, baseline))
+    assert decoder.values == baseline
+    # The player angle and the second asteroid angle wrap past zero, the item in the middle is picked up.
+    for tick, values in enumerate((make_values(i0=803, i4=65535, i16=255),
+                                   make_values(i0=806, i4=1, i14=0b001, i16=2)), 2):
+        snapshot = decoder.decode(netplay.encode_delta(tick, moduli, baseline, values))
+        assert decoder.values == values
+        baseline = values
+    assert snapshot.tick == 3
+    assert snapshot.players[7].x == 806 / netplay.POSITION_SCALE
+    assert snapshot.players[7].angle == pytest.approx(360 / netplay.ANGLE_STEPS)
+    assert snapshot.items == (True, False, False)
+    assert snapshot.obstacle_angles[1] == pytest.approx(2 * 360 / netplay.OBSTACLE_ANGLE_STEPS)
+
+
+def test_wrapping_takes_the_short_way_around():
+    _, moduli = netplay.layout_codec(LAYOUT)
+    delta = netplay.encode_delta(2, moduli, make_values(i4=65535), make_values(i4=1))
+    # The header, the changed bits, and a difference of 2 in one byte, not -65534 in three.
+    assert len(delta) == netplay.TICK_HEADER.size + 3 + 1
+
+
+def test_an_unchanged_delta_is_only_the_header():
+    _, moduli = netplay.layout_codec(LAYOUT)
+    values = make_values()
+    assert len(netplay.encode_delta(2, moduli, values, values)) == netplay.TICK_HEADER.size + (len(moduli) + 7) // 8
+
+
+def test_a_delta_before_a_keyframe_is_ignored():
+    _, moduli = netplay.layout_codec(LAYOUT)
+    delta = netplay.encode_delta(2, moduli, make_values(), make_values(i0=801))
+    assert netplay.SnapshotDecoder().decode(delta) is None
+
+
+def test_a_session_decodes_to_what_it_sent(texture_atlas):
+    session = netplay.Session(1, texture_atlas)
+    remote = session.add_player(3, None)  # noqa
+    remote.push, remote.rotate = True, 0.5
+    decoder = netplay.SnapshotDecoder()
+    layout = session.layout()
+    sent = session.values(layout)
+    decoder.decode(netplay.encode_keyframe(0, layout, sent))
+    for tick in range(1, 40):
+        session.step(1 / netplay.TICK_RATE)
+        values = session.values(layout)
+        decoder.decode(netplay.encode_delta(tick, netplay.layout_codec(layout)[1], sent, values))
+        assert tuple(decoder.values) == values
+        sent = values
+    assert decoder.snapshot(39).players[3].tank_level < sprites.TANK_MAX
+
+
+def test_sessions_do_not_share_their_level(texture_atlas):
+    first, second = netplay.Session(1, texture_atlas), netplay.Session(1, texture_atlas)
+    assert first.store is not second.store and first.clock is not second.clock
+    first.items[0].kill()
+    assert not first.item_present(first.items[0]) and second.item_present(second.items[0])
+    second_angles = [obstacle.angle for obstacle in second.obstacles]
+    first.step(0.5)
+    assert (first.clock.time, second.clock.time) == (0.5, 0)
+    assert [obstacle.angle for obstacle in second.obstacles] == second_angles
+
+
+def test_an_empty_message_does_not_drop_the_player(texture_atlas):
+    async def play():
+        server = netplay.GameServer()
+        server.texture_atlas = texture_atlas
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        client = netplay.NetClient()
+        await client.connect("127.0.0.1", listener.sockets[0].getsockname()[1], 1)
+        client.writer.write(netplay.frame(b""))
+        client.send_input(1, True)
+        await client.writer.drain()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            remote = server.sessions[0].players.get(client.player_id) if server.sessions else None
+            if remote is not None and remote.push:
+                break
+        await client.close()
+        listener.close()
+        await listener.wait_closed()
+        return remote
+
+    remote = asyncio.run(play())
+    # The input after the empty message still arrived, so the connection was still being served.
+    assert remote is not None and remote.push and remote.rotate == 1
+    assert netplay.SnapshotDecoder().decode(b"") is None
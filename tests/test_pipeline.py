@@ -0,0 +1,47 @@
+# -*- coding:utf-8 -*-
+# Tests for the frame pipeline, which can simulate the next frame on a worker thread while this one is drawn.
+
+# Standard library imports.
+import threading  # Used to check which thread things ran on.
+
+# Third-party library imports.
+import pytest
+
+# Local library imports.
+import pipeline
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_frames_are_drawn_in_order(pipelined):
+    drawn = []
+    frame_pipeline = pipeline.FramePipeline(lambda number: number, drawn.append, pipelined)
+    for number in range(5):
+        frame_pipeline.run(number)
+    frame_pipeline.close()
+    # Pipelined, each frame is drawn while the next one is simulated, so the last one isn't drawn yet.
+    assert drawn == ([0, 1, 2, 3] if pipelined else [0, 1, 2, 3, 4])
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_main_thread_calls_run_on_the_main_thread(pipelined):
+    threads = []
+
+    def simulate():
+        frame_pipeline.call_on_main_thread(lambda: threads.append(threading.current_thread()))
+        return None
+
+    frame_pipeline = pipeline.FramePipeline(simulate, lambda snapshot: None, pipelined)
+    frame_pipeline.run()
+    # The call is made by the end of the frame that asked for it, even when there is nothing to draw.
+    assert threads == [threading.main_thread()]
+    frame_pipeline.close()
+
+
+def test_simulation_errors_reach_the_main_thread():
+    def simulate():
+        raise SystemExit
+
+    frame_pipeline = pipeline.FramePipeline(simulate, lambda snapshot: None, True)
+    with pytest.raises(SystemExit):
+        frame_pipeline.run()
+    frame_pipeline.close()
@@ -0,0 +1,53 @@
+# -*- coding:utf-8 -*-
+# Tests for the render queue, which batches the frame's blits and can draw them at a different scale.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import utils
+
+
+def test_draws_in_layer_order():
+    queue = utils.RenderQueue()
+    screen = pg.Surface((4, 1))
+    red, blue = pg.Surface((2, 1)), pg.Surface((2, 1))
+    red.fill("red")
+    blue.fill("blue")
+    queue.submit(blue, (1, 0), layer=2)
+    queue.submit(red, (0, 0), layer=1)
+    queue.flush(screen)
+    assert screen.get_at((0, 0)) == pg.Color("red")
+    assert screen.get_at((1, 0)) == pg.Color("blue")  # Blue is on the higher layer, so it covers red.
+    assert queue.draw_calls == 2 and queue.blit_count == 2
+
+
+def test_freshly_rotated_images_rotate_the_scaled_source():
+    queue = utils.RenderQueue(0.5)
+    screen = pg.Surface((200, 200), pg.SRCALPHA)
+    base = pg.Surface((40, 20), pg.SRCALPHA)
+    base.fill("white")
+    for angle in (10, 20, 30):
+        image = pg.transform.rotate(base, angle)
+        rect = image.get_rect(center=(200, 200))
+        queue.submit(image, rect.topleft, source=(base, angle))
+        screen.fill((0, 0, 0, 0))
+        queue.flush(screen)
+        # It is centered where the full size image would have been, at half the distance.
+        drawn = screen.get_bounding_rect()
+        assert drawn.center == pytest.approx((100, 100), abs=1)
+        assert drawn.width == pytest.approx(image.get_width() / 2, abs=1)
+    # Only the source was scaled, not one image per angle.
+    assert list(queue.scaled_images.keys()) == [base]
+
+
+def test_reused_images_are_scaled_once():
+    queue = utils.RenderQueue(0.5)
+    screen = pg.Surface((100, 100))
+    image = pg.Surface((20, 20))
+    for _ in range(3):
+        queue.submit(image, (10, 10))
+        queue.flush(screen)
+    assert list(queue.scaled_images.keys()) == [image]
+    assert queue.scaled_images[image].get_size() == (10, 10)
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+# Tests for the game state snapshots and the ring buffer the recent ones are kept in.
+
+# Standard library imports.
+import random  # Random number generation.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import entities
+import snapshots
+import sprites
+import utils
+
+
+@pytest.fixture
+def game():
+    clock = utils.GameClock()
+    store = entities.EntityStore(clock)
+    obstacles = [sprites.Obstacle((100 * number, 50), utils.make_circle_image(20, (128, 128, 128)), store)
+                 for number in range(1, 4)]
+    player = sprites.Player((400, 300), pg.Surface((10, 10), pg.SRCALPHA))
+    # The emitter never emits here, so it doesn't need a real particle group.
+    emitter = utils.ParticleEmitter(None, None, 50, (5, 6))  # noqa
+    game_snapshots = snapshots.GameSnapshots(player, store, [emitter], clock)
+    return game_snapshots, player, store, obstacles, emitter, clock
+
+
+def test_restoring_puts_everything_back(game):
+    game_snapshots, player, store, obstacles, emitter, clock = game
+    clock.advance(1.25)
+    player.vel.update(3, 4)
+    player.angle = 30
+    player.pushing = True
+    obstacles[0].cooldown = 2
+    emitter.owed = 0.75
+    module_state = random.getstate()
+    state = game_snapshots.capture(55.5, 17)
+    assert random.getstate() == module_state  # Only the game's own generator is reseeded.
+    after_capture = [utils.GAME_RANDOM.random() for _ in range(5)]
+
+    clock.advance(3)
+    player.pos.update(1, 2)
+    player.vel.update(0, 0)
+    player.angle = 200
+    player.pushing = False
+    store.x[obstacles[1].index] = -999
+    obstacles[2].kill()
+    emitter.owed = 0.1
+    emitter.pos.update(900, 900)
+
+    assert game_snapshots.restore(state) == (55.5, 17)
+    assert clock.time == 1.25
+    assert (tuple(player.pos), tuple(player.vel), player.angle, player.pushing) == ((400, 300), (3, 4), 30, True)
+    assert store.x[obstacles[1].index] == 200
+    assert store.alive[obstacles[2].index] and obstacles[2].index not in store.free
+    assert obstacles[0].cooldown == pytest.approx(2)
+    assert (emitter.owed, tuple(emitter.pos)) == (0.75, (5, 6))
+    # The random numbers after restoring are the ones that came after the capture.
+    assert [utils.GAME_RANDOM.random() for _ in range(5)] == after_capture
+
+
+def test_restoring_spins_removed_entities_again(game):
+    game_snapshots, player, store, obstacles, emitter, clock = game
+    store.rot_speed[obstacles[0].index] = 30
+    state = game_snapshots.capture(0, 0)
+    obstacles[0].kill()
+    assert store.rot_speed[obstacles[0].index] == 0
+    game_snapshots.restore(state)
+    angle = obstacles[0].angle
+    store.update(0.5)
+    assert obstacles[0].angle == pytest.approx((angle + 15) % 360)
+
+
+def test_snapshots_are_small(game):
+    game_snapshots = game[0]
+    store_bytes = sum(len(column) * column.itemsize for column in game_snapshots.columns)
+    assert game_snapshots.record_size < store_bytes + 128
+    assert len(game_snapshots.capture(0, 0)) == game_snapshots.record_size
+
+
+def test_stepping_back_stops_at_the_oldest_state(game):
+    game_snapshots, player, *_ = game
+    for x in range(3):
+        player.pos.x = x
+        game_snapshots.record(0, 0)
+    assert game_snapshots.restore(game_snapshots.previous()) and player.pos.x == 1
+    assert game_snapshots.restore(game_snapshots.previous()) and player.pos.x == 0
+    assert game_snapshots.previous() is None
+    assert len(game_snapshots.recent) == 1
+
+
+def test_the_ring_drops_the_oldest_record():
+    ring = snapshots.SnapshotRing(2, max_bytes=6)
+    for record in (b"aa", b"bb", b"cc", b"dd"):
+        ring.push(record)
+    assert len(ring) == 3
+    assert [ring.pop() for _ in range(4)] == [b"dd", b"cc", b"bb", None]
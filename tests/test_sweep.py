@@ -0,0 +1,73 @@
+# -*- coding:utf-8 -*-
+# Tests for the swept collision of the player against the asteroids and the game edges.
+
+# Third-party library imports.
+import pygame as pg
+import pytest
+
+# Local library imports.
+import sprites
+import utils
+
+GAME_BOUNDS = pg.Vector2(1000, 1000)
+
+
+def make_player(pos) -> sprites.Player:
+    # A see-through image has an empty mask, so only the collision circle is tested.
+    return sprites.Player(pos, pg.Surface((10, 10), pg.SRCALPHA))
+
+
+def make_obstacle(pos, radius: int) -> sprites.Obstacle:
+    return sprites.Obstacle(pos, utils.make_circle_image(radius, (128, 128, 128)))
+
+
+def test_swept_circle_hit_finds_the_time_of_impact():
+    assert utils.swept_circle_hit(pg.Vector2(0, 0), pg.Vector2(100, 0), pg.Vector2(60, 0), 10) == pytest.approx(0.5)
+
+
+def test_swept_circle_hit_misses():
+    # Passing by, stopping short, and moving away.
+    assert utils.swept_circle_hit(pg.Vector2(0, 0), pg.Vector2(100, 0), pg.Vector2(50, 20), 10) is None
+    assert utils.swept_circle_hit(pg.Vector2(0, 0), pg.Vector2(30, 0), pg.Vector2(60, 0), 10) is None
+    assert utils.swept_circle_hit(pg.Vector2(0, 0), pg.Vector2(-100, 0), pg.Vector2(60, 0), 10) is None
+    assert utils.swept_circle_hit(pg.Vector2(0, 0), pg.Vector2(0, 0), pg.Vector2(60, 0), 10) is None
+
+
+def test_swept_circle_hit_when_already_overlapping():
+    assert utils.swept_circle_hit(pg.Vector2(55, 0), pg.Vector2(10, 0), pg.Vector2(60, 0), 10) == 0
+    assert utils.swept_circle_hit(pg.Vector2(55, 0), pg.Vector2(-10, 0), pg.Vector2(60, 0), 10) is None
+
+
+def test_fast_player_does_not_tunnel_through_an_asteroid():
+    player = make_player((100, 500))
+    player.vel.update(5000, 0)  # 500 pixels in one 0.1 second frame, much more than the asteroid is wide.
+    obstacle = make_obstacle((400, 500), 30)
+    assert player.sweep(player.vel * 0.1, 0.1, GAME_BOUNDS, [obstacle])
+    assert player.pos.x < 400
+    assert player.vel.x < 0
+
+
+def test_wall_bounce_reflects_the_velocity():
+    player = make_player((950, 500))
+    player.vel.update(1000, 0)
+    player.sweep(player.vel * 0.1, 0.1, GAME_BOUNDS, [])
+    assert player.vel.x == -1000
+    assert player.pos.x <= GAME_BOUNDS.x - player.radius
+    assert player.pos.x == pytest.approx(GAME_BOUNDS.x - player.radius - 80)
+
+
+def test_pull_is_kept_after_a_bounce():
+    player = make_player((950, 500))
+    player.vel.update(1000, 0)
+    pull = pg.Vector2(0, 20)
+    player.sweep(player.vel * 0.1 + pull, 0.1, GAME_BOUNDS, [])
+    # The pull along the edge carries on for the whole frame.
+    assert player.pos.y == pytest.approx(520)
+
+
+def test_pull_into_an_edge_does_not_flip_the_velocity():
+    player = make_player((player_radius := sprites.PLAYER_CIRCLE_RADIUS, 500))
+    player.vel.update(10, 0)  # Moving away from the left edge, but the pull is stronger.
+    player.sweep(player.vel * 0.1 + pg.Vector2(-5, 0), 0.1, GAME_BOUNDS, [])
+    assert player.vel.x == 10
+    assert player.pos.x >= player_radius